@@ -1,238 +1,397 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, g, session, Response, stream_with_context, has_request_context
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from flask_bcrypt import Bcrypt
-from flask_mail import Mail, Message
+from flask_mail import Mail
 from apscheduler.schedulers.background import BackgroundScheduler
 import psycopg2
 import psycopg2.extras
-import sqlite3
 import os
-import calendar as cal_module
+import sqlite3
+import io
+import sys
+import threading
+import click
+import functools
+import time
+from collections import OrderedDict
 from datetime import date, timedelta
+from db import create_pool, create_replicas, placeholders, sql, ReplicaUnavailable
+import migrations
+import recurrence
+import transfer
+import reminders
+import passwords
+import metrics
+import cache
+import completions
+import search
+import archive
+import assets
+import rollups
+from recurrence import get_next_date
 
 app = Flask(__name__)
 app.secret_key = "my_super_secret_key_12345"
-bcrypt = Bcrypt(app)
+hash_pool = passwords.HashPool(
+    rounds=int(os.environ.get('BCRYPT_LOG_ROUNDS', 12)),
+    workers=int(os.environ.get('HASH_WORKERS', 2)),
+    max_pending=int(os.environ.get('HASH_QUEUE_MAX', 32)),
+    timeout=float(os.environ.get('HASH_TIMEOUT', 10)),
+)
 
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
+app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
+app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
+app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', '1') == '1'
 app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
 app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
 mail = Mail(app)
 
+instrumentation = metrics.Instrumentation(
+    app,
+    enabled=os.environ.get('METRICS', '1') == '1',
+    server_timing=os.environ.get('SERVER_TIMING', '1') == '1',
+    slow_query_ms=float(os.environ.get('SLOW_QUERY_MS', 100)),
+    n_plus_one=int(os.environ.get('N_PLUS_ONE_THRESHOLD', 10)),
+    token=os.environ.get('METRICS_TOKEN'),
+)
+
+response_cache = cache.ResponseCache(
+    cache.LRUCache(int(os.environ.get('RESPONSE_CACHE_BYTES', 32 * 2**20))),
+    enabled=os.environ.get('RESPONSE_CACHE', '1') == '1',
+    build_id=lambda: static_assets.digest,
+)
+
+static_assets = assets.Assets(app)
+compressor = assets.Compressor(
+    app,
+    enabled=os.environ.get('COMPRESS', '1') == '1',
+    min_size=int(os.environ.get('COMPRESS_MIN_BYTES', 500)),
+)
+
 login_manager = LoginManager(app)
 login_manager.login_view = "login"
 
-def get_db():
-    database_url = os.environ.get("DATABASE_URL")
-    if database_url:
-        conn = psycopg2.connect(database_url)
-        return conn, True
-    else:
-        conn = sqlite3.connect("todo.db")
-        conn.row_factory = sqlite3.Row
-        return conn, False
+_pool = None
+_replicas = None
+_pool_lock = threading.Lock()
 
-def query(cur, is_postgres, sql, params=()):
-    if not is_postgres:
-        sql = sql.replace("%s", "?")
-    cur.execute(sql, params)
+STICKY_SECONDS = float(os.environ.get('DB_STICKY_SECONDS', 10))
 
-def init_db():
-    conn, is_postgres = get_db()
-    cur = conn.cursor()
-    if is_postgres:
-        cur.execute("""CREATE TABLE IF NOT EXISTS users (
-            id SERIAL PRIMARY KEY, username TEXT UNIQUE NOT NULL, password TEXT NOT NULL)""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS folders (
-            id SERIAL PRIMARY KEY, name TEXT NOT NULL, user_id INTEGER NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users (id))""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS tasks (
-            id SERIAL PRIMARY KEY, task TEXT NOT NULL, user_id INTEGER NOT NULL, done INTEGER DEFAULT 0,
-            FOREIGN KEY (user_id) REFERENCES users (id))""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS task_completions (
-            id SERIAL PRIMARY KEY, task_id INTEGER NOT NULL, completed_date TEXT NOT NULL,
-            UNIQUE(task_id, completed_date))""")
-        conn.commit()  # commit tables before altering
-
-        for col, definition in [
-            ("folder_id",    "INTEGER"),
-            ("due_date",     "TEXT"),
-            ("recurrence",   "TEXT DEFAULT 'none'"),
-            ("due_time",     "TEXT DEFAULT ''"),
-            ("due_time_end", "TEXT DEFAULT ''"),
-        ]:
-            cur.execute(f"ALTER TABLE tasks ADD COLUMN IF NOT EXISTS {col} {definition}")
-        cur.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS email TEXT")
-        conn.commit()
+def get_pool():
+    global _pool, _replicas
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _replicas = create_replicas()
+                _pool = create_pool()
+    return _pool
 
-    else:
-        cur.execute("""CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, password TEXT NOT NULL)""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS folders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, user_id INTEGER NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users (id))""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS tasks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, task TEXT NOT NULL, user_id INTEGER NOT NULL, done INTEGER DEFAULT 0,
-            FOREIGN KEY (user_id) REFERENCES users (id))""")
-        cur.execute("""CREATE TABLE IF NOT EXISTS task_completions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, task_id INTEGER NOT NULL, completed_date TEXT NOT NULL,
-            UNIQUE(task_id, completed_date))""")
-        conn.commit()  # commit tables before altering
-
-        for col, definition in [
-            ("folder_id",    "INTEGER"),
-            ("due_date",     "TEXT"),
-            ("recurrence",   "TEXT DEFAULT 'none'"),
-            ("due_time",     "TEXT DEFAULT ''"),
-            ("due_time_end", "TEXT DEFAULT ''"),
-        ]:
+def primary(view):
+    # For GET views that write: never served from a replica.
+    view.primary = True
+    return view
+
+def is_write_request():
+    return request.method not in ("GET", "HEAD") or getattr(app.view_functions.get(request.endpoint), "primary", False)
+
+@app.before_request
+def pin_writers():
+    # After a write the user's reads stay on the primary for STICKY_SECONDS,
+    # so they see their own change whatever the replication lag.
+    get_pool()
+    if _replicas is not None and is_write_request():
+        session["primary_until"] = time.time() + STICKY_SECONDS
+
+def reads_from_replica():
+    return (_replicas is not None and has_request_context() and not is_write_request()
+            and session.get("primary_until", 0) < time.time())
+
+def get_db():
+    # One connection per app context, shared by load_user and the view;
+    # handed back to its pool by release_db() at teardown. Read-only
+    # requests go to a replica when DATABASE_REPLICA_URLS is set, and to the
+    # primary if none is available.
+    if "db" not in g:
+        pool, is_postgres = get_pool()
+        if reads_from_replica():
             try:
-                cur.execute(f"ALTER TABLE tasks ADD COLUMN {col} {definition}")
-            except:
+                g.db = (instrumentation.connect(_replicas.getconn), is_postgres)
+                g.db_pool = _replicas
+                return g.db
+            except ReplicaUnavailable:
                 pass
-        try:
-            cur.execute("ALTER TABLE users ADD COLUMN email TEXT")
-        except:
-            pass
-        conn.commit()
+        g.db = (instrumentation.connect(pool.getconn), is_postgres)
+        g.db_pool = pool
+    return g.db
 
-    cur.close()
-    conn.close()
+@app.teardown_appcontext
+def release_db(exc):
+    db = g.pop("db", None)
+    if db is not None:
+        g.pop("db_pool").putconn(metrics.unwrap(db[0]))
 
-init_db()
+def query(cur, is_postgres, statement, params=()):
+    cur.execute(sql(is_postgres, statement), params)
 
-def find_weekday_in_month(year, month, js_day_of_week, occ_str):
-    py_weekday = (js_day_of_week - 1) % 7
-    days_in_month = cal_module.monthrange(year, month)[1]
-    occurrences = [d for d in range(1, days_in_month + 1)
-                   if date(year, month, d).weekday() == py_weekday]
-    if not occurrences:
-        return None
-    if occ_str == 'last':
-        return date(year, month, occurrences[-1]).isoformat()
-    idx = int(occ_str) - 1
-    return date(year, month, occurrences[min(idx, len(occurrences)-1)]).isoformat()
+def query_many(cur, is_postgres, statement, seq):
+    if is_postgres:
+        psycopg2.extras.execute_batch(cur, statement, seq)
+    else:
+        cur.executemany(sql(is_postgres, statement), seq)
 
-def get_next_date(due_date_str, recurrence):
-    if not due_date_str or not recurrence or recurrence == 'none':
-        return None
-    try:
-        d = date.fromisoformat(due_date_str)
-        if recurrence == 'daily':
-            return (d + timedelta(days=1)).isoformat()
-        elif recurrence == 'weekly':
-            return (d + timedelta(weeks=1)).isoformat()
-        elif recurrence == 'monthly':
-            month = d.month + 1; year = d.year
-            if month > 12: month = 1; year += 1
-            last_day = cal_module.monthrange(year, month)[1]
-            return date(year, month, min(d.day, last_day)).isoformat()
-        elif recurrence.startswith('monthly_weekday_'):
-            parts = recurrence.split('_')
-            occ_str = parts[2]; js_dow = int(parts[3])
-            month = d.month + 1; year = d.year
-            if month > 12: month = 1; year += 1
-            return find_weekday_in_month(year, month, js_dow, occ_str)
-    except Exception as e:
-        print(f"Error getting next date: {e}")
-    return None
+def cached(view):
+    # Per-user read views: served from response_cache with ETag/304 until
+    # a write bumps the user's data version.
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not response_cache.enabled:
+            return view(*args, **kwargs)
+        conn, is_postgres = get_db()
+        cur = conn.cursor()
+        version = cache.data_version(cur, is_postgres, current_user.id); cur.close()
+        return response_cache.respond(current_user.id, version, lambda: view(*args, **kwargs))
+    return wrapper
+
+@app.cli.command("migrate")
+def migrate_command():
+    """Apply pending schema migrations."""
+    conn, is_postgres = get_db()
+    applied = migrations.migrate(conn, is_postgres)
+    print(f"Applied migrations: {applied}" if applied else "Schema is up to date.")
 
-def send_reminders():
+def send_reminders(due_date=None, force=False):
     with app.app_context():
         try:
             if not os.environ.get('MAIL_USERNAME'):
                 return
-            tomorrow = (date.today() + timedelta(days=1)).isoformat()
-            conn, is_postgres = get_db()
-            if is_postgres:
-                cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            else:
-                cur = conn.cursor()
-            query(cur, is_postgres, """
-                SELECT tasks.task, tasks.due_date, tasks.due_time, tasks.due_time_end,
-                       users.email, users.username, folders.name as calendar_name
-                FROM tasks JOIN users ON tasks.user_id = users.id
-                JOIN folders ON tasks.folder_id = folders.id
-                WHERE tasks.due_date = %s AND tasks.done = 0
-                AND users.email IS NOT NULL AND users.email != ''
-            """, (tomorrow,))
-            tasks = cur.fetchall()
-            cur.close(); conn.close()
-            user_tasks = {}
-            for task in tasks:
-                email = task['email']
-                if email not in user_tasks:
-                    user_tasks[email] = {'username': task['username'], 'tasks': []}
-                user_tasks[email]['tasks'].append(task)
-            for email, data in user_tasks.items():
-                try:
-                    task_lines = []
-                    for t in data['tasks']:
-                        time_str = f" at {t['due_time']}" if t.get('due_time') else ""
-                        if t.get('due_time_end'):
-                            time_str += f"–{t['due_time_end']}"
-                        task_lines.append(f"  • {t['task']}{time_str} ({t['calendar_name']})")
-                    msg = Message(
-                        subject=f"📅 {len(data['tasks'])} task(s) due tomorrow!",
-                        sender=os.environ.get('MAIL_USERNAME'),
-                        recipients=[email]
-                    )
-                    msg.body = f"Hi {data['username']},\n\nYou have {len(data['tasks'])} task(s) due tomorrow ({tomorrow}):\n\n" + \
-                               '\n'.join(task_lines) + "\n\nLog in to your calendar to check them off!\n\nBest,\nYour Calendar App"
-                    mail.send(msg)
-                except Exception as e:
-                    print(f"Failed to send to {email}: {e}")
+            due_date = due_date or (date.today() + timedelta(days=1)).isoformat()
+            result = reminders.run(app, mail, get_db, due_date, os.environ.get('MAIL_USERNAME'),
+                                   workers=int(os.environ.get('REMINDER_WORKERS', 4)), force=force)
+            if result:
+                print(f"Reminders for {due_date}: {result[0]} sent, {result[1]} failed")
+            return result
         except Exception as e:
             print(f"Reminder job error: {e}")
 
+@app.cli.command("send-reminders")
+@click.option("--date", "due_date", help="Due date to remind about (default: tomorrow).")
+@click.option("--force", is_flag=True, help="Run even if today's run was already claimed.")
+def send_reminders_command(due_date, force):
+    """Send reminder emails now instead of waiting for the 08:00 job."""
+    send_reminders(due_date, force)
+
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 180))
+
+def archive_finished(force=False):
+    with app.app_context():
+        try:
+            conn, is_postgres = get_db()
+            result = archive.run(conn, is_postgres, ARCHIVE_AFTER_DAYS,
+                                 batch_size=int(os.environ.get('ARCHIVE_BATCH_SIZE', archive.BATCH_SIZE)),
+                                 pause=float(os.environ.get('ARCHIVE_PAUSE', 0.05)),
+                                 counters=STATS_COUNTERS, force=force)
+            if result:
+                print(f"Archived {result[0]} task(s) and {result[1]} completion year(s)")
+            return result
+        except Exception as e:
+            print(f"Archive job error: {e}")
+
+@app.cli.command("archive")
+@click.option("--force", is_flag=True, help="Run even if today's run was already claimed.")
+def archive_command(force):
+    """Move finished tasks and old completions past the horizon to the archive."""
+    archive_finished(force)
+
+def advance_daily_stats():
+    with app.app_context():
+        try:
+            conn, is_postgres = get_db()
+            users = rollups.advance(conn, is_postgres)
+            if users:
+                print(f"Daily stats advanced for {users} user(s)")
+            return users
+        except Exception as e:
+            print(f"Daily stats job error: {e}")
+
+@app.cli.command("rebuild-daily-stats")
+def rebuild_daily_stats_command():
+    """Recompute daily_stats from the live and archived tasks."""
+    conn, is_postgres = get_db()
+    users = rollups.rebuild(conn, is_postgres)
+    print(f"Daily stats rebuilt for {users} user(s).")
+
+# Every worker schedules the jobs; each claims its daily run so only one
+# worker does the work.
+scheduler = BackgroundScheduler(timezone='UTC')
 if os.environ.get('MAIL_USERNAME'):
-    scheduler = BackgroundScheduler(timezone='UTC')
     scheduler.add_job(send_reminders, 'cron', hour=8, minute=0)
+if ARCHIVE_AFTER_DAYS:
+    scheduler.add_job(archive_finished, 'cron', hour=3, minute=0)
+# Moving the horizon is idempotent, so any worker may do it.
+scheduler.add_job(advance_daily_stats, 'cron', hour=0, minute=1)
+# Fork the hash workers before the scheduler thread exists.
+hash_pool.start()
+if scheduler.get_jobs():
     scheduler.start()
 
+STATS_COUNTERS = os.environ.get("STATS_COUNTERS") == "1"
+
+def load_calendar_stats(cur, is_postgres, user_id):
+    # One query for every calendar of the user: either aggregated live from
+    # tasks, or read from the folder_stats / folder_due_counts counters.
+    today = date.today().isoformat()
+    tomorrow = (date.today() + timedelta(days=2)).isoformat()
+    if STATS_COUNTERS:
+        sql = """
+            SELECT folders.id, folders.name, folders.user_id,
+                   COALESCE(folder_stats.total, 0) + folders.archived_done AS total,
+                   COALESCE(folder_stats.done, 0) + folders.archived_done AS done,
+                   (SELECT COALESCE(SUM(pending), 0) FROM folder_due_counts
+                    WHERE folder_id = folders.id AND due_date < %s) AS overdue,
+                   (SELECT COALESCE(SUM(pending), 0) FROM folder_due_counts
+                    WHERE folder_id = folders.id AND due_date >= %s AND due_date <= %s) AS warning
+            FROM folders LEFT JOIN folder_stats ON folder_stats.folder_id = folders.id
+            WHERE folders.user_id = %s ORDER BY folders.id"""
+    else:
+        sql = """
+            SELECT folders.id, folders.name, folders.user_id,
+                   COUNT(tasks.id) + folders.archived_done AS total,
+                   COALESCE(SUM(CASE WHEN tasks.done = 1 THEN 1 ELSE 0 END), 0) + folders.archived_done AS done,
+                   COALESCE(SUM(CASE WHEN tasks.done = 0 AND tasks.due_date IS NOT NULL AND tasks.due_date != ''
+                                     AND tasks.due_date < %s THEN 1 ELSE 0 END), 0) AS overdue,
+                   COALESCE(SUM(CASE WHEN tasks.done = 0 AND tasks.due_date IS NOT NULL AND tasks.due_date != ''
+                                     AND tasks.due_date >= %s AND tasks.due_date <= %s THEN 1 ELSE 0 END), 0) AS warning
+            FROM folders LEFT JOIN tasks ON tasks.folder_id = folders.id AND tasks.user_id = folders.user_id
+            WHERE folders.user_id = %s
+            GROUP BY folders.id, folders.name, folders.user_id, folders.archived_done ORDER BY folders.id"""
+    query(cur, is_postgres, sql, (today, today, tomorrow, user_id))
+    calendars = cur.fetchall()
+    calendar_stats = {}
+    for cal in calendars:
+        total, done = int(cal["total"]), int(cal["done"])
+        overdue, warning = int(cal["overdue"]), int(cal["warning"])
+        calendar_stats[cal["id"]] = {"total": total, "done": done, "due": total - done, "overdue": overdue, "warning": warning, "ontrack": (total - done) - overdue - warning}
+    return calendars, calendar_stats
+
+def count_task(cur, is_postgres, task, sign):
+    # Add (sign=1) or remove (sign=-1) a task's contribution to the folder
+    # counters. Must run in the same transaction as the task write.
+    if not STATS_COUNTERS or not task["folder_id"]:
+        return
+    done = 1 if task["done"] else 0
+    query(cur, is_postgres, """
+        INSERT INTO folder_stats (folder_id, total, done) VALUES (%s, %s, %s)
+        ON CONFLICT (folder_id) DO UPDATE SET total = folder_stats.total + excluded.total,
+                                              done = folder_stats.done + excluded.done
+    """, (task["folder_id"], sign, sign * done))
+    if not done and task["due_date"]:
+        query(cur, is_postgres, """
+            INSERT INTO folder_due_counts (folder_id, due_date, pending) VALUES (%s, %s, %s)
+            ON CONFLICT (folder_id, due_date) DO UPDATE SET pending = folder_due_counts.pending + excluded.pending
+        """, (task["folder_id"], task["due_date"], sign))
+        if sign < 0:
+            query(cur, is_postgres, "DELETE FROM folder_due_counts WHERE folder_id = %s AND due_date = %s AND pending <= 0",
+                  (task["folder_id"], task["due_date"]))
+
+def rebuild_folder_stats(cur, is_postgres, folder_id=None):
+    # All folders, or just one (e.g. after a bulk import).
+    where, params = ("folder_id = %s", (folder_id,)) if folder_id else ("folder_id IS NOT NULL", ())
+    query(cur, is_postgres, f"DELETE FROM folder_due_counts WHERE {where}", params)
+    query(cur, is_postgres, f"DELETE FROM folder_stats WHERE {where}", params)
+    query(cur, is_postgres, f"""
+        INSERT INTO folder_stats (folder_id, total, done)
+        SELECT folder_id, COUNT(*), SUM(CASE WHEN done = 1 THEN 1 ELSE 0 END)
+        FROM tasks WHERE {where} GROUP BY folder_id""", params)
+    query(cur, is_postgres, f"""
+        INSERT INTO folder_due_counts (folder_id, due_date, pending)
+        SELECT folder_id, due_date, COUNT(*) FROM tasks
+        WHERE {where} AND done = 0 AND due_date IS NOT NULL AND due_date != ''
+        GROUP BY folder_id, due_date""", params)
+
+@app.cli.command("rebuild-stats")
+def rebuild_stats_command():
+    """Recompute the per-folder counters from the tasks table."""
+    conn, is_postgres = get_db()
+    cur = conn.cursor()
+    rebuild_folder_stats(cur, is_postgres)
+    conn.commit(); cur.close()
+    print("Folder stats rebuilt.")
+
 class User(UserMixin):
     def __init__(self, id, username, email=None):
         self.id = id; self.username = username; self.email = email
 
+class UserCache:
+    """Bounded LRU of User objects with a per-entry TTL.
+
+    Entries are dropped explicitly when a user's row changes; the TTL bounds
+    how long other gunicorn workers can serve a stale copy.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        key = str(user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, user):
+        key = str(user.id)
+        with self._lock:
+            self._entries[key] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+user_cache = UserCache(int(os.environ.get("USER_CACHE_SIZE", 1024)),
+                       float(os.environ.get("USER_CACHE_TTL", 300)))
+
 @login_manager.user_loader
 def load_user(user_id):
+    cached = user_cache.get(user_id)
+    if cached:
+        return cached
     conn, is_postgres = get_db()
     if is_postgres:
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     else:
         cur = conn.cursor()
     query(cur, is_postgres, "SELECT * FROM users WHERE id = %s", (user_id,))
-    user = cur.fetchone(); cur.close(); conn.close()
+    user = cur.fetchone(); cur.close()
     if user:
-        return User(user["id"], user["username"], user["email"] if "email" in user.keys() else None)
+        user = User(user["id"], user["username"], user["email"] if "email" in user.keys() else None)
+        user_cache.put(user)
+        return user
     return None
 
 @app.route("/")
 @login_required
+@cached
 def home():
     conn, is_postgres = get_db()
     if is_postgres:
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     else:
         cur = conn.cursor()
-    query(cur, is_postgres, "SELECT * FROM folders WHERE user_id = %s", (current_user.id,))
-    calendars = cur.fetchall()
-    today = date.today().isoformat()
-    tomorrow = (date.today() + timedelta(days=2)).isoformat()
-    calendar_stats = {}
-    for cal in calendars:
-        query(cur, is_postgres, "SELECT COUNT(*) as total FROM tasks WHERE folder_id = %s AND user_id = %s", (cal["id"], current_user.id))
-        total = cur.fetchone()["total"]
-        query(cur, is_postgres, "SELECT COUNT(*) as done FROM tasks WHERE folder_id = %s AND user_id = %s AND done = 1", (cal["id"], current_user.id))
-        done = cur.fetchone()["done"]
-        query(cur, is_postgres, "SELECT COUNT(*) as overdue FROM tasks WHERE folder_id = %s AND user_id = %s AND done = 0 AND due_date IS NOT NULL AND due_date != '' AND due_date < %s", (cal["id"], current_user.id, today))
-        overdue = cur.fetchone()["overdue"]
-        query(cur, is_postgres, "SELECT COUNT(*) as warning FROM tasks WHERE folder_id = %s AND user_id = %s AND done = 0 AND due_date IS NOT NULL AND due_date != '' AND due_date >= %s AND due_date <= %s", (cal["id"], current_user.id, today, tomorrow))
-        warning = cur.fetchone()["warning"]
-        calendar_stats[cal["id"]] = {"total": total, "done": done, "due": total - done, "overdue": overdue, "warning": warning, "ontrack": (total - done) - overdue - warning}
-    cur.close(); conn.close()
+    calendars, calendar_stats = load_calendar_stats(cur, is_postgres, current_user.id)
+    cur.close()
     return render_template("index.html", calendars=calendars, calendar_stats=calendar_stats)
 
 @app.route("/settings", methods=["GET", "POST"])
@@ -246,10 +405,10 @@ def settings():
     if request.method == "POST":
         email = request.form.get("email", "").strip()
         query(cur, is_postgres, "UPDATE users SET email = %s WHERE id = %s", (email, current_user.id))
-        conn.commit(); flash("Settings saved!", "success"); cur.close(); conn.close()
+        conn.commit(); user_cache.invalidate(current_user.id); flash("Settings saved!", "success"); cur.close()
         return redirect(url_for("settings"))
     query(cur, is_postgres, "SELECT * FROM users WHERE id = %s", (current_user.id,))
-    user = cur.fetchone(); cur.close(); conn.close()
+    user = cur.fetchone(); cur.close()
     return render_template("settings.html", user=user)
 
 @app.route("/calendar/create", methods=["POST"])
@@ -260,18 +419,27 @@ def create_calendar():
         conn, is_postgres = get_db()
         cur = conn.cursor()
         query(cur, is_postgres, "INSERT INTO folders (name, user_id) VALUES (%s, %s)", (name, current_user.id))
-        conn.commit(); cur.close(); conn.close()
+        cache.bump_version(cur, is_postgres, current_user.id)
+        conn.commit(); cur.close()
     return redirect(url_for("home"))
 
 @app.route("/calendar/delete/<int:calendar_id>")
 @login_required
+@primary
 def delete_calendar(calendar_id):
     conn, is_postgres = get_db()
+    # Tasks go a chunk per transaction; the folder itself goes last, so an
+    # interrupted delete leaves a calendar that can simply be deleted again.
+    archive.delete_folder(conn, is_postgres, calendar_id, current_user.id,
+                          int(os.environ.get('ARCHIVE_BATCH_SIZE', archive.BATCH_SIZE)))
     cur = conn.cursor()
-    query(cur, is_postgres, "DELETE FROM task_completions WHERE task_id IN (SELECT id FROM tasks WHERE folder_id = %s AND user_id = %s)", (calendar_id, current_user.id))
-    query(cur, is_postgres, "DELETE FROM tasks WHERE folder_id = %s AND user_id = %s", (calendar_id, current_user.id))
+    if STATS_COUNTERS:
+        for table in ("folder_stats", "folder_due_counts"):
+            query(cur, is_postgres, f"DELETE FROM {table} WHERE folder_id IN (SELECT id FROM folders WHERE id = %s AND user_id = %s)", (calendar_id, current_user.id))
+    query(cur, is_postgres, "DELETE FROM daily_stats WHERE folder_id = %s AND user_id = %s", (calendar_id, current_user.id))
     query(cur, is_postgres, "DELETE FROM folders WHERE id = %s AND user_id = %s", (calendar_id, current_user.id))
-    conn.commit(); cur.close(); conn.close()
+    cache.bump_version(cur, is_postgres, current_user.id)
+    conn.commit(); cur.close()
     return redirect(url_for("home"))
 
 @app.route("/api/calendar/rename/<int:calendar_id>", methods=["POST"])
@@ -284,11 +452,13 @@ def rename_calendar(calendar_id):
     conn, is_postgres = get_db()
     cur = conn.cursor()
     query(cur, is_postgres, "UPDATE folders SET name = %s WHERE id = %s AND user_id = %s", (name, calendar_id, current_user.id))
-    conn.commit(); cur.close(); conn.close()
+    cache.bump_version(cur, is_postgres, current_user.id)
+    conn.commit(); cur.close()
     return jsonify({"success": True, "name": name})
 
 @app.route("/calendar/<int:calendar_id>")
 @login_required
+@cached
 def view_calendar(calendar_id):
     conn, is_postgres = get_db()
     if is_postgres:
@@ -299,26 +469,19 @@ def view_calendar(calendar_id):
     calendar = cur.fetchone()
     if not calendar:
         return redirect(url_for("home"))
-    query(cur, is_postgres, "SELECT * FROM tasks WHERE folder_id = %s AND user_id = %s", (calendar_id, current_user.id))
-    tasks = cur.fetchall()
-    task_ids = [t['id'] for t in tasks]
-    completions = {}
-    if task_ids:
-        placeholders = ','.join(['%s'] * len(task_ids)) if is_postgres else ','.join(['?'] * len(task_ids))
-        cur.execute(f"SELECT task_id, completed_date FROM task_completions WHERE task_id IN ({placeholders})", task_ids)
-        for row in cur.fetchall():
-            tid = row['task_id']
-            if tid not in completions:
-                completions[tid] = []
-            completions[tid].append(row['completed_date'])
-    cur.close(); conn.close()
+    # Ship the month containing today; the page fetches other months on demand.
+    start = date.today().replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1)
+    initial_window = load_occurrences(cur, is_postgres, current_user.id, calendar_id, start, end, "bitmap")
+    cur.close()
     today = date.today().isoformat()
     tomorrow = (date.today() + timedelta(days=2)).isoformat()
-    return render_template("my_calendar.html", calendar=calendar, tasks=tasks,
-                           completions=completions, today=today, tomorrow=tomorrow)
+    return render_template("my_calendar.html", calendar=calendar, initial_window=initial_window,
+                           today=today, tomorrow=tomorrow)
 
 @app.route("/api/tasks")
 @login_required
+@cached
 def api_tasks():
     calendar_id = request.args.get("calendar_id")
     date_str = request.args.get("date")
@@ -328,13 +491,157 @@ def api_tasks():
     else:
         cur = conn.cursor()
     query(cur, is_postgres, "SELECT * FROM tasks WHERE folder_id = %s AND user_id = %s AND due_date = %s", (calendar_id, current_user.id, date_str))
-    tasks = cur.fetchall(); cur.close(); conn.close()
+    tasks = cur.fetchall(); cur.close()
     return jsonify([dict(t) for t in tasks])
 
-@app.route("/api/task/add", methods=["POST"])
+MAX_WINDOW_DAYS = 400
+
+def parse_window(args):
+    # [start, end) from ISO date query args; None if missing, malformed or
+    # wider than MAX_WINDOW_DAYS.
+    try:
+        start = date.fromisoformat(args.get("start", ""))
+        end = date.fromisoformat(args.get("end", ""))
+    except ValueError:
+        return None
+    if not start < end or (end - start).days > MAX_WINDOW_DAYS:
+        return None
+    return start, end
+
+def load_occurrences(cur, is_postgres, user_id, calendar_id, start, end, encoding="list"):
+    # Only tasks that can land in the window: one-offs due inside it and
+    # recurring tasks that started before its end.
+    query(cur, is_postgres, """
+        SELECT * FROM tasks WHERE folder_id = %s AND user_id = %s
+        AND due_date IS NOT NULL AND due_date != '' AND due_date < %s
+        AND (due_date >= %s OR (recurrence IS NOT NULL AND recurrence != 'none'))
+    """, (calendar_id, user_id, end.isoformat(), start.isoformat()))
+    tasks = cur.fetchall()
+    done = completions.load_folder(cur, is_postgres, user_id, calendar_id, start, end)
+    if start < archive.horizon(ARCHIVE_AFTER_DAYS):
+        archived, archived_done = archive.load_window(cur, is_postgres, user_id, calendar_id, start, end,
+                                                      [t["id"] for t in tasks])
+        tasks = list(tasks) + list(archived)
+        done.bitmaps.update(archived_done.bitmaps)
+    window = {"start": start.isoformat(), "end": end.isoformat(), "tasks": [dict(t) for t in tasks]}
+    if encoding == "bitmap":
+        window["encoding"] = "bitmap"
+        window["occurrences"] = completions.encode_window(tasks, done, start, end)
+    else:
+        window["occurrences"] = recurrence.occurrences(tasks, done, start, end)
+    return window
+
+@app.route("/api/occurrences")
 @login_required
-def api_add_task():
-    data = request.get_json()
+@cached
+def api_occurrences():
+    calendar_id = request.args.get("calendar_id", type=int)
+    window = parse_window(request.args)
+    if calendar_id is None or not window:
+        return jsonify({"error": "numeric calendar_id, start and end (max %d days) required" % MAX_WINDOW_DAYS}), 400
+    start, end = window
+    conn, is_postgres = get_db()
+    if is_postgres:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    else:
+        cur = conn.cursor()
+    result = load_occurrences(cur, is_postgres, current_user.id, calendar_id, start, end,
+                              "bitmap" if request.args.get("encoding") == "bitmap" else "list")
+    cur.close()
+    return jsonify(result)
+
+STATS_DEFAULT_DAYS = 30
+
+@app.route("/api/stats")
+@login_required
+def api_stats():
+    """Daily created/due/completed/overdue counts, completion rates and
+    streaks for [start, end) (default: the last 30 days), over all
+    calendars or one calendar_id. Not response-cached: the daily advance
+    changes the counts without a write."""
+    calendar_id = request.args.get("calendar_id")
+    if "start" in request.args or "end" in request.args:
+        window = parse_window(request.args)
+    else:
+        end = date.today() + timedelta(days=1)
+        window = end - timedelta(days=STATS_DEFAULT_DAYS), end
+    if not window or (calendar_id is not None and not calendar_id.isdigit()):
+        return jsonify({"error": "start and end (max %d days) and an optional numeric calendar_id required" % MAX_WINDOW_DAYS}), 400
+    conn, is_postgres = get_db()
+    cur = conn.cursor()
+    result = rollups.summary(cur, is_postgres, current_user.id, int(calendar_id) if calendar_id else None, *window)
+    cur.close()
+    return jsonify(result)
+
+MAX_SEARCH_RESULTS = 100
+
+@app.route("/api/search")
+@login_required
+@cached
+def api_search():
+    """Prefix search over task names: q, optional calendar_id, start/end
+    (due date in [start, end)), limit and the cursor from the previous page."""
+    text = request.args.get("q", "")
+    try:
+        calendar_id = int(request.args["calendar_id"]) if request.args.get("calendar_id") else None
+        start = date.fromisoformat(request.args["start"]) if request.args.get("start") else None
+        end = date.fromisoformat(request.args["end"]) if request.args.get("end") else None
+        limit = min(max(int(request.args.get("limit", 20)), 1), MAX_SEARCH_RESULTS)
+        if request.args.get("cursor"):
+            search.decode_search_cursor(request.args["cursor"])
+    except ValueError:
+        return jsonify({"error": "Invalid calendar_id, start, end, limit or cursor"}), 400
+    conn, is_postgres = get_db()
+    if is_postgres:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    else:
+        cur = conn.cursor()
+    results, next_cursor = search.search(cur, is_postgres, current_user.id, text, calendar_id, start, end,
+                                         limit, request.args.get("cursor"))
+    cur.close()
+    return jsonify({"results": results, "next_cursor": next_cursor})
+
+MAX_ARCHIVE_RESULTS = 200
+
+@app.route("/api/archive")
+@login_required
+@cached
+def api_archive():
+    """Archived tasks of a calendar, latest first: calendar_id, optional
+    start/end (due date in [start, end)), limit and cursor."""
+    try:
+        calendar_id = int(request.args.get("calendar_id", ""))
+        start = date.fromisoformat(request.args["start"]) if request.args.get("start") else None
+        end = date.fromisoformat(request.args["end"]) if request.args.get("end") else None
+        limit = min(max(int(request.args.get("limit", 50)), 1), MAX_ARCHIVE_RESULTS)
+        if request.args.get("cursor"):
+            archive.decode_browse_cursor(request.args["cursor"])
+    except ValueError:
+        return jsonify({"error": "Invalid calendar_id, start, end, limit or cursor"}), 400
+    conn, is_postgres = get_db()
+    if is_postgres:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    else:
+        cur = conn.cursor()
+    tasks, next_cursor = archive.browse(cur, is_postgres, current_user.id, calendar_id, start, end,
+                                        limit, request.args.get("cursor"))
+    cur.close()
+    return jsonify({"tasks": tasks, "next_cursor": next_cursor})
+
+TASK_COLUMNS = "task, user_id, folder_id, due_date, due_time, due_time_end, recurrence"
+
+def insert_task(cur, is_postgres, values):
+    # values follow TASK_COLUMNS; returns the new row.
+    sql = f"INSERT INTO tasks ({TASK_COLUMNS}, created_on) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
+    values = tuple(values) + (date.today().isoformat(),)
+    if is_postgres:
+        cur.execute(sql + " RETURNING *", values)
+        return cur.fetchone()
+    query(cur, is_postgres, sql, values)
+    cur.execute("SELECT * FROM tasks WHERE id = ?", (cur.lastrowid,))
+    return cur.fetchone()
+
+def add_task(cur, is_postgres, user_id, data):
     task_name = data.get("task")
     due_date = data.get("due_date")
     due_time = data.get("due_time", "")
@@ -342,111 +649,417 @@ def api_add_task():
     calendar_id = data.get("calendar_id")
     recurrence = data.get("recurrence", "none")
     if not task_name or not calendar_id:
-        return jsonify({"error": "Missing data"}), 400
+        return None
+    new_task = insert_task(cur, is_postgres, (task_name, user_id, calendar_id, due_date, due_time, due_time_end, recurrence))
+    count_task(cur, is_postgres, new_task, 1)
+    rollups.update(cur, is_postgres, [], [new_task])
+    return new_task
+
+def task_error(data, adding=False):
+    # Why an add/edit payload cannot be saved, or None.
+    if not isinstance(data, dict) or not data.get("task") or (adding and not data.get("calendar_id")):
+        return "Missing data"
+    if data.get("due_date") and not valid_date(data["due_date"]):
+        return "Invalid date"
+    return None
+
+def edit_values(user_id, task_id, data):
+    return (data.get("task"), data.get("due_date"), data.get("due_time", ""), data.get("due_time_end", ""),
+            data.get("recurrence", "none"), task_id, user_id)
+
+def counted_tasks(cur, is_postgres, user_id, task_ids):
+    # Current counter-relevant state of the given tasks, or {} when the
+    # counters are off.
+    if not STATS_COUNTERS or not task_ids:
+        return {}
+    query(cur, is_postgres, f"SELECT id, folder_id, done, due_date FROM tasks WHERE user_id = %s AND id IN ({placeholders(task_ids)})",
+          (user_id, *task_ids))
+    return {row["id"]: row for row in cur.fetchall()}
+
+def load_tasks(cur, is_postgres, user_id, task_ids):
+    if not task_ids:
+        return []
+    query(cur, is_postgres, f"SELECT * FROM tasks WHERE user_id = %s AND id IN ({placeholders(task_ids)})", (user_id, *task_ids))
+    return cur.fetchall()
+
+def edit_tasks(cur, is_postgres, user_id, edits):
+    # edits: [(task_id, data), ...]
+    task_ids = [task_id for task_id, _ in edits]
+    old = counted_tasks(cur, is_postgres, user_id, task_ids)
+    before = load_tasks(cur, is_postgres, user_id, task_ids)
+    query_many(cur, is_postgres,
+               "UPDATE tasks SET task = %s, due_date = %s, due_time = %s, due_time_end = %s, recurrence = %s WHERE id = %s AND user_id = %s",
+               [edit_values(user_id, task_id, data) for task_id, data in edits])
+    rollups.update(cur, is_postgres, before, load_tasks(cur, is_postgres, user_id, task_ids))
+    for task_id, data in edits:
+        if task_id in old:
+            count_task(cur, is_postgres, old[task_id], -1)
+            old[task_id] = {"folder_id": old[task_id]["folder_id"], "done": old[task_id]["done"], "due_date": data.get("due_date")}
+            count_task(cur, is_postgres, old[task_id], 1)
+
+def delete_tasks(cur, is_postgres, user_id, task_ids):
+    for old in counted_tasks(cur, is_postgres, user_id, task_ids).values():
+        count_task(cur, is_postgres, old, -1)
+    rollups.update(cur, is_postgres, load_tasks(cur, is_postgres, user_id, task_ids), [])
+    for table in ("completion_bitmaps", "archived_completions"):
+        query_many(cur, is_postgres, f"DELETE FROM {table} WHERE task_id IN (SELECT id FROM tasks WHERE id = %s AND user_id = %s)",
+                   [(task_id, user_id) for task_id in task_ids])
+    query_many(cur, is_postgres, "DELETE FROM tasks WHERE id = %s AND user_id = %s",
+               [(task_id, user_id) for task_id in task_ids])
+
+def valid_date(value):
+    try:
+        date.fromisoformat(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+def toggle_task(cur, is_postgres, user_id, task_id, toggle_date):
+    query(cur, is_postgres, "SELECT * FROM tasks WHERE id = %s AND user_id = %s", (task_id, user_id))
+    task = cur.fetchone()
+    if not task:
+        return None
+    is_recurring = task["recurrence"] and task["recurrence"] != "none"
+    result = {"success": True}
+    if is_recurring and toggle_date:
+        if completions.toggle(cur, is_postgres, task_id, toggle_date):
+            result["done"] = 1
+            result["completed_date"] = toggle_date
+        else:
+            result["done"] = 0
+        rollups.update_day(cur, is_postgres, task, toggle_date, result["done"])
+    else:
+        new_status = 0 if task["done"] else 1
+        query(cur, is_postgres, "UPDATE tasks SET done = %s WHERE id = %s", (new_status, task_id))
+        count_task(cur, is_postgres, task, -1)
+        count_task(cur, is_postgres, {"folder_id": task["folder_id"], "done": new_status, "due_date": task["due_date"]}, 1)
+        result["done"] = new_status
+        after = [dict(task, done=new_status)]
+        if new_status == 1 and is_recurring:
+            next_date = get_next_date(task["due_date"], task["recurrence"])
+            if next_date:
+                new_task = insert_task(cur, is_postgres,
+                                       (task["task"], user_id, task["folder_id"], next_date,
+                                        task["due_time"] or "", task["due_time_end"] or "", task["recurrence"]))
+                count_task(cur, is_postgres, new_task, 1)
+                after.append(new_task)
+                result["new_task"] = dict(new_task)
+        rollups.update(cur, is_postgres, [task], after)
+    return result
+
+@app.route("/api/task/add", methods=["POST"])
+@login_required
+def api_add_task():
     conn, is_postgres = get_db()
     if is_postgres:
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     else:
         cur = conn.cursor()
-    query(cur, is_postgres,
-          "INSERT INTO tasks (task, user_id, folder_id, due_date, due_time, due_time_end, recurrence) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-          (task_name, current_user.id, calendar_id, due_date, due_time, due_time_end, recurrence))
-    conn.commit()
-    if is_postgres:
-        cur.execute("SELECT * FROM tasks WHERE user_id = %s ORDER BY id DESC LIMIT 1", (current_user.id,))
-    else:
-        cur.execute("SELECT * FROM tasks WHERE user_id = ? ORDER BY id DESC LIMIT 1", (current_user.id,))
-    new_task = cur.fetchone(); cur.close(); conn.close()
+    data = request.get_json(silent=True)
+    error = task_error(data, adding=True)
+    if error:
+        cur.close()
+        return jsonify({"error": error}), 400
+    new_task = add_task(cur, is_postgres, current_user.id, data)
+    cache.bump_version(cur, is_postgres, current_user.id)
+    conn.commit(); cur.close()
     return jsonify(dict(new_task))
 
 @app.route("/api/task/edit/<int:task_id>", methods=["POST"])
 @login_required
 def api_edit_task(task_id):
-    data = request.get_json()
-    task_name = data.get("task")
-    due_date = data.get("due_date")
-    due_time = data.get("due_time", "")
-    due_time_end = data.get("due_time_end", "")
-    recurrence = data.get("recurrence", "none")
     conn, is_postgres = get_db()
-    cur = conn.cursor()
-    query(cur, is_postgres,
-          "UPDATE tasks SET task = %s, due_date = %s, due_time = %s, due_time_end = %s, recurrence = %s WHERE id = %s AND user_id = %s",
-          (task_name, due_date, due_time, due_time_end, recurrence, task_id, current_user.id))
-    conn.commit(); cur.close(); conn.close()
+    if is_postgres:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    else:
+        cur = conn.cursor()
+    data = request.get_json(silent=True)
+    error = task_error(data)
+    if error:
+        cur.close()
+        return jsonify({"error": error}), 400
+    edit_tasks(cur, is_postgres, current_user.id, [(task_id, data)])
+    cache.bump_version(cur, is_postgres, current_user.id)
+    conn.commit(); cur.close()
     return jsonify({"success": True})
 
 @app.route("/api/task/delete/<int:task_id>", methods=["POST"])
 @login_required
 def api_delete_task(task_id):
     conn, is_postgres = get_db()
-    cur = conn.cursor()
-    query(cur, is_postgres, "DELETE FROM task_completions WHERE task_id = %s", (task_id,))
-    query(cur, is_postgres, "DELETE FROM tasks WHERE id = %s AND user_id = %s", (task_id, current_user.id))
-    conn.commit(); cur.close(); conn.close()
+    if is_postgres:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    else:
+        cur = conn.cursor()
+    delete_tasks(cur, is_postgres, current_user.id, [task_id])
+    cache.bump_version(cur, is_postgres, current_user.id)
+    conn.commit(); cur.close()
     return jsonify({"success": True})
 
 @app.route("/api/task/toggle/<int:task_id>", methods=["POST"])
 @login_required
 def api_toggle_task(task_id):
     data = request.get_json() or {}
-    toggle_date = data.get("date")
+    if data.get("date") and not valid_date(data["date"]):
+        return jsonify({"error": "Invalid date"}), 400
     conn, is_postgres = get_db()
     if is_postgres:
         cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     else:
         cur = conn.cursor()
-    query(cur, is_postgres, "SELECT * FROM tasks WHERE id = %s AND user_id = %s", (task_id, current_user.id))
-    task = cur.fetchone()
-    if not task:
-        cur.close(); conn.close()
+    result = toggle_task(cur, is_postgres, current_user.id, task_id, data.get("date"))
+    if not result:
+        cur.close()
         return jsonify({"error": "Not found"}), 404
-    is_recurring = task["recurrence"] and task["recurrence"] != "none"
-    result = {"success": True}
-    if is_recurring and toggle_date:
-        query(cur, is_postgres, "SELECT id FROM task_completions WHERE task_id = %s AND completed_date = %s", (task_id, toggle_date))
-        existing = cur.fetchone()
-        if existing:
-            query(cur, is_postgres, "DELETE FROM task_completions WHERE task_id = %s AND completed_date = %s", (task_id, toggle_date))
-            result["done"] = 0
-        else:
+    cache.bump_version(cur, is_postgres, current_user.id)
+    conn.commit(); cur.close()
+    return jsonify(result)
+
+MAX_BATCH_OPS = 500
+
+DB_ERRORS = (psycopg2.Error, sqlite3.Error)
+
+class BatchError(Exception):
+    def __init__(self, index, message, status=400):
+        super().__init__(message)
+        self.index = index; self.message = message; self.status = status
+
+def run_batch(cur, is_postgres, user_id, operations):
+    # Consecutive edits and deletes are sent as one executemany each; adds and
+    # toggles need their own row back and run one by one.
+    results = [None] * len(operations)
+    i = 0
+    while i < len(operations):
+        op = operations[i]
+        kind = op.get("op") if isinstance(op, dict) else None
+        if kind not in ("add", "edit", "delete", "toggle"):
+            raise BatchError(i, "Unknown op")
+        if kind != "add" and not isinstance(op.get("id"), int):
+            raise BatchError(i, "Missing id")
+        if kind in ("edit", "delete"):
+            j = i
+            while j < len(operations) and isinstance(operations[j], dict) and operations[j].get("op") == kind \
+                    and isinstance(operations[j].get("id"), int):
+                j += 1
+            run = operations[i:j]
+            for k, o in enumerate(run, i):
+                if kind == "edit" and task_error(o):
+                    raise BatchError(k, task_error(o))
             try:
-                query(cur, is_postgres, "INSERT INTO task_completions (task_id, completed_date) VALUES (%s, %s)", (task_id, toggle_date))
-            except:
-                conn.rollback()
-            result["done"] = 1
-            result["completed_date"] = toggle_date
-    else:
-        new_status = 0 if task["done"] else 1
-        query(cur, is_postgres, "UPDATE tasks SET done = %s WHERE id = %s", (new_status, task_id))
-        result["done"] = new_status
-        if new_status == 1 and is_recurring:
-            next_date = get_next_date(task["due_date"], task["recurrence"])
-            if next_date:
-                query(cur, is_postgres,
-                      "INSERT INTO tasks (task, user_id, folder_id, due_date, due_time, due_time_end, recurrence) VALUES (%s, %s, %s, %s, %s, %s, %s)",
-                      (task["task"], current_user.id, task["folder_id"], next_date,
-                       task.get("due_time", ""), task.get("due_time_end", ""), task["recurrence"]))
-                if is_postgres:
-                    cur.execute("SELECT * FROM tasks WHERE user_id = %s ORDER BY id DESC LIMIT 1", (current_user.id,))
+                if kind == "edit":
+                    edit_tasks(cur, is_postgres, user_id, [(o["id"], o) for o in run])
                 else:
-                    cur.execute("SELECT * FROM tasks WHERE user_id = ? ORDER BY id DESC LIMIT 1", (current_user.id,))
-                new_task = cur.fetchone()
-                result["new_task"] = dict(new_task)
-    conn.commit(); cur.close(); conn.close()
-    return jsonify(result)
+                    delete_tasks(cur, is_postgres, user_id, [o["id"] for o in run])
+            except DB_ERRORS as e:
+                # The run went to the database as one statement batch.
+                print(f"Batch operations {i}-{j - 1} failed: {e}")
+                raise BatchError(i, f"Database error in operations {i}-{j - 1}", 500) from e
+            for k in range(i, j):
+                results[k] = {"op": kind, "id": operations[k]["id"], "success": True}
+            i = j
+            continue
+        if kind == "toggle" and op.get("date") and not valid_date(op["date"]):
+            raise BatchError(i, "Invalid date")
+        if kind == "add" and task_error(op, adding=True):
+            raise BatchError(i, task_error(op, adding=True))
+        try:
+            if kind == "add":
+                new_task = add_task(cur, is_postgres, user_id, op)
+            else:
+                result = toggle_task(cur, is_postgres, user_id, op["id"], op.get("date"))
+        except DB_ERRORS as e:
+            print(f"Batch operation {i} failed: {e}")
+            raise BatchError(i, "Database error", 500) from e
+        if kind == "add":
+            results[i] = {"op": "add", "success": True, "task": dict(new_task)}
+        else:
+            if not result:
+                raise BatchError(i, "Not found", 404)
+            results[i] = dict(result, op="toggle", id=op["id"])
+        i += 1
+    return results
+
+@app.route("/api/tasks/batch", methods=["POST"])
+@login_required
+def api_batch_tasks():
+    """Apply an ordered list of add/edit/delete/toggle ops in one transaction.
+
+    Body: {"operations": [{"op": "add", "task": ..., "calendar_id": ...},
+    {"op": "edit", "id": ..., ...}, {"op": "delete", "id": ...},
+    {"op": "toggle", "id": ..., "date": ...}]}. If any op fails nothing is
+    applied and the error names its index (the first of a run of
+    consecutive edits or deletes, which go to the database together).
+    """
+    data = request.get_json(silent=True) or {}
+    operations = data.get("operations")
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"error": "operations required"}), 400
+    if len(operations) > MAX_BATCH_OPS:
+        return jsonify({"error": f"At most {MAX_BATCH_OPS} operations per batch"}), 400
+    conn, is_postgres = get_db()
+    if is_postgres:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    else:
+        cur = conn.cursor()
+    try:
+        results = run_batch(cur, is_postgres, current_user.id, operations)
+    except BatchError as e:
+        conn.rollback(); cur.close()
+        return jsonify({"error": e.message, "index": e.index}), e.status
+    cache.bump_version(cur, is_postgres, current_user.id)
+    conn.commit(); cur.close()
+    return jsonify({"success": True, "results": results})
+
+TRANSFER_FORMATS = {"csv": (transfer.parse_csv, transfer.export_csv, "text/csv"),
+                    "ics": (transfer.parse_ics, transfer.export_ics, "text/calendar")}
+
+def transfer_format(fmt, filename=""):
+    if not fmt and filename:
+        fmt = filename.rsplit(".", 1)[-1]
+    fmt = (fmt or "csv").lower()
+    return fmt if fmt in TRANSFER_FORMATS else None
+
+def import_into(conn, is_postgres, user_id, calendar_id, stream, fmt):
+    stats = transfer.ImportStats()
+    parse = TRANSFER_FORMATS[fmt][0]
+    try:
+        transfer.import_tasks(conn, is_postgres, user_id, calendar_id, parse(stream, stats), stats)
+    finally:
+        # Chunks are committed as they go, so a failed import still leaves
+        # the earlier ones in place.
+        cur = conn.cursor()
+        if STATS_COUNTERS:
+            rebuild_folder_stats(cur, is_postgres, calendar_id)
+        rollups.rebuild_folder(cur, is_postgres, user_id, calendar_id)
+        cache.bump_version(cur, is_postgres, user_id)
+        conn.commit(); cur.close()
+    return stats
+
+def export_from(conn, is_postgres, user_id, calendar, fmt):
+    rows = transfer.iter_tasks(conn, is_postgres, user_id, calendar["id"])
+    if fmt == "ics":
+        return transfer.export_ics(rows, calendar["name"])
+    return transfer.export_csv(rows)
+
+def find_calendar(cur, is_postgres, calendar_id, user_id):
+    query(cur, is_postgres, "SELECT * FROM folders WHERE id = %s AND user_id = %s", (calendar_id, user_id))
+    return cur.fetchone()
+
+@app.route("/api/calendar/<int:calendar_id>/import", methods=["POST"])
+@login_required
+def import_calendar(calendar_id):
+    """Bulk-import tasks from a CSV or iCalendar upload (multipart 'file' or raw body)."""
+    upload = request.files.get("file")
+    fmt = transfer_format(request.args.get("format"), upload.filename if upload else "")
+    if not fmt:
+        return jsonify({"error": "format must be csv or ics"}), 400
+    conn, is_postgres = get_db()
+    cur = conn.cursor()
+    found = find_calendar(cur, is_postgres, calendar_id, current_user.id)
+    cur.close()
+    if not found:
+        return jsonify({"error": "Not found"}), 404
+    raw = upload.stream if upload else request.stream
+    stream = io.TextIOWrapper(raw, encoding="utf-8-sig", errors="replace", newline="")
+    stats = import_into(conn, is_postgres, current_user.id, calendar_id, stream, fmt)
+    return jsonify(dict(stats.as_dict(), success=True))
+
+@app.route("/api/calendar/<int:calendar_id>/export")
+@login_required
+def export_calendar(calendar_id):
+    fmt = transfer_format(request.args.get("format"))
+    if not fmt:
+        return jsonify({"error": "format must be csv or ics"}), 400
+    conn, is_postgres = get_db()
+    if is_postgres:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    else:
+        cur = conn.cursor()
+    calendar = find_calendar(cur, is_postgres, calendar_id, current_user.id)
+    cur.close()
+    if not calendar:
+        return jsonify({"error": "Not found"}), 404
+    body = export_from(conn, is_postgres, current_user.id, calendar, fmt)
+    filename = f"calendar-{calendar_id}.{fmt}"
+    return Response(stream_with_context(body), mimetype=TRANSFER_FORMATS[fmt][2],
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+def cli_calendar(cur, is_postgres, username, calendar_name, create=False):
+    query(cur, is_postgres, "SELECT id FROM users WHERE username = %s", (username,))
+    user = cur.fetchone()
+    if not user:
+        raise click.ClickException(f"No such user: {username}")
+    query(cur, is_postgres, "SELECT * FROM folders WHERE user_id = %s AND name = %s ORDER BY id", (user["id"], calendar_name))
+    calendar = cur.fetchone()
+    if not calendar and create:
+        query(cur, is_postgres, "INSERT INTO folders (name, user_id) VALUES (%s, %s)", (calendar_name, user["id"]))
+        query(cur, is_postgres, "SELECT * FROM folders WHERE user_id = %s AND name = %s ORDER BY id", (user["id"], calendar_name))
+        calendar = cur.fetchone()
+    if not calendar:
+        raise click.ClickException(f"No calendar named {calendar_name!r} for {username}")
+    return user["id"], calendar
+
+@app.cli.command("import-tasks")
+@click.argument("username")
+@click.argument("calendar_name")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(list(TRANSFER_FORMATS)), help="Defaults to the file extension.")
+def import_tasks_command(username, calendar_name, path, fmt):
+    """Import a CSV or iCalendar file into a user's calendar (created if missing)."""
+    fmt = transfer_format(fmt, path)
+    if not fmt:
+        raise click.ClickException("Cannot tell the format; pass --format")
+    conn, is_postgres = get_db()
+    if is_postgres:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    else:
+        cur = conn.cursor()
+    user_id, calendar = cli_calendar(cur, is_postgres, username, calendar_name, create=True)
+    conn.commit(); cur.close()
+    with open(path, encoding="utf-8-sig", errors="replace", newline="") as f:
+        stats = import_into(conn, is_postgres, user_id, calendar["id"], f, fmt)
+    print(stats.as_dict())
+
+@app.cli.command("export-tasks")
+@click.argument("username")
+@click.argument("calendar_name")
+@click.argument("path", type=click.Path(dir_okay=False, allow_dash=True))
+@click.option("--format", "fmt", type=click.Choice(list(TRANSFER_FORMATS)), help="Defaults to the file extension.")
+def export_tasks_command(username, calendar_name, path, fmt):
+    """Export a user's calendar as CSV or iCalendar ('-' for stdout)."""
+    fmt = transfer_format(fmt, "" if path == "-" else path)
+    if not fmt:
+        raise click.ClickException("Cannot tell the format; pass --format")
+    conn, is_postgres = get_db()
+    if is_postgres:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    else:
+        cur = conn.cursor()
+    user_id, calendar = cli_calendar(cur, is_postgres, username, calendar_name)
+    cur.close()
+    out = sys.stdout if path == "-" else open(path, "w", encoding="utf-8", newline="")
+    try:
+        for chunk in export_from(conn, is_postgres, user_id, calendar, fmt):
+            out.write(chunk)
+    finally:
+        if out is not sys.stdout:
+            out.close()
 
 @app.route("/register", methods=["GET", "POST"])
 def register():
     if request.method == "POST":
         username = request.form.get("username")
         password = request.form.get("password")
-        hashed_password = bcrypt.generate_password_hash(password).decode("utf-8")
+        try:
+            hashed_password = hash_pool.hash(password)
+        except passwords.HashPoolBusy:
+            flash("The server is busy, please try again in a moment.", "error")
+            return render_template("register.html"), 503
         try:
             conn, is_postgres = get_db()
             cur = conn.cursor()
             query(cur, is_postgres, "INSERT INTO users (username, password) VALUES (%s, %s)", (username, hashed_password))
-            conn.commit(); cur.close(); conn.close()
+            conn.commit(); cur.close()
             flash("Account created! Please log in.", "success")
             return redirect(url_for("login"))
         except:
@@ -464,8 +1077,23 @@ def login():
         else:
             cur = conn.cursor()
         query(cur, is_postgres, "SELECT * FROM users WHERE username = %s", (username,))
-        user = cur.fetchone(); cur.close(); conn.close()
-        if user and bcrypt.check_password_hash(user["password"], password):
+        user = cur.fetchone(); cur.close()
+        try:
+            ok = user is not None and hash_pool.check(user["password"], password)
+        except passwords.HashPoolBusy:
+            flash("The server is busy, please try again in a moment.", "error")
+            return render_template("login.html"), 503
+        if ok and hash_pool.needs_rehash(user["password"]):
+            # Upgrade (or downgrade) the stored hash to the configured cost
+            # while we have the plaintext; skipped if the pool is saturated.
+            try:
+                cur = conn.cursor()
+                query(cur, is_postgres, "UPDATE users SET password = %s WHERE id = %s",
+                      (hash_pool.hash(password), user["id"]))
+                conn.commit(); cur.close()
+            except passwords.HashPoolBusy:
+                pass
+        if ok:
             login_user(User(user["id"], user["username"], user["email"] if "email" in user.keys() else None))
             return redirect(url_for("home"))
         flash("Incorrect username or password.", "error")
@@ -478,4 +1106,6 @@ def logout():
     return redirect(url_for("login"))
 
 if __name__ == "__main__":
+    with app.app_context():
+        migrations.migrate(*get_db())
     app.run(debug=False)
\ No newline at end of file
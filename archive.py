@@ -0,0 +1,182 @@
+"""Archival of finished tasks and old completion history.
+
+Done tasks due before the horizon (``after_days`` before today) move from
+``tasks`` to ``archived_tasks``, and completion bitmaps of years that ended
+before it move to ``archived_completions``. Rows are moved a chunk per
+transaction, so the job never holds locks for long and can be interrupted
+at any point. Folders keep a count of their archived tasks so calendar
+totals do not change.
+
+Views of the current period only read the live tables; windows reaching
+back before the horizon and ``/api/archive`` read the archive as well.
+Deleting a calendar goes through the same chunked deletion.
+"""
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+
+import cache
+import completions
+from db import decode_cursor, encode_cursor, placeholders, sql
+from reminders import claim_run, finish_run, owner_id
+
+JOB = "archive"
+BATCH_SIZE = 500
+TASK_FIELDS = "id, task, user_id, folder_id, due_date, due_time, due_time_end, recurrence, done, created_on"
+
+
+def horizon(after_days, today=None):
+    return (today or date.today()) - timedelta(days=after_days)
+
+def in_batches(conn, is_postgres, select, params, apply, batch_size=BATCH_SIZE, pause=0):
+    """Call ``apply(cur, rows)`` on chunks of ``select`` until it returns no
+    rows, committing after each; ``apply`` must take its rows out of the
+    result. Returns the number of rows processed."""
+    cur = conn.cursor()
+    total = 0
+    try:
+        while True:
+            cur.execute(sql(is_postgres, select + " LIMIT %s"), (*params, batch_size))
+            rows = [completions.values(row) for row in cur.fetchall()]
+            if not rows:
+                return total
+            apply(cur, rows)
+            conn.commit()
+            total += len(rows)
+            if pause:
+                time.sleep(pause)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def move_completions(cur, is_postgres, keys):
+    """Move the given (task_id, year) bitmaps into archived_completions,
+    merging with any bits already archived for the same year."""
+    task_ids = sorted({task_id for task_id, _ in keys})
+    cur.execute(sql(is_postgres, f"SELECT task_id, year, days FROM completion_bitmaps WHERE task_id IN ({placeholders(task_ids)})"),
+                task_ids)
+    moved = {(task_id, year): bytearray(days) for task_id, year, days in map(completions.values, cur.fetchall())
+             if (task_id, year) in keys}
+    cur.execute(sql(is_postgres, f"SELECT task_id, year, days FROM archived_completions WHERE task_id IN ({placeholders(task_ids)})"),
+                task_ids)
+    for task_id, year, days in map(completions.values, cur.fetchall()):
+        if (task_id, year) in moved:
+            bits = moved[(task_id, year)]
+            for i, byte in enumerate(days):
+                bits[i] |= byte
+    cur.executemany(sql(is_postgres, """
+        INSERT INTO archived_completions (task_id, year, days) VALUES (%s, %s, %s)
+        ON CONFLICT (task_id, year) DO UPDATE SET days = excluded.days"""),
+        [(task_id, year, bytes(days)) for (task_id, year), days in moved.items()])
+    cur.executemany(sql(is_postgres, "DELETE FROM completion_bitmaps WHERE task_id = %s AND year = %s"), list(moved))
+
+def archive_tasks(cur, is_postgres, rows, counters=False):
+    # rows: (id, folder_id, user_id) of done tasks.
+    ids = [row[0] for row in rows]
+    cur.execute(sql(is_postgres, f"""
+        INSERT INTO archived_tasks ({TASK_FIELDS}, archived_at)
+        SELECT {TASK_FIELDS}, %s FROM tasks WHERE id IN ({placeholders(ids)})"""),
+        [datetime.now(timezone.utc).isoformat()] + ids)
+    cur.execute(sql(is_postgres, f"SELECT task_id, year FROM completion_bitmaps WHERE task_id IN ({placeholders(ids)})"), ids)
+    keys = {completions.values(row) for row in cur.fetchall()}
+    if keys:
+        move_completions(cur, is_postgres, keys)
+    cur.execute(sql(is_postgres, f"DELETE FROM tasks WHERE id IN ({placeholders(ids)})"), ids)
+    per_folder = sorted(Counter(row[1] for row in rows if row[1]).items())
+    cur.executemany(sql(is_postgres, "UPDATE folders SET archived_done = archived_done + %s WHERE id = %s"),
+                    [(n, folder_id) for folder_id, n in per_folder])
+    if counters:
+        # Archived tasks are all done, so folder_due_counts is unaffected.
+        cur.executemany(sql(is_postgres, "UPDATE folder_stats SET total = total - %s, done = done - %s WHERE folder_id = %s"),
+                        [(n, n, folder_id) for folder_id, n in per_folder])
+    for user_id in sorted({row[2] for row in rows}):
+        cache.bump_version(cur, is_postgres, user_id)
+
+def run(conn, is_postgres, after_days, batch_size=BATCH_SIZE, pause=0, counters=False, owner=None, force=False):
+    """Archive everything past the horizon; needs an app context.
+
+    Returns (tasks, completion years) moved, or None when another process
+    owns today's run.
+    """
+    owner = owner or owner_id()
+    run_key = date.today().isoformat()
+    if not force and not claim_run(conn, is_postgres, run_key, owner, job=JOB):
+        return None
+    cutoff = horizon(after_days)
+    tasks = in_batches(conn, is_postgres, """
+        SELECT id, folder_id, user_id FROM tasks
+        WHERE done = 1 AND due_date IS NOT NULL AND due_date != '' AND due_date < %s""", (cutoff.isoformat(),),
+        lambda cur, rows: archive_tasks(cur, is_postgres, rows, counters), batch_size, pause)
+    years = in_batches(conn, is_postgres, "SELECT task_id, year FROM completion_bitmaps WHERE year < %s", (cutoff.year,),
+                       lambda cur, rows: move_completions(cur, is_postgres, set(rows)), batch_size, pause)
+    if not force:
+        finish_run(conn, is_postgres, run_key, owner, tasks, None, job=JOB)
+    return tasks, years
+
+
+def delete_folder(conn, is_postgres, folder_id, user_id, batch_size=BATCH_SIZE):
+    """Delete a folder's live and archived tasks a chunk per transaction."""
+    for tasks_table, completions_table in (("tasks", "completion_bitmaps"), ("archived_tasks", "archived_completions")):
+        def apply(cur, rows, tasks_table=tasks_table, completions_table=completions_table):
+            ids = [row[0] for row in rows]
+            cur.execute(sql(is_postgres, f"DELETE FROM {completions_table} WHERE task_id IN ({placeholders(ids)})"), ids)
+            cur.execute(sql(is_postgres, f"DELETE FROM {tasks_table} WHERE id IN ({placeholders(ids)})"), ids)
+            cache.bump_version(cur, is_postgres, user_id)
+        in_batches(conn, is_postgres, f"SELECT id FROM {tasks_table} WHERE folder_id = %s AND user_id = %s",
+                   (folder_id, user_id), apply, batch_size)
+
+
+def load_window(cur, is_postgres, user_id, folder_id, start, end, task_ids):
+    """Archived tasks that can land in [start, end), and the archived
+    completions of those and of ``task_ids``, for calendar windows that
+    reach back past the horizon."""
+    cur.execute(sql(is_postgres, f"""
+        SELECT {TASK_FIELDS}, archived_at FROM archived_tasks WHERE folder_id = %s AND user_id = %s
+        AND due_date IS NOT NULL AND due_date != '' AND due_date < %s
+        AND (due_date >= %s OR (recurrence IS NOT NULL AND recurrence != 'none'))"""),
+        (folder_id, user_id, end.isoformat(), start.isoformat()))
+    tasks = cur.fetchall()
+    ids = sorted(set(task_ids) | {task["id"] for task in tasks})
+    if not ids:
+        return tasks, completions.Completions()
+    cur.execute(sql(is_postgres, f"""
+        SELECT task_id, year, days FROM archived_completions
+        WHERE year >= %s AND year <= %s AND task_id IN ({placeholders(ids)})"""),
+        [start.year, (end - timedelta(days=1)).year] + ids)
+    return tasks, completions.Completions(completions.values(row) for row in cur.fetchall())
+
+def decode_browse_cursor(cursor):
+    """(due_date, task_id) from a ``browse`` cursor; raises ValueError if garbled."""
+    return decode_cursor(cursor, str, int)
+
+def browse(cur, is_postgres, user_id, folder_id, start=None, end=None, limit=50, cursor=None):
+    """One page of a folder's archived tasks, latest due first, each with
+    its archived ``completed_dates``. Returns (rows, next_cursor)."""
+    filters, params = "", [folder_id, user_id]
+    if start is not None:
+        filters += " AND due_date >= %s"; params.append(start.isoformat())
+    if end is not None:
+        filters += " AND due_date < %s"; params.append(end.isoformat())
+    if cursor:
+        due_date, task_id = decode_browse_cursor(cursor)
+        filters += " AND (due_date < %s OR (due_date = %s AND id < %s))"; params += [due_date, due_date, task_id]
+    cur.execute(sql(is_postgres, f"""
+        SELECT {TASK_FIELDS}, archived_at FROM archived_tasks WHERE folder_id = %s AND user_id = %s{filters}
+        ORDER BY due_date DESC, id DESC LIMIT %s"""), params + [limit + 1])
+    rows = [dict(row) for row in cur.fetchall()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["due_date"], rows[-1]["id"])
+    ids = [row["id"] for row in rows if row["recurrence"] and row["recurrence"] != "none"]
+    done = completions.Completions()
+    if ids:
+        cur.execute(sql(is_postgres, f"SELECT task_id, year, days FROM archived_completions WHERE task_id IN ({placeholders(ids)})"),
+                    ids)
+        done = completions.Completions(completions.values(row) for row in cur.fetchall())
+    for row in rows:
+        row["completed_dates"] = [d.isoformat() for d in done.dates(row["id"], start, end)]
+    return rows, next_cursor
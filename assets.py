@@ -0,0 +1,173 @@
+"""Fingerprinted static assets and response compression.
+
+Files under ``static/`` are served from ``/assets/<name>.<hash>.<ext>``,
+where the hash is taken from the content, so they can be cached by
+browsers forever (``immutable``): a changed file gets a new URL. Templates
+link them with ``asset_url('calendar.js')``. Each asset is compressed once,
+when the manifest is built, with gzip and, if the ``brotli`` package is
+installed, brotli.
+
+``Compressor`` gzips or brotli-compresses other text responses (pages,
+JSON) on the fly. Responses with an ETag, which includes everything served
+by the response cache, keep their compressed bodies in an LRU so a cache
+hit is not compressed again.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import Response, abort, request
+
+from cache import LRUCache
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only without it
+    brotli = None
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+COMPRESSIBLE = ("text/", "application/json", "application/javascript", "image/svg+xml")
+
+
+def encodings():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+def compress(data, encoding, static=False):
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if static else 5)
+    return gzip.compress(data, compresslevel=9 if static else 6, mtime=0)
+
+def choose_encoding(available):
+    """Best of ``available`` that the client accepts, or None."""
+    accepted = request.accept_encodings
+    for encoding in available:
+        if accepted[encoding]:
+            return encoding
+    return None
+
+
+class Asset:
+    __slots__ = ("name", "url_name", "mimetype", "etag", "variants")
+
+    def __init__(self, name, data):
+        digest = hashlib.sha256(data).hexdigest()
+        stem, ext = os.path.splitext(name)
+        self.name = name
+        self.url_name = f"{stem}.{digest[:12]}{ext}"
+        self.mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        self.etag = digest[:24]
+        self.variants = {None: data}
+        if self.mimetype.startswith(COMPRESSIBLE):
+            for encoding in encodings():
+                compressed = compress(data, encoding, static=True)
+                if len(compressed) < len(data):
+                    self.variants[encoding] = compressed
+
+
+class Assets:
+
+    def __init__(self, app=None, url_prefix="/assets"):
+        self.url_prefix = url_prefix
+        self.folder = None
+        self.debug = False
+        self.by_name = {}
+        self.by_url = {}
+        self.digest = ""  # changes whenever any asset does
+        self._mtimes = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.folder = app.static_folder
+        self.debug = app.debug
+        self.load()
+        app.add_url_rule(f"{self.url_prefix}/<path:filename>", "asset", self.view)
+        app.jinja_env.globals["asset_url"] = self.url
+
+    def load(self):
+        by_name, mtimes = {}, {}
+        for dirpath, _, filenames in os.walk(self.folder):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.folder).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    by_name[name] = Asset(name, f.read())
+                mtimes[name] = os.path.getmtime(path)
+        digest = hashlib.sha256(" ".join(sorted(a.url_name for a in by_name.values())).encode()).hexdigest()[:12]
+        with self._lock:
+            self.by_name, self._mtimes = by_name, mtimes
+            self.by_url = {asset.url_name: asset for asset in by_name.values()}
+            self.digest = digest
+
+    def _changed(self):
+        try:
+            return any(os.path.getmtime(os.path.join(self.folder, name)) != mtime
+                       for name, mtime in self._mtimes.items())
+        except OSError:
+            return True
+
+    def url(self, name):
+        if self.debug and self._changed():
+            self.load()
+        return f"{self.url_prefix}/{self.by_name[name].url_name}"
+
+    def view(self, filename):
+        asset = self.by_url.get(filename)
+        if asset is None:
+            abort(404)
+        encoding = choose_encoding([e for e in encodings() if e in asset.variants])
+        if request.if_none_match.contains_weak(asset.etag):
+            response = Response(status=304)
+        else:
+            response = Response(asset.variants[encoding], mimetype=asset.mimetype)
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+        response.set_etag(asset.etag)
+        response.headers["Cache-Control"] = IMMUTABLE
+        response.vary.add("Accept-Encoding")
+        return response
+
+
+class Compressor:
+    """Compress text responses of at least ``min_size`` bytes."""
+
+    def __init__(self, app=None, enabled=True, min_size=500, store=None):
+        self.enabled = enabled
+        self.min_size = min_size
+        self.store = store if store is not None else LRUCache(8 * 2**20)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self.enabled:
+            app.after_request(self.after_request)
+
+    def after_request(self, response):
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or "Content-Encoding" in response.headers
+                or not (response.mimetype or "").startswith(COMPRESSIBLE)):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = choose_encoding(encodings())
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        etag, weak = response.get_etag()
+        key = f"{encoding}:{etag}" if etag else None
+        compressed = self.store.get(key) if key else None
+        if compressed is None:
+            compressed = compress(data, encoding)
+            if key:
+                self.store.set(key, compressed, len(compressed) + len(key))
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = encoding
+        if etag and not weak:
+            # The compressed body is a different representation of the
+            # same content.
+            response.set_etag(etag, weak=True)
+        return response
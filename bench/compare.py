@@ -0,0 +1,43 @@
+"""Compare two ``python -m bench`` reports route by route.
+
+    python -m bench.compare base.json head.json --threshold 0.15
+
+Prints p50/p95/p99 for both runs and the relative change, and exits with
+status 1 if any route's p95 got slower by more than ``--threshold``.
+"""
+import argparse
+import json
+import sys
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed relative p95 increase")
+    args = parser.parse_args(argv)
+    with open(args.base) as f:
+        base = json.load(f)["routes"]
+    with open(args.head) as f:
+        head = json.load(f)["routes"]
+
+    regressed = []
+    print(f"{'route':<18}{'p50':>18}{'p95':>18}{'p99':>18}{'p95 change':>12}")
+    for route in sorted(set(base) | set(head)):
+        b, h = base.get(route), head.get(route)
+        if not b or not h:
+            print(f"{route:<18} only in {'head' if h else 'base'}")
+            continue
+        cells = "".join(f"{b[k]:>8.1f} → {h[k]:<7.1f}" for k in ("p50_ms", "p95_ms", "p99_ms"))
+        change = (h["p95_ms"] - b["p95_ms"]) / b["p95_ms"] if b["p95_ms"] else 0.0
+        print(f"{route:<18}{cells}{change:>+11.0%}")
+        if change > args.threshold:
+            regressed.append(route)
+    if regressed:
+        print(f"p95 regressed by more than {args.threshold:.0%}: {', '.join(regressed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""Seeded synthetic data for the benchmarks.
+
+``generate`` fills an empty, migrated database (SQLite or Postgres) with
+``users`` users, each owning ``calendars`` calendars of ``tasks`` tasks.
+Due dates cluster around today, a share of tasks recur, and past
+occurrences have a realistic completion history. The same seed always
+produces the same data.
+"""
+import random
+from datetime import date, timedelta
+
+import psycopg2.extras
+
+import completions
+import passwords
+import recurrence
+from db import sql
+
+PASSWORD = "benchmark"
+CALENDAR_NAMES = ["Work", "Home", "Gym", "Family", "Study", "Errands", "Health", "Side project"]
+WORDS = ["call", "email", "review", "plan", "buy", "fix", "clean", "write", "read", "book",
+         "pay", "renew", "prepare", "send", "check", "update", "water", "walk", "cook", "visit"]
+OBJECTS = ["report", "invoice", "plants", "dentist", "slides", "groceries", "car", "budget",
+           "newsletter", "garden", "tickets", "laundry", "notes", "backup", "insurance"]
+# Weights roughly follow what users actually create: mostly one-off tasks.
+RECURRENCE_MIX = [("none", 70), ("daily", 5), ("weekly", 12), ("monthly", 8), ("monthly_weekday", 5)]
+SAMPLE_TASKS = 50  # task handles kept per user for the session driver
+
+
+def insert_returning_id(cur, is_postgres, statement, params):
+    if is_postgres:
+        cur.execute(statement + " RETURNING id", params)
+        return cur.fetchone()[0]
+    cur.execute(sql(is_postgres, statement), params)
+    return cur.lastrowid
+
+def executemany(cur, is_postgres, statement, rows):
+    if is_postgres:
+        psycopg2.extras.execute_batch(cur, statement, rows, page_size=500)
+    else:
+        cur.executemany(sql(is_postgres, statement), rows)
+
+def pick_recurrence(rng, due):
+    kind = rng.choices([k for k, _ in RECURRENCE_MIX], [w for _, w in RECURRENCE_MIX])[0]
+    if kind != "monthly_weekday":
+        return kind
+    js_dow = (due.weekday() + 1) % 7
+    occ = "last" if due.day + 7 > 28 and rng.random() < 0.5 else str((due.day - 1) // 7 + 1)
+    return f"monthly_weekday_{occ}_{js_dow}"
+
+def make_task(rng, today, past_days, future_days):
+    due = today + timedelta(days=rng.randint(-past_days, future_days))
+    rule = pick_recurrence(rng, due)
+    if rng.random() < 0.5:
+        hour = rng.randint(7, 20)
+        due_time = f"{hour:02d}:{rng.choice(['00', '15', '30', '45'])}"
+        due_time_end = f"{hour + 1:02d}:00" if rng.random() < 0.4 else ""
+    else:
+        due_time = due_time_end = ""
+    if rule == "none":
+        done = 1 if rng.random() < (0.85 if due < today else 0.05) else 0
+    else:
+        done = 0
+    name = f"{rng.choice(WORDS).capitalize()} {rng.choice(OBJECTS)}"
+    return name, due, due_time, due_time_end, rule, done
+
+def completions_for(rng, task_id, due, rule, today, history_days, rate):
+    start = max(due, today - timedelta(days=history_days))
+    return [(task_id, d.isoformat()) for d in recurrence.expand(due, rule, start, today)
+            if rng.random() < rate]
+
+def generate(conn, is_postgres, users=50, calendars=3, tasks=40, seed=1, rounds=12,
+             past_days=180, future_days=60, history_days=90, completion_rate=0.7, email_share=0.6):
+    """Populate the database; return a description of what was created.
+
+    The result has ``counts`` and a ``users`` list with each user's
+    username, calendar ids and a sample of (task_id, due_date, recurrence)
+    for the session driver. Every user's password is ``PASSWORD``.
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    pw_hash = passwords.hash_password(PASSWORD, rounds)
+    cur = conn.cursor()
+    created = []
+    counts = {"users": 0, "calendars": 0, "tasks": 0, "completions": 0}
+    for u in range(users):
+        email = f"user{u}@example.test" if rng.random() < email_share else None
+        user_id = insert_returning_id(cur, is_postgres, "INSERT INTO users (username, password, email) VALUES (%s, %s, %s)",
+                                      (f"user{u}", pw_hash, email))
+        entry = {"username": f"user{u}", "calendars": [], "tasks": []}
+        for c in range(calendars):
+            name = CALENDAR_NAMES[c % len(CALENDAR_NAMES)]
+            folder_id = insert_returning_id(cur, is_postgres, "INSERT INTO folders (name, user_id) VALUES (%s, %s)",
+                                            (name, user_id))
+            entry["calendars"].append(folder_id)
+            rows = [make_task(rng, today, past_days, future_days) for _ in range(tasks)]
+            for name, due, due_time, due_time_end, rule, done in rows:
+                task_id = None
+                if rule != "none":
+                    # Recurring tasks need their id for the completion history.
+                    task_id = insert_returning_id(cur, is_postgres, """
+                        INSERT INTO tasks (task, user_id, folder_id, due_date, due_time, due_time_end, recurrence, done)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""",
+                        (name, user_id, folder_id, due.isoformat(), due_time, due_time_end, rule, done))
+                    done_dates = completions_for(rng, task_id, due, rule, today, history_days, completion_rate)
+                    completions.add_dates(cur, is_postgres, done_dates)
+                    counts["completions"] += len(done_dates)
+                    if len(entry["tasks"]) < SAMPLE_TASKS:
+                        entry["tasks"].append((task_id, due.isoformat(), rule))
+            executemany(cur, is_postgres, """
+                INSERT INTO tasks (task, user_id, folder_id, due_date, due_time, due_time_end, recurrence, done)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""",
+                [(name, user_id, folder_id, due.isoformat(), due_time, due_time_end, rule, done)
+                 for name, due, due_time, due_time_end, rule, done in rows if rule == "none"])
+            counts["tasks"] += len(rows)
+        counts["users"] += 1
+        counts["calendars"] += calendars
+        conn.commit()
+        created.append(entry)
+    # One-off task ids come back in one query per user rather than per row.
+    for entry in created:
+        room = SAMPLE_TASKS - len(entry["tasks"])
+        if room <= 0:
+            continue
+        cur.execute(sql(is_postgres, """
+            SELECT tasks.id, tasks.due_date FROM tasks JOIN users ON users.id = tasks.user_id
+            WHERE users.username = %s AND tasks.recurrence = 'none' ORDER BY tasks.id LIMIT %s"""),
+            (entry["username"], room))
+        entry["tasks"].extend((row[0], row[1], "none") for row in cur.fetchall())
+    cur.close()
+    return {"counts": counts, "users": created}
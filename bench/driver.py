@@ -0,0 +1,279 @@
+"""Replay user sessions against the app and report per-route latency.
+
+    python -m bench --users 50 --sessions 200 --concurrency 8
+    python -m bench --transport gunicorn --gunicorn-workers 4 --out head.json
+    python -m bench.compare base.json head.json
+
+Data is generated into SQLITE_PATH (a fresh temporary file unless
+``--db`` is given) or into the Postgres database named by DATABASE_URL,
+which must be empty apart from the schema. Each session logs in, opens the
+home page, views a calendar, fetches the month, its stats and a few days'
+tasks, and toggles a task on and off again so the data set does not drift.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, timedelta
+
+from bench import data
+from bench.report import summary
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestClientTransport:
+    """In-process requests through Flask's test client."""
+
+    name = "test-client"
+
+    def __init__(self, app):
+        self.app = app
+
+    def session(self):
+        client = self.app.test_client()
+
+        def request(method, path, form=None, json_body=None):
+            return client.open(path, method=method, data=form, json=json_body).status_code
+        return request
+
+    def close(self):
+        pass
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HTTPTransport:
+    """Real HTTP against ``base_url``; redirects are not followed, so each
+    sample is one request."""
+
+    name = "http"
+
+    def __init__(self, base_url, process=None):
+        self.base_url = base_url.rstrip("/")
+        self.process = process
+
+    def session(self):
+        opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+        def request(method, path, form=None, json_body=None):
+            body, headers = None, {}
+            if json_body is not None:
+                body, headers = json.dumps(json_body).encode(), {"Content-Type": "application/json"}
+            elif form is not None:
+                body = urllib.parse.urlencode(form).encode()
+            req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+            try:
+                with opener.open(req, timeout=60) as resp:
+                    resp.read()
+                    return resp.status
+            except urllib.error.HTTPError as e:
+                e.read()
+                return e.code
+        return request
+
+    def close(self):
+        if self.process:
+            self.process.terminate()
+            self.process.wait(timeout=30)
+
+    @classmethod
+    def gunicorn(cls, workers, threads, env):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "--workers", str(workers), "--threads", str(threads),
+             "--bind", f"127.0.0.1:{port}", "--log-level", "warning", "app:app"],
+            cwd=ROOT, env=env)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                return cls(f"http://127.0.0.1:{port}", process)
+            except OSError:
+                time.sleep(0.2)
+        process.terminate()
+        raise RuntimeError("gunicorn did not start listening within 30s")
+
+
+class Recorder:
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def timed(self, route, fn, *args, expect=(200,), **kwargs):
+        started = time.perf_counter()
+        status = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.samples.setdefault(route, []).append(elapsed)
+            if status not in expect:
+                self.errors[route] = self.errors.get(route, 0) + 1
+        return status
+
+    def routes(self, seconds):
+        return {route: {"count": len(values), "errors": self.errors.get(route, 0),
+                        "rps": round(len(values) / seconds, 1) if seconds else None, **summary(values)}
+                for route, values in sorted(self.samples.items())}
+
+
+def run_session(request, user, rng, recorder, days_per_session):
+    timed = recorder.timed
+    timed("login", request, "POST", "/login", form={"username": user["username"], "password": data.PASSWORD},
+          expect=(302,))
+    timed("home", request, "GET", "/")
+    calendar_id = rng.choice(user["calendars"])
+    timed("view_calendar", request, "GET", f"/calendar/{calendar_id}")
+    month = date.today().replace(day=1)
+    next_month = (month + timedelta(days=32)).replace(day=1)
+    timed("api_occurrences", request, "GET",
+          f"/api/occurrences?calendar_id={calendar_id}&start={month.isoformat()}&end={next_month.isoformat()}")
+    timed("api_stats", request, "GET", f"/api/stats?calendar_id={calendar_id}")
+    for _ in range(days_per_session):
+        day = month + timedelta(days=rng.randrange((next_month - month).days))
+        timed("api_tasks", request, "GET", f"/api/tasks?calendar_id={calendar_id}&date={day.isoformat()}")
+    if user["tasks"]:
+        task_id, due_date, _ = rng.choice(user["tasks"])
+        for _ in range(2):
+            timed("api_toggle_task", request, "POST", f"/api/task/toggle/{task_id}", json_body={"date": due_date})
+
+def drive(transport, dataset, sessions, concurrency, seed, days_per_session=3):
+    recorder = Recorder()
+    users = dataset["users"]
+    jobs = iter(range(sessions))
+    lock = threading.Lock()
+
+    def worker(n):
+        rng = random.Random(seed * 1000 + n)
+        request = transport.session()
+        while True:
+            with lock:
+                i = next(jobs, None)
+            if i is None:
+                return
+            run_session(request, users[i % len(users)], rng, recorder, days_per_session)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return recorder, time.perf_counter() - started
+
+def time_reminders(todo, runs):
+    """Run the reminder pipeline against a local SMTP sink; seconds per run."""
+    import reminders
+    from bench.reminders import SinkServer
+
+    server = SinkServer(0.0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    todo.app.config.update(MAIL_SERVER="127.0.0.1", MAIL_PORT=server.server_address[1], MAIL_USE_TLS=False)
+    todo.mail.init_app(todo.app)
+    due_date = (date.today() + timedelta(days=1)).isoformat()
+    durations = []
+    with todo.app.app_context():
+        for _ in range(runs):
+            conn, is_postgres = todo.get_db()
+            cur = conn.cursor()
+            todo.query(cur, is_postgres, "DELETE FROM reminder_log WHERE reminder_date = %s", (due_date,))
+            conn.commit(); cur.close()
+            started = time.perf_counter()
+            reminders.run(todo.app, todo.mail, todo.get_db, due_date, "bench@example.test", force=True)
+            durations.append(time.perf_counter() - started)
+    server.shutdown()
+    return durations, server.received
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--calendars", type=int, default=3, help="calendars per user")
+    parser.add_argument("--tasks", type=int, default=40, help="tasks per calendar")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost of the seeded passwords")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--reminder-runs", type=int, default=1)
+    parser.add_argument("--transport", choices=["test-client", "gunicorn"], default="test-client")
+    parser.add_argument("--url", help="benchmark an already running server sharing the database")
+    parser.add_argument("--gunicorn-workers", type=int, default=4)
+    parser.add_argument("--gunicorn-threads", type=int, default=1)
+    parser.add_argument("--db", help="SQLite file to create (default: a temporary file)")
+    parser.add_argument("--out", help="write the JSON report here as well as to stdout")
+    args = parser.parse_args(argv)
+
+    if not os.environ.get("DATABASE_URL"):
+        os.environ["SQLITE_PATH"] = args.db or os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+    os.environ.pop("MAIL_USERNAME", None)
+    os.environ["BCRYPT_LOG_ROUNDS"] = str(args.rounds)
+    sys.path.insert(0, ROOT)
+    import app as todo
+    import migrations
+    import rollups
+
+    started = time.perf_counter()
+    with todo.app.app_context():
+        conn, is_postgres = todo.get_db()
+        migrations.migrate(conn, is_postgres)
+        dataset = data.generate(conn, is_postgres, args.users, args.calendars, args.tasks,
+                                seed=args.seed, rounds=args.rounds)
+        if todo.STATS_COUNTERS:
+            cur = conn.cursor()
+            todo.rebuild_folder_stats(cur, is_postgres)
+            conn.commit(); cur.close()
+        # The generator bulk-inserts past the write paths that keep these.
+        rollups.rebuild(conn, is_postgres)
+    generated_in = time.perf_counter() - started
+
+    if args.url:
+        transport = HTTPTransport(args.url)
+    elif args.transport == "gunicorn":
+        transport = HTTPTransport.gunicorn(args.gunicorn_workers, args.gunicorn_threads, dict(os.environ))
+    else:
+        transport = TestClientTransport(todo.app)
+    try:
+        recorder, seconds = drive(transport, dataset, args.sessions, args.concurrency, args.seed)
+    finally:
+        transport.close()
+    routes = recorder.routes(seconds)
+    if args.reminder_runs:
+        durations, received = time_reminders(todo, args.reminder_runs)
+        routes["send_reminders"] = {"count": len(durations), "errors": 0, "messages": received // len(durations),
+                                    **summary(durations)}
+
+    report = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "db")},
+        "backend": "postgres" if os.environ.get("DATABASE_URL") else "sqlite",
+        "transport": "http" if args.url else args.transport,
+        "dataset": dict(dataset["counts"], seconds=round(generated_in, 2)),
+        "seconds": round(seconds, 3),
+        "requests": sum(r["count"] for name, r in routes.items() if name != "send_reminders"),
+        "routes": routes,
+    }
+    report["rps"] = round(report["requests"] / seconds, 1) if seconds else None
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    return 1 if any(r["errors"] for r in routes.values()) else 0
@@ -0,0 +1,112 @@
+"""Login-storm benchmark for password hashing.
+
+    python -m bench.passwords --logins 200 --concurrency 16 --workers 2
+    python -m bench.passwords --workers 0          # hash inline, for comparison
+
+Fires ``--logins`` POST /login requests from ``--concurrency`` threads
+through the Flask test client while a bystander thread keeps fetching the
+login page, and prints login throughput, latency percentiles, 503s and the
+bystander's latency as JSON. ``--seed-rounds`` different from ``--rounds``
+exercises rehash-on-login.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from bench.report import summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=10, help="configured BCRYPT_LOG_ROUNDS")
+    parser.add_argument("--seed-rounds", type=int, default=None, help="cost of the seeded hashes (default: --rounds)")
+    parser.add_argument("--workers", type=int, default=2, help="HASH_WORKERS; 0 hashes inline")
+    parser.add_argument("--queue", type=int, default=32, help="HASH_QUEUE_MAX")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="bench-passwords-")
+    os.environ.pop("DATABASE_URL", None)
+    os.environ.pop("MAIL_USERNAME", None)
+    os.environ.update({
+        "SQLITE_PATH": os.path.join(workdir, "bench.db"), "BCRYPT_LOG_ROUNDS": str(args.rounds),
+        "HASH_WORKERS": str(args.workers), "HASH_QUEUE_MAX": str(args.queue),
+    })
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app as todo
+    import migrations
+    import passwords
+
+    seed_hash = passwords.hash_password("hunter2", args.seed_rounds or args.rounds)
+    with todo.app.app_context():
+        conn, is_postgres = todo.get_db()
+        migrations.migrate(conn, is_postgres)
+        cur = conn.cursor()
+        cur.executemany("INSERT INTO users (username, password) VALUES (?, ?)",
+                        [(f"bench{u}", seed_hash) for u in range(args.users)])
+        conn.commit(); cur.close()
+
+    # Warm up the pool so process start-up is not counted.
+    todo.app.test_client().post("/login", data={"username": "bench0", "password": "hunter2"})
+
+    latencies, statuses, bystander = [], {}, []
+    lock = threading.Lock()
+    counter = iter(range(args.logins))
+    storming = threading.Event()
+
+    def stormer():
+        client = todo.app.test_client()
+        for i in counter:
+            started = time.perf_counter()
+            resp = client.post("/login", data={"username": f"bench{i % args.users}", "password": "hunter2"})
+            elapsed = time.perf_counter() - started
+            with lock:
+                statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+                if resp.status_code == 302:
+                    latencies.append(elapsed)
+
+    def watcher():
+        client = todo.app.test_client()
+        while storming.is_set():
+            started = time.perf_counter()
+            client.get("/login")
+            bystander.append(time.perf_counter() - started)
+            time.sleep(0.01)
+
+    storming.set()
+    watch = threading.Thread(target=watcher)
+    watch.start()
+    threads = [threading.Thread(target=stormer) for _ in range(args.concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    storming.clear()
+    watch.join()
+
+    with todo.app.app_context():
+        conn, _ = todo.get_db()
+        rows = conn.execute("SELECT password FROM users").fetchall()
+    todo.hash_pool.shutdown()
+
+    print(json.dumps({
+        "rounds": args.rounds, "seed_rounds": args.seed_rounds or args.rounds, "workers": args.workers,
+        "queue": args.queue, "concurrency": args.concurrency, "logins": args.logins,
+        "seconds": round(elapsed, 3), "logins_per_sec": round(statuses.get(302, 0) / elapsed, 1),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "login_latency": summary(latencies), "bystander_latency": summary(bystander),
+        "users_at_configured_cost": sum(passwords.cost(r[0]) == args.rounds for r in rows),
+    }, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
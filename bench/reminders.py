@@ -0,0 +1,135 @@
+"""Benchmark the reminder pipeline against a local SMTP sink.
+
+    python -m bench.reminders --users 2000 --tasks 3 --workers 4 --latency 0.005
+
+Seeds a throwaway SQLite database with users who all have tasks due
+tomorrow, runs the pipeline twice (the second run must send nothing) and
+prints throughput as JSON. ``--latency`` adds a per-message delay to the
+sink to approximate a remote server.
+"""
+import argparse
+import json
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+
+class SMTPSink(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept and discard messages."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode(errors="replace").strip().upper()
+            if cmd.startswith(("EHLO", "HELO")):
+                self.reply("250 sink")
+            elif cmd == "DATA":
+                self.reply("354 end with .")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                time.sleep(self.server.latency)
+                self.server.count()
+                self.reply("250 queued")
+            elif cmd == "QUIT":
+                self.reply("221 bye")
+                return
+            elif cmd.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self.reply("250 ok")
+            else:
+                self.reply("502 not implemented")
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency):
+        super().__init__(("127.0.0.1", 0), SMTPSink)
+        self.latency = latency
+        self.received = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    def count(self):
+        with self._lock:
+            self.received += 1
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+
+def seed(conn, users, tasks_per_user, due_date):
+    cur = conn.cursor()
+    for u in range(users):
+        cur.execute("INSERT INTO users (username, password, email) VALUES (?, ?, ?)",
+                    (f"bench{u}", "x", f"bench{u}@example.com"))
+        user_id = cur.lastrowid
+        cur.execute("INSERT INTO folders (name, user_id) VALUES (?, ?)", ("Bench", user_id))
+        folder_id = cur.lastrowid
+        cur.executemany("INSERT INTO tasks (task, user_id, folder_id, due_date, due_time) VALUES (?, ?, ?, ?, ?)",
+                        [(f"task {t}", user_id, folder_id, due_date, f"{9 + t % 8:02d}:00")
+                         for t in range(tasks_per_user)])
+    conn.commit(); cur.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--tasks", type=int, default=3, help="tasks due per user")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.0, help="sink delay per message, seconds")
+    args = parser.parse_args(argv)
+
+    server = SinkServer(args.latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    workdir = tempfile.mkdtemp(prefix="bench-reminders-")
+    os.environ.pop("DATABASE_URL", None)
+    os.environ.update({
+        "SQLITE_PATH": os.path.join(workdir, "bench.db"),
+        "MAIL_SERVER": "127.0.0.1", "MAIL_PORT": str(server.server_address[1]),
+        "MAIL_USE_TLS": "0", "MAIL_USERNAME": "bench@example.com",
+    })
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app as todo
+    import migrations
+    import reminders
+
+    due_date = (date.today() + timedelta(days=1)).isoformat()
+    with todo.app.app_context():
+        conn, is_postgres = todo.get_db()
+        migrations.migrate(conn, is_postgres)
+        seed(conn, args.users, args.tasks, due_date)
+
+        started = time.perf_counter()
+        sent, failed = reminders.run(todo.app, todo.mail, todo.get_db, due_date,
+                                     "bench@example.com", workers=args.workers)
+        elapsed = time.perf_counter() - started
+        second = reminders.run(todo.app, todo.mail, todo.get_db, due_date,
+                               "bench@example.com", workers=args.workers, force=True)
+    server.shutdown()
+
+    result = {
+        "users": args.users, "tasks_per_user": args.tasks, "workers": args.workers,
+        "latency": args.latency, "sent": sent, "failed": failed,
+        "received": server.received, "smtp_connections": server.connections,
+        "seconds": round(elapsed, 3), "msgs_per_sec": round(sent / elapsed, 1) if elapsed else None,
+        "rerun_sent": second[0],
+    }
+    print(json.dumps(result, indent=2))
+    return 0 if sent == args.users and second == (0, 0) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,18 @@
+"""Latency summaries shared by the benchmarks."""
+import statistics
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def summary(values):
+    """p50/p95/p99/mean of a list of durations in seconds, as milliseconds."""
+    if not values:
+        return None
+    values = sorted(values)
+    ms = lambda v: round(v * 1000, 2)
+    return {"p50_ms": ms(percentile(values, 50)), "p95_ms": ms(percentile(values, 95)),
+            "p99_ms": ms(percentile(values, 99)), "mean_ms": ms(statistics.mean(values))}
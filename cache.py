@@ -0,0 +1,113 @@
+"""Versioned response cache for per-user read views.
+
+Every user has a data version (``data_versions`` table) that write
+endpoints bump in the same transaction as their change. A cached response
+is keyed by user, version, day and URL, so an entry can never go stale: a
+write simply moves readers on to a new key, and old entries age out of the
+LRU. Because the version lives in the database, all gunicorn workers agree
+on it; each keeps its own copy of the response bodies unless a shared
+``store`` is plugged in.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import date
+
+from flask import Response, make_response, request
+
+from db import sql
+
+
+class LRUCache:
+    """Thread-safe LRU bounded by the total size of its values in bytes.
+
+    Any object with the same ``get(key)`` / ``set(key, value, size)``
+    methods (e.g. a wrapper around memcached or Redis) can be used as the
+    ``store`` of a ``ResponseCache`` instead.
+    """
+
+    def __init__(self, max_bytes=32 * 2**20):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            self._data.move_to_end(key)
+            return item[0]
+
+    def set(self, key, value, size):
+        # One entry may not take more than a quarter of the budget.
+        if size > self.max_bytes // 4:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._data[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._data.popitem(last=False)
+                self.size -= evicted
+
+    def __len__(self):
+        return len(self._data)
+
+
+def data_version(cur, is_postgres, user_id):
+    cur.execute(sql(is_postgres, "SELECT version FROM data_versions WHERE user_id = %s"), (user_id,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+def bump_version(cur, is_postgres, user_id):
+    """Invalidate ``user_id``'s cached responses; call before committing."""
+    cur.execute(sql(is_postgres, """
+        INSERT INTO data_versions (user_id, version) VALUES (%s, 1)
+        ON CONFLICT (user_id) DO UPDATE SET version = data_versions.version + 1"""), (user_id,))
+
+
+class ResponseCache:
+
+    def __init__(self, store=None, enabled=True, build_id=None):
+        self.store = store if store is not None else LRUCache()
+        self.enabled = enabled
+        # Part of every key and ETag, so pages rendered against an older
+        # deploy (e.g. linking assets that no longer exist) are not reused.
+        self.build_id = build_id or (lambda: "")
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def respond(self, user_id, version, build):
+        """Serve the current request from cache, with ETag/304 handling.
+
+        ``build`` produces the response on a miss; only plain 200 responses
+        are stored.
+        """
+        key = f"{user_id}:{version}:{self.build_id()}:{date.today().isoformat()}:{request.full_path}"
+        etag = hashlib.sha1(key.encode()).hexdigest()[:24]
+        if request.if_none_match.contains_weak(etag):
+            self.not_modified += 1
+            return self._finish(Response(status=304), etag)
+        entry = self.store.get(key)
+        if entry is None:
+            self.misses += 1
+            response = make_response(build())
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            entry = (response.get_data(), response.headers.get("Content-Type"))
+            self.store.set(key, entry, len(entry[0]) + len(key))
+        else:
+            self.hits += 1
+        return self._finish(Response(entry[0], content_type=entry[1]), etag)
+
+    def _finish(self, response, etag):
+        response.set_etag(etag)
+        # Browsers keep the page but must revalidate it on every use.
+        response.headers["Cache-Control"] = "private, no-cache"
+        response.vary.add("Cookie")
+        return response
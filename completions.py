@@ -0,0 +1,197 @@
+"""Completion history of recurring tasks as per-year day bitmaps.
+
+``completion_bitmaps`` holds one row per (task, year). Bit ``n`` of
+``days`` (least significant bit first within each byte) is set when the
+task was checked off on day ``n`` of that year, with 1 January as day 0.
+A year takes 46 bytes however many days are done, and a single day is set,
+cleared or tested in O(1).
+"""
+import base64
+from collections import defaultdict
+from datetime import date, timedelta
+
+import recurrence
+from db import placeholders, sql
+
+YEAR_BYTES = 46  # 366 bits
+
+
+def as_date(value):
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+def day_index(d):
+    return d.toordinal() - date(d.year, 1, 1).toordinal()
+
+def empty():
+    return bytearray(YEAR_BYTES)
+
+def test_bit(bits, n):
+    return bool(bits[n >> 3] & (1 << (n & 7)))
+
+def set_bit(bits, n):
+    bits[n >> 3] |= 1 << (n & 7)
+
+def clear_bit(bits, n):
+    bits[n >> 3] &= ~(1 << (n & 7)) & 0xFF
+
+def iter_bits(bits, lo, hi):
+    """Indexes of set bits in [lo, hi), skipping empty bytes."""
+    n = lo
+    while n < hi:
+        byte = bits[n >> 3]
+        if not byte:
+            n = (n | 7) + 1
+            continue
+        if byte & (1 << (n & 7)):
+            yield n
+        n += 1
+
+def pack(flags):
+    """Bitmap of a sequence of booleans, as base64 for JSON."""
+    bits = bytearray((len(flags) + 7) // 8)
+    for n, flag in enumerate(flags):
+        if flag:
+            set_bit(bits, n)
+    return base64.b64encode(bytes(bits)).decode("ascii")
+
+def values(row):
+    # Rows may come from a RealDictCursor, a tuple cursor or sqlite3.Row.
+    return tuple(row.values()) if isinstance(row, dict) else tuple(row)
+
+
+class Completions:
+    """Bitmaps loaded for a set of tasks.
+
+    ``(task_id, day) in completions`` accepts a date or an ISO string, so
+    this can stand in for a set of (task_id, 'YYYY-MM-DD') pairs.
+    """
+
+    def __init__(self, rows=()):
+        self.bitmaps = {(task_id, year): bytes(days) for task_id, year, days in rows}
+
+    def __contains__(self, key):
+        task_id, day = key
+        try:
+            d = as_date(day)
+        except ValueError:
+            return False
+        bits = self.bitmaps.get((task_id, d.year))
+        return bits is not None and test_bit(bits, day_index(d))
+
+    def dates(self, task_id, start=None, end=None):
+        """Completed dates of ``task_id`` in [start, end), in order."""
+        for year in sorted(year for t, year in self.bitmaps if t == task_id):
+            if (start and start.year > year) or (end and end.year < year):
+                continue
+            first = date(year, 1, 1)
+            lo = day_index(start) if start and start.year == year else 0
+            hi = day_index(end) if end and end.year == year else (date(year + 1, 1, 1) - first).days
+            for n in iter_bits(self.bitmaps[(task_id, year)], lo, hi):
+                yield first + timedelta(days=n)
+
+
+def load_folder(cur, is_postgres, user_id, folder_id, start, end):
+    """Bitmaps of a folder's tasks for the years overlapping [start, end)."""
+    cur.execute(sql(is_postgres, """
+        SELECT completion_bitmaps.task_id, completion_bitmaps.year, completion_bitmaps.days
+        FROM completion_bitmaps JOIN tasks ON tasks.id = completion_bitmaps.task_id
+        WHERE tasks.folder_id = %s AND tasks.user_id = %s
+        AND completion_bitmaps.year >= %s AND completion_bitmaps.year <= %s"""),
+        (folder_id, user_id, start.year, (end - timedelta(days=1)).year))
+    return Completions(values(row) for row in cur.fetchall())
+
+def load_tasks(cur, is_postgres, task_ids, archived=False):
+    """Completions of ``task_ids``; with ``archived``, archived years too."""
+    if not task_ids:
+        return Completions()
+    statement = f"SELECT task_id, year, days FROM completion_bitmaps WHERE task_id IN ({placeholders(task_ids)})"
+    if archived:
+        statement += f" UNION ALL SELECT task_id, year, days FROM archived_completions WHERE task_id IN ({placeholders(task_ids)})"
+    cur.execute(sql(is_postgres, statement), list(task_ids) * (2 if archived else 1))
+    return Completions(values(row) for row in cur.fetchall())
+
+def locked_year(cur, is_postgres, task_id, year):
+    # The empty-row insert takes the write lock (SQLite) and FOR UPDATE the
+    # row lock (Postgres) before reading, so concurrent toggles of the same
+    # task cannot lose each other's bits.
+    cur.execute(sql(is_postgres, """
+        INSERT INTO completion_bitmaps (task_id, year, days) VALUES (%s, %s, %s)
+        ON CONFLICT (task_id, year) DO NOTHING"""), (task_id, year, bytes(empty())))
+    cur.execute(sql(is_postgres, "SELECT days FROM completion_bitmaps WHERE task_id = %s AND year = %s"
+                    + (" FOR UPDATE" if is_postgres else "")), (task_id, year))
+    bits = bytearray(values(cur.fetchone())[0])
+    if year < date.today().year:
+        # Past years may have been moved to the archive; take the bits back
+        # so they can be edited.
+        cur.execute(sql(is_postgres, "SELECT days FROM archived_completions WHERE task_id = %s AND year = %s"),
+                    (task_id, year))
+        row = cur.fetchone()
+        if row is not None:
+            for i, byte in enumerate(values(row)[0]):
+                bits[i] |= byte
+            store_year(cur, is_postgres, task_id, year, bits)
+            cur.execute(sql(is_postgres, "DELETE FROM archived_completions WHERE task_id = %s AND year = %s"),
+                        (task_id, year))
+    return bits
+
+def store_year(cur, is_postgres, task_id, year, bits):
+    cur.execute(sql(is_postgres, "UPDATE completion_bitmaps SET days = %s WHERE task_id = %s AND year = %s"),
+                (bytes(bits), task_id, year))
+
+def set_done(cur, is_postgres, task_id, day, done):
+    """Mark ``day`` done or not done; return the previous state."""
+    d = as_date(day)
+    bits = locked_year(cur, is_postgres, task_id, d.year)
+    previous = test_bit(bits, day_index(d))
+    if previous != bool(done):
+        (set_bit if done else clear_bit)(bits, day_index(d))
+        store_year(cur, is_postgres, task_id, d.year, bits)
+    return previous
+
+def toggle(cur, is_postgres, task_id, day):
+    """Flip ``day``; return True if it is now done."""
+    d = as_date(day)
+    bits = locked_year(cur, is_postgres, task_id, d.year)
+    done = not test_bit(bits, day_index(d))
+    (set_bit if done else clear_bit)(bits, day_index(d))
+    store_year(cur, is_postgres, task_id, d.year, bits)
+    return done
+
+def add_dates(cur, is_postgres, pairs):
+    """Mark many (task_id, day) pairs done, merging with stored bitmaps."""
+    grouped = defaultdict(empty)
+    for task_id, day in pairs:
+        d = as_date(day)
+        set_bit(grouped[(task_id, d.year)], day_index(d))
+    if not grouped:
+        return
+    for (task_id, year), days in load_tasks(cur, is_postgres, {t for t, _ in grouped}).bitmaps.items():
+        if (task_id, year) in grouped:
+            merged = grouped[(task_id, year)]
+            for i, byte in enumerate(days):
+                merged[i] |= byte
+    statement = sql(is_postgres, """
+        INSERT INTO completion_bitmaps (task_id, year, days) VALUES (%s, %s, %s)
+        ON CONFLICT (task_id, year) DO UPDATE SET days = excluded.days""")
+    cur.executemany(statement, [(task_id, year, bytes(days)) for (task_id, year), days in grouped.items()])
+
+def encode_window(tasks, completions, start, end):
+    """Occurrences of ``tasks`` in [start, end) as two bitmaps per task.
+
+    Returns {task_id: [occurs, done]}, each base64 with bit ``n`` standing
+    for ``start + n`` days; tasks that do not occur are left out. A daily
+    task over a month is 16 characters instead of 31 JSON objects.
+    """
+    span = (end - start).days
+    result = {}
+    for task in tasks:
+        recurring = task["recurrence"] and task["recurrence"] != "none"
+        occurs, done = [False] * span, [False] * span
+        any_day = False
+        for d in recurrence.expand(task["due_date"], task["recurrence"], start, end):
+            n = (d - start).days
+            occurs[n] = any_day = True
+            done[n] = (task["id"], d) in completions if recurring else bool(task["done"])
+        if any_day:
+            result[task["id"]] = [pack(occurs), pack(done)]
+    return result
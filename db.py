@@ -0,0 +1,230 @@
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import psycopg2
+import psycopg2.extensions
+
+
+def sql(is_postgres, statement):
+    """``statement`` with SQLite's ``?`` for ``%s`` placeholders when needed."""
+    return statement if is_postgres else statement.replace("%s", "?")
+
+def placeholders(items):
+    return ", ".join(["%s"] * len(items))
+
+def encode_cursor(*values):
+    """Opaque keyset-pagination cursor holding ``values``."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor, *types):
+    """The values of ``encode_cursor``, converted by ``types``; raises
+    ValueError if garbled."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if len(values) != len(types):
+            raise ValueError(values)
+        return tuple(convert(value) for convert, value in zip(types, values))
+    except Exception as e:
+        raise ValueError("bad cursor") from e
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PostgresPool:
+    """Bounded, thread-safe pool of psycopg2 connections.
+
+    Idle connections are health-checked with ``SELECT 1`` before being handed
+    out again if they have been sitting unused for longer than
+    ``check_after`` seconds; broken ones are discarded and replaced.
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=30, check_after=30):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_after = check_after
+        self._idle = deque()  # (conn, returned_at)
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        return psycopg2.connect(self.dsn)
+
+    def _healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - returned_at < self.check_after:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"no database connection available after {self.timeout}s")
+        try:
+            while True:
+                with self._lock:
+                    item = self._idle.pop() if self._idle else None
+                if item is None:
+                    return self._connect()
+                conn, returned_at = item
+                if self._healthy(conn, returned_at):
+                    return conn
+                self._discard(conn)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn):
+        try:
+            if not conn.closed:
+                status = conn.get_transaction_status()
+                if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                    self._discard(conn)
+                    return
+                if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        except psycopg2.Error:
+            self._discard(conn)
+        finally:
+            self._slots.release()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def closeall(self):
+        with self._lock:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+
+
+class ReplicaUnavailable(Exception):
+    pass
+
+
+class ReplicaSet:
+    """Read replicas handed out round-robin.
+
+    A replica that fails to connect (down or unreachable) is skipped for
+    ``retry_after`` seconds. One whose pool is merely exhausted stays in
+    rotation and the next replica is tried. When none is left ``getconn``
+    raises ReplicaUnavailable and the caller falls back to the primary.
+    """
+
+    def __init__(self, pools, retry_after=30):
+        self.pools = pools
+        self.retry_after = retry_after
+        self._next = 0
+        self._down_until = [0.0] * len(pools)
+        self._owners = {}  # id(conn) -> pool
+        self._lock = threading.Lock()
+
+    def getconn(self):
+        with self._lock:
+            start = self._next
+        for i in range(len(self.pools)):
+            index = (start + i) % len(self.pools)
+            with self._lock:
+                if self._down_until[index] > time.monotonic():
+                    continue
+            pool = self.pools[index]
+            try:
+                conn = pool.getconn()
+            except PoolTimeout:
+                continue  # busy, not down
+            except psycopg2.Error as e:
+                with self._lock:
+                    self._down_until[index] = time.monotonic() + self.retry_after
+                print(f"Replica {index} unavailable, skipping it for {self.retry_after}s: {e}")
+                continue
+            with self._lock:
+                self._owners[id(conn)] = pool
+                self._next = (index + 1) % len(self.pools)
+            return conn
+        raise ReplicaUnavailable("no read replica available")
+
+    def putconn(self, conn):
+        with self._lock:
+            pool = self._owners.pop(id(conn))
+        pool.putconn(conn)
+
+    def closeall(self):
+        for pool in self.pools:
+            pool.closeall()
+
+
+class SQLiteConnections:
+    """One persistent SQLite connection per thread, opened in WAL mode."""
+
+    PRAGMAS = (
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA temp_store = MEMORY",
+        "PRAGMA cache_size = -20000",
+        "PRAGMA mmap_size = 134217728",
+        "PRAGMA busy_timeout = 5000",
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def getconn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.row_factory = sqlite3.Row
+            for pragma in self.PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+        return conn
+
+    def putconn(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+
+
+def create_pool():
+    database_url = os.environ.get("DATABASE_URL")
+    if database_url:
+        pool = PostgresPool(
+            database_url,
+            minconn=int(os.environ.get("DB_POOL_MIN", 1)),
+            maxconn=int(os.environ.get("DB_POOL_MAX", 10)),
+            timeout=float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        )
+        return pool, True
+    return SQLiteConnections(os.environ.get("SQLITE_PATH", "todo.db")), False
+
+def create_replicas():
+    """ReplicaSet for the comma-separated DATABASE_REPLICA_URLS, or None."""
+    urls = [url.strip() for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+    if not urls or not os.environ.get("DATABASE_URL"):
+        return None
+    # minconn=0: a replica that is down at startup must not stop the app.
+    pools = [PostgresPool(url, minconn=0,
+                          maxconn=int(os.environ.get("DB_POOL_MAX", 10)),
+                          timeout=float(os.environ.get("DB_REPLICA_TIMEOUT", 2)))
+             for url in urls]
+    return ReplicaSet(pools, retry_after=float(os.environ.get("DB_REPLICA_RETRY_AFTER", 30)))
@@ -0,0 +1,302 @@
+"""Per-request SQL accounting, Server-Timing headers and /metrics.
+
+Connections handed out by ``get_db`` are wrapped so every ``execute`` and
+``executemany`` is counted and timed against the current request (or
+against ``<background>`` for scheduler jobs). At the end of a request the
+totals go out in a ``Server-Timing`` header and into Prometheus histograms;
+slow statements and statements repeated more than ``n_plus_one`` times in
+one request are printed.
+
+Metrics are kept per process: with several gunicorn workers each scrape
+sees the worker that served it, distinguished by the ``worker`` label.
+/metrics wants ``Authorization: Bearer <token>`` when a token is set, and
+otherwise only answers requests from the local host.
+"""
+import hmac
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as _Tally
+
+from flask import Response, abort, before_render_template, g, has_request_context, request, template_rendered
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+BACKGROUND = "<background>"
+LOCAL_ADDRS = ("127.0.0.1", "::1")
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def label_text(names, values, extra=""):
+    pairs = [f'{n}="{escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def render(self, worker):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        names = ("worker",) + self.labels
+        with self._lock:
+            items = [(k, list(v) if isinstance(v, list) else v) for k, v in self.series.items()]
+        for values, data in sorted(items):
+            lines.extend(self._lines(names, (worker,) + values, data))
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self.series[labels] = self.series.get(labels, 0) + amount
+
+    def _lines(self, names, values, total):
+        return [f"{self.name}{label_text(names, values)} {total}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labels=()):
+        # Per-bucket (not cumulative) counts, then sum and count.
+        with self._lock:
+            data = self.series.get(labels)
+            if data is None:
+                data = self.series[labels] = [0] * (len(self.buckets) + 3)
+            data[bisect_left(self.buckets, value)] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def _lines(self, names, values, data):
+        lines, cumulative = [], 0
+        for bound, n in zip(self.buckets + ("+Inf",), data):
+            cumulative += n
+            le = 'le="%s"' % bound
+            lines.append(f"{self.name}_bucket{label_text(names, values, le)} {cumulative}")
+        lines.append(f"{self.name}_sum{label_text(names, values)} {data[-2]:.6f}")
+        lines.append(f"{self.name}_count{label_text(names, values)} {data[-1]}")
+        return lines
+
+
+class RequestStats:
+    __slots__ = ("started", "queries", "query_time", "acquire_time", "render_time", "render_started",
+                 "statements", "recorded")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.acquire_time = 0.0
+        self.render_time = 0.0
+        self.render_started = None
+        self.statements = _Tally()
+        self.recorded = False
+
+
+class InstrumentedCursor:
+    """Cursor proxy that reports the duration of each statement."""
+
+    __slots__ = ("_cursor", "_observe")
+
+    def __init__(self, cursor, observe):
+        object.__setattr__(self, "_cursor", cursor)
+        object.__setattr__(self, "_observe", observe)
+
+    def execute(self, sql, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(sql, *args, **kwargs)
+        finally:
+            self._observe(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(sql, *args, **kwargs)
+        finally:
+            self._observe(sql, time.perf_counter() - started)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+
+class InstrumentedConnection:
+
+    __slots__ = ("raw", "_observe")
+
+    def __init__(self, conn, observe):
+        self.raw = conn
+        self._observe = observe
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self.raw.cursor(*args, **kwargs), self._observe)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+def unwrap(conn):
+    return conn.raw if isinstance(conn, InstrumentedConnection) else conn
+
+
+class Instrumentation:
+
+    def __init__(self, app=None, enabled=True, server_timing=True, slow_query_ms=100, n_plus_one=10, token=None):
+        self.enabled = enabled
+        self.server_timing = server_timing
+        self.slow_query = slow_query_ms / 1000
+        self.n_plus_one = n_plus_one
+        self.token = token
+        self.requests = Histogram("http_request_duration_seconds", "Request latency by route.", ("route", "method"))
+        self.responses = Counter("http_responses_total", "Responses by route and status.", ("route", "method", "status"))
+        self.query_count = Histogram("db_queries_per_request", "SQL statements issued per request.", ("route",),
+                                     buckets=COUNT_BUCKETS)
+        self.queries = Counter("db_queries_total", "SQL statements executed.", ("route",))
+        self.query_seconds = Counter("db_query_seconds_total", "Time spent executing SQL.", ("route",))
+        self.slow_queries = Counter("db_slow_queries_total", "Statements slower than the slow-query threshold.", ("route",))
+        self.repeats = Counter("db_n_plus_one_total", "Requests repeating one statement past the N+1 threshold.", ("route",))
+        self.acquire = Histogram("db_connection_acquire_seconds", "Time to get a connection from the pool.")
+        self.render = Histogram("template_render_seconds", "Template rendering time by route.", ("route",))
+        self.metrics = [self.requests, self.responses, self.query_count, self.queries, self.query_seconds,
+                        self.slow_queries, self.repeats, self.acquire, self.render]
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app, weak=False)
+        template_rendered.connect(self._after_render, app, weak=False)
+        app.add_url_rule("/metrics", "metrics", self.metrics_view)
+
+    # Database hooks
+
+    def connect(self, getconn):
+        """Get a connection from ``getconn``, timed and wrapped."""
+        if not self.enabled:
+            return getconn()
+        started = time.perf_counter()
+        conn = getconn()
+        elapsed = time.perf_counter() - started
+        self.acquire.observe(elapsed)
+        if has_request_context() and "metrics" in g:
+            g.metrics.acquire_time += elapsed
+        return InstrumentedConnection(conn, self._observe_query)
+
+    def _observe_query(self, sql, seconds):
+        if has_request_context() and "metrics" in g:
+            stats = g.metrics
+            stats.queries += 1
+            stats.query_time += seconds
+            stats.statements[sql] += 1
+            route = self._route()
+        else:
+            route = BACKGROUND
+            self.queries.inc((route,))
+            self.query_seconds.inc((route,), seconds)
+        if seconds >= self.slow_query:
+            self.slow_queries.inc((route,))
+            print(f"Slow query ({seconds * 1000:.1f} ms) in {route}: {' '.join(str(sql).split())[:500]}")
+
+    # Request hooks
+
+    def _route(self):
+        return request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+
+    def _before_request(self):
+        g.metrics = RequestStats()
+
+    def _before_render(self, sender, **extra):
+        if "metrics" in g:
+            g.metrics.render_started = time.perf_counter()
+
+    def _after_render(self, sender, **extra):
+        stats = g.get("metrics")
+        if stats is not None and stats.render_started is not None:
+            stats.render_time += time.perf_counter() - stats.render_started
+            stats.render_started = None
+
+    def _after_request(self, response):
+        stats = g.get("metrics")
+        if stats is None:
+            return response
+        self._record(stats, response.status_code)
+        if self.server_timing:
+            parts = [f'db;dur={stats.query_time * 1000:.1f};desc="{stats.queries} queries"',
+                     f"db-acquire;dur={stats.acquire_time * 1000:.1f}"]
+            if stats.render_time:
+                parts.append(f"render;dur={stats.render_time * 1000:.1f}")
+            parts.append(f"total;dur={(time.perf_counter() - stats.started) * 1000:.1f}")
+            response.headers.add("Server-Timing", ", ".join(parts))
+        return response
+
+    def _teardown_request(self, exc):
+        stats = g.get("metrics")
+        if stats is not None and not stats.recorded:
+            self._record(stats, 500)
+
+    def _record(self, stats, status):
+        stats.recorded = True
+        route, method = self._route(), request.method
+        self.requests.observe(time.perf_counter() - stats.started, (route, method))
+        self.responses.inc((route, method, str(status)))
+        self.query_count.observe(stats.queries, (route,))
+        if stats.queries:
+            self.queries.inc((route,), stats.queries)
+            self.query_seconds.inc((route,), stats.query_time)
+        if stats.render_time:
+            self.render.observe(stats.render_time, (route,))
+        if stats.statements:
+            sql, repeats = stats.statements.most_common(1)[0]
+            if repeats > self.n_plus_one:
+                self.repeats.inc((route,))
+                print(f"Possible N+1 in {method} {route}: statement ran {repeats} times: "
+                      f"{' '.join(str(sql).split())[:300]}")
+
+    # Exposition
+
+    def render_metrics(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render(str(os.getpid())))
+        return "\n".join(lines) + "\n"
+
+    def metrics_view(self):
+        if self.token:
+            supplied = request.headers.get("Authorization", "")
+            if not hmac.compare_digest(supplied, f"Bearer {self.token}"):
+                abort(401)
+        elif request.remote_addr not in LOCAL_ADDRS:
+            abort(403)
+        return Response(self.render_metrics(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,192 @@
+from datetime import datetime, timezone
+
+import completions
+import rollups
+import search
+
+MIGRATIONS = []
+
+def migration(version):
+    def register(fn):
+        MIGRATIONS.append((version, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+def pk(is_postgres):
+    return "SERIAL PRIMARY KEY" if is_postgres else "INTEGER PRIMARY KEY AUTOINCREMENT"
+
+def add_column(cur, is_postgres, table, col, definition):
+    if is_postgres:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {col} {definition}")
+        return
+    cur.execute(f"PRAGMA table_info({table})")
+    if col not in [row[1] for row in cur.fetchall()]:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {col} {definition}")
+
+@migration(1)
+def base_schema(cur, is_postgres):
+    # Idempotent so that databases created by the old import-time init_db()
+    # are adopted as version 1 without changes.
+    cur.execute(f"""CREATE TABLE IF NOT EXISTS users (
+        id {pk(is_postgres)}, username TEXT UNIQUE NOT NULL, password TEXT NOT NULL)""")
+    cur.execute(f"""CREATE TABLE IF NOT EXISTS folders (
+        id {pk(is_postgres)}, name TEXT NOT NULL, user_id INTEGER NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users (id))""")
+    cur.execute(f"""CREATE TABLE IF NOT EXISTS tasks (
+        id {pk(is_postgres)}, task TEXT NOT NULL, user_id INTEGER NOT NULL, done INTEGER DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES users (id))""")
+    cur.execute(f"""CREATE TABLE IF NOT EXISTS task_completions (
+        id {pk(is_postgres)}, task_id INTEGER NOT NULL, completed_date TEXT NOT NULL,
+        UNIQUE(task_id, completed_date))""")
+    for col, definition in [
+        ("folder_id",    "INTEGER"),
+        ("due_date",     "TEXT"),
+        ("recurrence",   "TEXT DEFAULT 'none'"),
+        ("due_time",     "TEXT DEFAULT ''"),
+        ("due_time_end", "TEXT DEFAULT ''"),
+    ]:
+        add_column(cur, is_postgres, "tasks", col, definition)
+    add_column(cur, is_postgres, "users", "email", "TEXT")
+
+@migration(2)
+def folder_counters(cur, is_postgres):
+    cur.execute("""CREATE TABLE IF NOT EXISTS folder_stats (
+        folder_id INTEGER PRIMARY KEY, total INTEGER NOT NULL DEFAULT 0, done INTEGER NOT NULL DEFAULT 0)""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS folder_due_counts (
+        folder_id INTEGER NOT NULL, due_date TEXT NOT NULL, pending INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (folder_id, due_date))""")
+
+@migration(3)
+def query_indexes(cur, is_postgres):
+    # task_completions(task_id, completed_date) is already covered by its
+    # UNIQUE constraint.
+    for name, definition in [
+        ("idx_folders_user",          "folders (user_id, id)"),                # home
+        ("idx_tasks_folder_user_due", "tasks (folder_id, user_id, due_date)"), # view_calendar, api_tasks, home
+        ("idx_tasks_due_done",        "tasks (due_date, done)"),               # send_reminders
+        ("idx_tasks_user_id",         "tasks (user_id, id)"),                  # latest-task read back
+    ]:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+
+@migration(4)
+def reminder_jobs(cur, is_postgres):
+    cur.execute("""CREATE TABLE IF NOT EXISTS job_runs (
+        job TEXT NOT NULL, run_key TEXT NOT NULL, owner TEXT NOT NULL, claimed_at TEXT NOT NULL,
+        finished_at TEXT, sent INTEGER, failed INTEGER,
+        PRIMARY KEY (job, run_key))""")
+    cur.execute("""CREATE TABLE IF NOT EXISTS reminder_log (
+        user_id INTEGER NOT NULL, reminder_date TEXT NOT NULL, sent_at TEXT NOT NULL,
+        PRIMARY KEY (user_id, reminder_date))""")
+
+@migration(5)
+def data_versions(cur, is_postgres):
+    cur.execute("""CREATE TABLE IF NOT EXISTS data_versions (
+        user_id INTEGER PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)""")
+
+@migration(6)
+def completion_bitmaps(cur, is_postgres):
+    cur.execute(f"""CREATE TABLE IF NOT EXISTS completion_bitmaps (
+        task_id INTEGER NOT NULL, year INTEGER NOT NULL, days {"BYTEA" if is_postgres else "BLOB"} NOT NULL,
+        PRIMARY KEY (task_id, year))""")
+    # Fold the old one-row-per-day table into bitmaps a few thousand rows
+    # at a time; malformed dates are dropped.
+    read = cur.connection.cursor(name="migrate_completions") if is_postgres else cur.connection.cursor()
+    read.execute("SELECT task_id, completed_date FROM task_completions ORDER BY task_id")
+    while True:
+        rows = read.fetchmany(5000)
+        if not rows:
+            break
+        pairs = []
+        for task_id, completed_date in rows:
+            try:
+                pairs.append((task_id, completions.as_date(completed_date)))
+            except (TypeError, ValueError):
+                pass
+        completions.add_dates(cur, is_postgres, pairs)
+    read.close()
+    cur.execute("DROP TABLE task_completions")
+
+@migration(7)
+def task_search(cur, is_postgres):
+    if is_postgres:
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_search ON tasks USING GIN (to_tsvector('simple', task))")
+        return
+    # Pure SQL triggers, so writers without the app's connection setup work.
+    cur.execute("CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(terms, tokenize = 'unicode61 remove_diacritics 2')")
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts (rowid, terms) VALUES (new.id, {search.index_terms_sql("new.user_id", "new.task")});
+    END""")
+    cur.execute(f"""CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF task, user_id ON tasks BEGIN
+        UPDATE tasks_fts SET terms = {search.index_terms_sql("new.user_id", "new.task")} WHERE rowid = old.id;
+    END""")
+    cur.execute("""CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+        DELETE FROM tasks_fts WHERE rowid = old.id;
+    END""")
+    cur.execute(f"INSERT INTO tasks_fts (rowid, terms) SELECT id, {search.index_terms_sql('user_id', 'task')} FROM tasks")
+
+@migration(8)
+def archive_tables(cur, is_postgres):
+    cur.execute("""CREATE TABLE IF NOT EXISTS archived_tasks (
+        id INTEGER PRIMARY KEY, task TEXT NOT NULL, user_id INTEGER NOT NULL, folder_id INTEGER,
+        due_date TEXT, due_time TEXT DEFAULT '', due_time_end TEXT DEFAULT '', recurrence TEXT DEFAULT 'none',
+        done INTEGER DEFAULT 0, archived_at TEXT NOT NULL)""")
+    cur.execute(f"""CREATE TABLE IF NOT EXISTS archived_completions (
+        task_id INTEGER NOT NULL, year INTEGER NOT NULL, days {"BYTEA" if is_postgres else "BLOB"} NOT NULL,
+        PRIMARY KEY (task_id, year))""")
+    add_column(cur, is_postgres, "folders", "archived_done", "INTEGER NOT NULL DEFAULT 0")
+    for name, definition in [
+        ("idx_archived_tasks_folder_due", "archived_tasks (folder_id, user_id, due_date, id)"), # /api/archive, old windows
+        ("idx_completion_bitmaps_year",   "completion_bitmaps (year)"),                        # archive job
+    ]:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+
+@migration(9)
+def daily_stats(cur, is_postgres):
+    add_column(cur, is_postgres, "tasks", "created_on", "TEXT")
+    add_column(cur, is_postgres, "archived_tasks", "created_on", "TEXT")
+    cur.execute("""CREATE TABLE IF NOT EXISTS daily_stats (
+        user_id INTEGER NOT NULL, folder_id INTEGER NOT NULL, day TEXT NOT NULL,
+        created INTEGER NOT NULL DEFAULT 0, due INTEGER NOT NULL DEFAULT 0,
+        completed INTEGER NOT NULL DEFAULT 0, overdue INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, folder_id, day))""")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_daily_stats_user_day ON daily_stats (user_id, day)")  # /api/stats
+    # One horizon per user, so writers for different users never share a lock.
+    cur.execute("""CREATE TABLE IF NOT EXISTS daily_stats_users (
+        user_id INTEGER PRIMARY KEY, through TEXT NOT NULL)""")
+    rollups.rebuild(cur.connection, is_postgres, commit=False)
+
+def current_version(cur):
+    cur.execute("SELECT MAX(version) FROM schema_version")
+    return cur.fetchone()[0] or 0
+
+def migrate(conn, is_postgres):
+    """Apply pending migrations in order; return the versions applied."""
+    cur = conn.cursor()
+    if is_postgres:
+        # Serialise concurrent deploys (e.g. several release phases).
+        cur.execute("SELECT pg_advisory_lock(742311)")
+    cur.execute("""CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY, applied_at TEXT NOT NULL)""")
+    conn.commit()
+    applied = []
+    try:
+        version = current_version(cur)
+        for target, fn in MIGRATIONS:
+            if target <= version:
+                continue
+            fn(cur, is_postgres)
+            placeholder = "%s" if is_postgres else "?"
+            cur.execute(f"INSERT INTO schema_version (version, applied_at) VALUES ({placeholder}, {placeholder})",
+                        (target, datetime.now(timezone.utc).isoformat()))
+            conn.commit()
+            applied.append(target)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if is_postgres:
+            cur.execute("SELECT pg_advisory_unlock(742311)")
+            conn.commit()
+        cur.close()
+    return applied
@@ -0,0 +1,128 @@
+"""bcrypt hashing off the request thread.
+
+Hashes run in a small process pool so a burst of logins cannot pin every
+web worker on CPU. At most ``max_pending`` hashes may be queued or running
+per process; beyond that callers get ``HashPoolBusy`` straight away instead
+of piling up behind each other, and so do hashes that take longer than
+``timeout``. ``workers=0`` hashes inline.
+
+The pool forks its processes. ``start`` forks them while the process has
+no other threads (app.py calls it before starting the scheduler); a pool
+replaced after a worker died, or created after a later fork, forks with
+threads running, which is safe only because the children run nothing but
+bcrypt and take no lock another thread could hold.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+import flask_bcrypt
+
+
+class HashPoolBusy(Exception):
+    pass
+
+
+def hash_password(password, rounds):
+    return flask_bcrypt.generate_password_hash(password, rounds).decode("utf-8")
+
+def check_password(pw_hash, password):
+    try:
+        return flask_bcrypt.check_password_hash(pw_hash, password)
+    except ValueError:  # malformed hash, or a password bcrypt refuses
+        return False
+
+def cost(pw_hash):
+    """Work factor of a ``$2b$12$...`` hash, or None if it is not bcrypt."""
+    try:
+        return int(pw_hash.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class HashPool:
+
+    def __init__(self, rounds=12, workers=2, max_pending=32, timeout=10):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self):
+        # Created lazily, and again after a fork, so each gunicorn worker
+        # owns its own processes. Forked rather than spawned: spawn and
+        # forkserver re-import __main__, which need not be import-safe.
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                ctx = multiprocessing.get_context("fork")
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=ctx)
+                self._pid = os.getpid()
+            return self._executor
+
+    def _discard(self, executor):
+        # A pool whose worker died stays broken; the next call gets a new one.
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def start(self):
+        """Fork the worker processes now rather than on the first hash."""
+        if self.workers:
+            self._get_executor().submit(os.getpid).result()
+
+    def _submit(self, fn, *args):
+        executor = self._get_executor()
+        try:
+            return executor, executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._discard(executor)
+            executor = self._get_executor()
+            return executor, executor.submit(fn, *args)
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HashPoolBusy(f"{self._pending} password hashes already pending")
+            self._pending += 1
+        try:
+            executor, future = self._submit(fn, *args)
+        except Exception:
+            self._done()
+            raise
+        future.add_done_callback(self._done)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise HashPoolBusy(f"password hash took longer than {self.timeout}s")
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise HashPoolBusy("password hash worker died")
+
+    def _done(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+
+    def hash(self, password):
+        return self._run(hash_password, password, self.rounds)
+
+    def check(self, pw_hash, password):
+        return self._run(check_password, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        return cost(pw_hash) != self.rounds
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
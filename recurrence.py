@@ -0,0 +1,131 @@
+"""Expansion of the ``tasks.recurrence`` encodings.
+
+Rules are ``none``, ``daily``, ``weekly``, ``monthly`` and
+``monthly_weekday_<N|last>_<D>`` where ``D`` is a JavaScript day of week
+(0 = Sunday). Occurrences are computed arithmetically per month or per step
+rather than by testing every day of the window.
+"""
+import calendar as cal_module
+from datetime import date, timedelta
+from functools import lru_cache
+
+@lru_cache(maxsize=1024)
+def month_info(year, month):
+    """(weekday of the 1st, days in month), Monday = 0."""
+    return cal_module.monthrange(year, month)
+
+def nth_weekday(year, month, py_weekday, occ):
+    """Day of month of the ``occ``-th (1-5 or 'last') weekday, or None."""
+    first_weekday, days_in_month = month_info(year, month)
+    first = (py_weekday - first_weekday) % 7 + 1
+    if occ == 'last':
+        return first + (days_in_month - first) // 7 * 7
+    day = first + (int(occ) - 1) * 7
+    return day if day <= days_in_month else None
+
+def find_weekday_in_month(year, month, js_day_of_week, occ_str):
+    # Used when spawning the next task: a missing 5th weekday falls back to
+    # the last one of the month.
+    py_weekday = (js_day_of_week - 1) % 7
+    day = nth_weekday(year, month, py_weekday, occ_str)
+    if day is None:
+        day = nth_weekday(year, month, py_weekday, 'last')
+    return date(year, month, day).isoformat()
+
+def get_next_date(due_date_str, recurrence):
+    if not due_date_str or not recurrence or recurrence == 'none':
+        return None
+    try:
+        d = date.fromisoformat(due_date_str)
+        if recurrence == 'daily':
+            return (d + timedelta(days=1)).isoformat()
+        elif recurrence == 'weekly':
+            return (d + timedelta(weeks=1)).isoformat()
+        elif recurrence == 'monthly':
+            month = d.month + 1; year = d.year
+            if month > 12: month = 1; year += 1
+            last_day = month_info(year, month)[1]
+            return date(year, month, min(d.day, last_day)).isoformat()
+        elif recurrence.startswith('monthly_weekday_'):
+            parts = recurrence.split('_')
+            occ_str = parts[2]; js_dow = int(parts[3])
+            month = d.month + 1; year = d.year
+            if month > 12: month = 1; year += 1
+            return find_weekday_in_month(year, month, js_dow, occ_str)
+    except Exception as e:
+        print(f"Error getting next date: {e}")
+    return None
+
+def iter_months(start, end):
+    year, month = start.year, start.month
+    while date(year, month, 1) < end:
+        yield year, month
+        month += 1
+        if month > 12: month = 1; year += 1
+
+def expand(due_date, recurrence, start, end):
+    """Yield the dates in [start, end) on which a task occurs.
+
+    A task always occurs on its due date; recurring tasks additionally occur
+    on every later date matching the rule, as drawn by the calendar page
+    (monthly tasks skip months that lack their day of month). Tasks with a
+    missing or malformed due date have none.
+    """
+    if not due_date:
+        return
+    if isinstance(due_date, str):
+        try:
+            due_date = date.fromisoformat(due_date)
+        except ValueError:
+            return
+    if start <= due_date < end:
+        yield due_date
+    if not recurrence or recurrence == 'none':
+        return
+    lo = max(start, due_date + timedelta(days=1))
+    if lo >= end:
+        return
+    if recurrence in ('daily', 'weekly'):
+        step = 1 if recurrence == 'daily' else 7
+        offset = -(lo - due_date).days % step
+        d = lo + timedelta(days=offset)
+        while d < end:
+            yield d
+            d += timedelta(days=step)
+    elif recurrence == 'monthly':
+        for year, month in iter_months(lo, end):
+            if due_date.day <= month_info(year, month)[1]:
+                d = date(year, month, due_date.day)
+                if lo <= d < end:
+                    yield d
+    elif recurrence.startswith('monthly_weekday_'):
+        try:
+            _, _, occ, js_dow = recurrence.split('_')
+            py_weekday = (int(js_dow) - 1) % 7
+        except ValueError:
+            return
+        for year, month in iter_months(lo, end):
+            day = nth_weekday(year, month, py_weekday, occ)
+            if day:
+                d = date(year, month, day)
+                if lo <= d < end:
+                    yield d
+
+def occurrences(tasks, completions, start, end):
+    """Expand ``tasks`` over [start, end) merged with completion state.
+
+    ``completions`` is a set of (task_id, 'YYYY-MM-DD') pairs for recurring
+    tasks; one-off tasks take their state from ``done``.
+    """
+    result = []
+    for task in tasks:
+        recurring = task["recurrence"] and task["recurrence"] != 'none'
+        for d in expand(task["due_date"], task["recurrence"], start, end):
+            ds = d.isoformat()
+            if recurring:
+                done = 1 if (task["id"], ds) in completions else 0
+            else:
+                done = 1 if task["done"] else 0
+            result.append({"task_id": task["id"], "date": ds, "done": done})
+    result.sort(key=lambda o: o["date"])
+    return result
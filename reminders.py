@@ -0,0 +1,218 @@
+"""Daily reminder emails.
+
+Every process may run the scheduler, but a run is claimed per day in the
+job_runs table so only one of them sends. Due tasks are streamed grouped by
+user, and messages go out through a small pool of worker threads that each
+keep one SMTP connection open. reminder_log records who has been mailed, so
+a crashed run can be reclaimed and resumed without duplicates.
+"""
+import os
+import queue
+import socket
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+
+import psycopg2.extras
+from flask_mail import Message
+
+from db import sql
+
+JOB = "send_reminders"
+
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+def owner_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def claim_run(conn, is_postgres, run_key, owner, stale_after=3600, job=JOB):
+    """Claim today's run of ``job``; True for exactly one caller.
+
+    A claim that was never finished can be taken over once it is older than
+    ``stale_after`` seconds (the previous owner is presumed dead).
+    """
+    cur = conn.cursor()
+    now = now_iso()
+    cur.execute(sql(is_postgres, """
+        INSERT INTO job_runs (job, run_key, owner, claimed_at) VALUES (%s, %s, %s, %s)
+        ON CONFLICT (job, run_key) DO NOTHING"""), (job, run_key, owner, now))
+    claimed = cur.rowcount == 1
+    if not claimed:
+        stale = (datetime.now(timezone.utc) - timedelta(seconds=stale_after)).isoformat()
+        cur.execute(sql(is_postgres, """
+            UPDATE job_runs SET owner = %s, claimed_at = %s
+            WHERE job = %s AND run_key = %s AND finished_at IS NULL AND claimed_at < %s"""),
+            (owner, now, job, run_key, stale))
+        claimed = cur.rowcount == 1
+    conn.commit(); cur.close()
+    return claimed
+
+def finish_run(conn, is_postgres, run_key, owner, sent, failed, job=JOB):
+    cur = conn.cursor()
+    cur.execute(sql(is_postgres, """
+        UPDATE job_runs SET finished_at = %s, sent = %s, failed = %s
+        WHERE job = %s AND run_key = %s AND owner = %s"""), (now_iso(), sent, failed, job, run_key, owner))
+    conn.commit(); cur.close()
+
+def iter_due_users(conn, is_postgres, due_date, chunk_size=2000):
+    """Yield (user, tasks) for users with undone tasks due on ``due_date``
+    who have not been reminded yet, streaming from a server-side cursor."""
+    statement = sql(is_postgres, """
+        SELECT users.id AS user_id, users.email, users.username,
+               tasks.task, tasks.due_date, tasks.due_time, tasks.due_time_end, folders.name AS calendar_name
+        FROM tasks JOIN users ON tasks.user_id = users.id
+        JOIN folders ON tasks.folder_id = folders.id
+        WHERE tasks.due_date = %s AND tasks.done = 0
+        AND users.email IS NOT NULL AND users.email != ''
+        AND NOT EXISTS (SELECT 1 FROM reminder_log
+                        WHERE reminder_log.user_id = users.id AND reminder_log.reminder_date = %s)
+        ORDER BY users.id, tasks.due_time, tasks.id""")
+    if is_postgres:
+        cur = conn.cursor(name="due_reminders", cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.itersize = chunk_size
+    else:
+        cur = conn.cursor()
+    cur.execute(statement, (due_date, due_date))
+
+    def rows():
+        while True:
+            batch = cur.fetchmany(chunk_size)
+            if not batch:
+                return
+            yield from batch
+    try:
+        for _, tasks in groupby(rows(), key=lambda r: r["user_id"]):
+            tasks = list(tasks)
+            yield tasks[0], tasks
+    finally:
+        cur.close()
+
+def build_message(user, tasks, due_date, sender):
+    task_lines = []
+    for t in tasks:
+        time_str = f" at {t['due_time']}" if t['due_time'] else ""
+        if t['due_time_end']:
+            time_str += f"–{t['due_time_end']}"
+        task_lines.append(f"  • {t['task']}{time_str} ({t['calendar_name']})")
+    msg = Message(
+        subject=f"📅 {len(tasks)} task(s) due tomorrow!",
+        sender=sender,
+        recipients=[user['email']]
+    )
+    msg.body = f"Hi {user['username']},\n\nYou have {len(tasks)} task(s) due tomorrow ({due_date}):\n\n" + \
+               '\n'.join(task_lines) + "\n\nLog in to your calendar to check them off!\n\nBest,\nYour Calendar App"
+    return msg
+
+
+class SenderPool:
+    """Worker threads that each reuse one SMTP connection.
+
+    ``submit`` blocks once ``queue_size`` messages are waiting, so memory
+    stays bounded however many users are due. Failed sends are retried with
+    exponential backoff on a fresh connection; successful ones are written
+    to reminder_log.
+    """
+
+    def __init__(self, app, mail, get_db, due_date, workers=4, queue_size=200, retries=3, backoff=1.0):
+        self.app, self.mail, self.get_db, self.due_date = app, mail, get_db, due_date
+        self.retries, self.backoff = retries, backoff
+        self.sent = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, user_id, msg):
+        self._queue.put((user_id, msg))
+
+    def close(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+
+    def _work(self):
+        with self.app.app_context():
+            smtp = None
+            try:
+                while True:
+                    item = self._queue.get()
+                    if item is None:
+                        return
+                    user_id, msg = item
+                    smtp, ok = self._send(smtp, msg)
+                    if not ok:
+                        with self._lock:
+                            self.failed += 1
+                        continue
+                    self._log(user_id)
+                    with self._lock:
+                        self.sent += 1
+            finally:
+                if smtp:
+                    self._close(smtp)
+
+    def _send(self, smtp, msg):
+        # Returns (open connection or None, whether the message went out).
+        for attempt in range(self.retries + 1):
+            try:
+                if smtp is None:
+                    smtp = self.mail.connect().__enter__()
+                smtp.send(msg)
+                return smtp, True
+            except smtplib.SMTPRecipientsRefused as e:
+                print(f"Failed to send to {msg.recipients}: {e}")
+                return smtp, False
+            except (smtplib.SMTPException, OSError) as e:
+                if smtp is not None:
+                    self._close(smtp)
+                    smtp = None
+                if attempt == self.retries:
+                    print(f"Failed to send to {msg.recipients}: {e}")
+                    return None, False
+                time.sleep(self.backoff * 2 ** attempt)
+        return None, False
+
+    def _close(self, smtp):
+        try:
+            if smtp.host is not None:
+                smtp.host.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+
+    def _log(self, user_id):
+        conn, is_postgres = self.get_db()
+        cur = conn.cursor()
+        cur.execute(sql(is_postgres, """
+            INSERT INTO reminder_log (user_id, reminder_date, sent_at) VALUES (%s, %s, %s)
+            ON CONFLICT (user_id, reminder_date) DO NOTHING"""), (user_id, self.due_date, now_iso()))
+        conn.commit(); cur.close()
+
+
+def run(app, mail, get_db, due_date, sender, workers=4, owner=None, force=False):
+    """Send reminders for tasks due on ``due_date``; needs an app context.
+
+    Returns (sent, failed), or None when another process owns the run.
+    ``force`` skips the claim (manual re-runs); reminder_log still prevents
+    duplicates.
+    """
+    owner = owner or owner_id()
+    conn, is_postgres = get_db()
+    if not force and not claim_run(conn, is_postgres, due_date, owner):
+        return None
+    pool = SenderPool(app, mail, get_db, due_date, workers=workers)
+    try:
+        for user, tasks in iter_due_users(conn, is_postgres, due_date):
+            pool.submit(user["user_id"], build_message(user, tasks, due_date, sender))
+    finally:
+        pool.close()
+        conn.rollback()  # end the read transaction held by the streaming cursor
+    if not force:
+        finish_run(conn, is_postgres, due_date, owner, pool.sent, pool.failed)
+    return pool.sent, pool.failed
@@ -0,0 +1,290 @@
+"""Daily productivity rollups per user, folder and day (``daily_stats``).
+
+Each row counts, for one day:
+
+* ``created``: tasks added that day (tasks from before ``created_on``
+  existed, and imported ones, have no creation day);
+* ``due``: task occurrences falling on the day: one-off tasks on their
+  due date, recurring tasks on every day of their schedule;
+* ``completed``: those occurrences that are done;
+* ``overdue``: those still not done once the day is over.
+
+Recurring schedules are open-ended, so a user's occurrences are only
+counted up to their ``daily_stats_users.through`` (normally today), which
+``advance`` moves forward once a day, a batch of users per transaction.
+Write endpoints apply the exact change in a task's contribution in the
+same transaction as the write, and ``rebuild`` / ``rebuild_folder``
+recompute rows from the live and archived tables. Changes take the user's
+horizon row lock, so a write and the daily advance never see different
+horizons, and a write only waits for the advance of its own batch.
+"""
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+import completions
+import recurrence
+from db import placeholders, sql
+
+FIELDS = ("created", "due", "completed", "overdue")
+TASK_FIELDS = "id, user_id, folder_id, due_date, recurrence, done, created_on"
+USERS_PER_BATCH = 200
+
+
+def parse_date(value):
+    try:
+        return completions.as_date(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+def is_recurring(task):
+    # A recurring task checked off as a whole (the next one was spawned)
+    # counts as a single done occurrence, like a one-off task.
+    return bool(task["recurrence"] and task["recurrence"] != "none" and not task["done"])
+
+def lock_users(cur, is_postgres, user_ids, exclusive=False, today=None):
+    """{user_id: through} for ``user_ids``, starting users without a row at
+    ``today``. Holds their horizon locks (shared on Postgres unless
+    ``exclusive``) until the transaction ends; on SQLite the insert takes
+    the write lock, which serialises with the daily advance."""
+    ids = sorted(user_ids)
+    cur.executemany(sql(is_postgres, """
+        INSERT INTO daily_stats_users (user_id, through) VALUES (%s, %s) ON CONFLICT (user_id) DO NOTHING"""),
+        [(user_id, (today or date.today()).isoformat()) for user_id in ids])
+    cur.execute(sql(is_postgres, f"SELECT user_id, through FROM daily_stats_users WHERE user_id IN ({placeholders(ids)}) ORDER BY user_id"
+                    + ((" FOR UPDATE" if exclusive else " FOR SHARE") if is_postgres else "")), ids)
+    return {user_id: date.fromisoformat(through) for user_id, through in map(completions.values, cur.fetchall())}
+
+def contribute(delta, task, done, through, sign=1, start=None):
+    """Add ``sign`` times ``task``'s counts to ``delta``, keyed by
+    (user_id, folder_id, day, field). With ``start``, only occurrences on or
+    after it are counted and ``created`` is left out."""
+    user_id, folder_id = task["user_id"], task["folder_id"]
+    created = parse_date(task["created_on"])
+    if created and start is None:
+        delta[(user_id, folder_id, created.isoformat(), "created")] += sign
+    due = parse_date(task["due_date"])
+    if not due:
+        return
+    if not is_recurring(task):
+        if start is None or due >= start:
+            delta[(user_id, folder_id, due.isoformat(), "due")] += sign
+            if task["done"]:
+                delta[(user_id, folder_id, due.isoformat(), "completed")] += sign
+            elif due < through:
+                delta[(user_id, folder_id, due.isoformat(), "overdue")] += sign
+        return
+    for d in recurrence.expand(due, task["recurrence"], max(due, start or due), through + timedelta(days=1)):
+        day = d.isoformat()
+        delta[(user_id, folder_id, day, "due")] += sign
+        if (task["id"], d) in done:
+            delta[(user_id, folder_id, day, "completed")] += sign
+        elif d < through:
+            delta[(user_id, folder_id, day, "overdue")] += sign
+
+def write(cur, is_postgres, delta):
+    rows = defaultdict(lambda: [0] * len(FIELDS))
+    for (user_id, folder_id, day, field), n in delta.items():
+        if n:
+            rows[(user_id, folder_id, day)][FIELDS.index(field)] += n
+    cur.executemany(sql(is_postgres, """
+        INSERT INTO daily_stats (user_id, folder_id, day, created, due, completed, overdue)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (user_id, folder_id, day) DO UPDATE SET
+            created = daily_stats.created + excluded.created, due = daily_stats.due + excluded.due,
+            completed = daily_stats.completed + excluded.completed, overdue = daily_stats.overdue + excluded.overdue"""),
+        [(*key, *counts) for key, counts in sorted(rows.items()) if any(counts)])
+
+def update(cur, is_postgres, before, after):
+    """Replace the counts of the task rows ``before`` with those of
+    ``after``. Call before the completions of deleted tasks are removed."""
+    tasks = [t for t in list(before) + list(after) if t["folder_id"]]
+    if not tasks:
+        return
+    horizons = lock_users(cur, is_postgres, {t["user_id"] for t in tasks})
+    done = completions.load_tasks(cur, is_postgres, {t["id"] for t in tasks if is_recurring(t)}, archived=True)
+    delta = Counter()
+    for task in before:
+        if task["folder_id"]:
+            contribute(delta, task, done, horizons[task["user_id"]], -1)
+    for task in after:
+        if task["folder_id"]:
+            contribute(delta, task, done, horizons[task["user_id"]], 1)
+    write(cur, is_postgres, delta)
+
+def update_day(cur, is_postgres, task, day, done):
+    """Count a recurring task's occurrence on ``day`` as done or not."""
+    if not task["folder_id"] or not is_recurring(task):
+        # Checked off as a whole: its days are not counted (see is_recurring).
+        return
+    through = lock_users(cur, is_postgres, [task["user_id"]])[task["user_id"]]
+    d = completions.as_date(day)
+    if d > through:
+        return
+    if not any(recurrence.expand(task["due_date"], task["recurrence"], d, d + timedelta(days=1))):
+        return
+    sign = 1 if done else -1
+    delta = Counter({(task["user_id"], task["folder_id"], d.isoformat(), "completed"): sign})
+    if d < through:
+        delta[(task["user_id"], task["folder_id"], d.isoformat(), "overdue")] = -sign
+    write(cur, is_postgres, delta)
+
+
+def recompute(cur, is_postgres, where, params, through):
+    # Counts of every live and archived task matching ``where``.
+    cur.execute(sql(is_postgres, f"""
+        SELECT {TASK_FIELDS} FROM tasks WHERE {where}
+        UNION ALL SELECT {TASK_FIELDS} FROM archived_tasks WHERE {where}"""), list(params) * 2)
+    tasks = [dict(zip(TASK_FIELDS.split(", "), completions.values(row))) for row in cur.fetchall()]
+    done = completions.load_tasks(cur, is_postgres, {t["id"] for t in tasks if is_recurring(t)}, archived=True)
+    delta = Counter()
+    for task in tasks:
+        if task["folder_id"]:
+            contribute(delta, task, done, through)
+    cur.execute(sql(is_postgres, f"DELETE FROM daily_stats WHERE {where}"), list(params))
+    write(cur, is_postgres, delta)
+
+def rebuild_folder(cur, is_postgres, user_id, folder_id):
+    """Recompute one folder's rows (e.g. after a bulk import)."""
+    through = lock_users(cur, is_postgres, [user_id])[user_id]
+    recompute(cur, is_postgres, "user_id = %s AND folder_id = %s", (user_id, folder_id), through)
+
+def by_horizon(horizons):
+    groups = defaultdict(list)
+    for user_id, through in horizons.items():
+        groups[through].append(user_id)
+    return sorted(groups.items())
+
+def rebuild(conn, is_postgres, today=None, users_per_batch=USERS_PER_BATCH, commit=True):
+    """Recompute every user's rows, a batch of users per transaction (one
+    transaction overall with ``commit=False``, as in the migration).
+    Returns the number of users."""
+    cur = conn.cursor()
+    last, total = 0, 0
+    while True:
+        cur.execute(sql(is_postgres, "SELECT id FROM users WHERE id > %s ORDER BY id LIMIT %s"), (last, users_per_batch))
+        user_ids = [completions.values(row)[0] for row in cur.fetchall()]
+        if not user_ids:
+            break
+        for through, ids in by_horizon(lock_users(cur, is_postgres, user_ids, exclusive=True, today=today)):
+            recompute(cur, is_postgres, f"user_id IN ({placeholders(ids)})", ids, through)
+        if commit:
+            conn.commit()
+        last, total = user_ids[-1], total + len(user_ids)
+    cur.close()
+    return total
+
+def advance_users(cur, is_postgres, horizons, today):
+    # Recurring occurrences on the new days of these users, and the
+    # occurrences that became overdue.
+    ids = sorted(horizons)
+    delta = Counter()
+    cur.execute(sql(is_postgres, f"""
+        SELECT t.user_id, t.folder_id, t.due_date, COUNT(*) FROM tasks t
+        JOIN daily_stats_users s ON s.user_id = t.user_id
+        WHERE t.user_id IN ({placeholders(ids)}) AND t.due_date >= s.through AND t.due_date < %s
+        AND t.done = 0 AND t.folder_id IS NOT NULL AND (t.recurrence IS NULL OR t.recurrence = 'none')
+        GROUP BY t.user_id, t.folder_id, t.due_date"""), ids + [today.isoformat()])
+    for user_id, folder_id, due_date, n in map(completions.values, cur.fetchall()):
+        delta[(user_id, folder_id, due_date, "overdue")] += n
+    cur.execute(sql(is_postgres, f"""
+        SELECT {TASK_FIELDS} FROM tasks
+        WHERE user_id IN ({placeholders(ids)}) AND done = 0 AND recurrence IS NOT NULL AND recurrence != 'none'
+        AND folder_id IS NOT NULL AND due_date IS NOT NULL AND due_date != '' AND due_date <= %s"""),
+        ids + [today.isoformat()])
+    tasks = [dict(zip(TASK_FIELDS.split(", "), completions.values(row))) for row in cur.fetchall()]
+    done = completions.load_tasks(cur, is_postgres, {t["id"] for t in tasks}, archived=True)
+    for task in tasks:
+        through = horizons[task["user_id"]]
+        # The difference between the two horizons.
+        contribute(delta, task, done, through, -1, start=through)
+        contribute(delta, task, done, today, 1, start=through)
+    write(cur, is_postgres, delta)
+    cur.execute(sql(is_postgres, f"UPDATE daily_stats_users SET through = %s WHERE user_id IN ({placeholders(ids)})"),
+                [today.isoformat()] + ids)
+
+def advance(conn, is_postgres, today=None, users_per_batch=USERS_PER_BATCH):
+    """Move every user's ``through`` up to ``today``, a batch of users per
+    transaction, so writes only wait for their own user's batch. Returns
+    the number of users advanced; users already advanced by another
+    process are skipped."""
+    today = today or date.today()
+    cur = conn.cursor()
+    last, total = 0, 0
+    try:
+        while True:
+            # Pick the batch without locks, then lock it and re-read.
+            cur.execute(sql(is_postgres, """
+                SELECT user_id FROM daily_stats_users WHERE user_id > %s AND through < %s ORDER BY user_id LIMIT %s"""),
+                (last, today.isoformat(), users_per_batch))
+            user_ids = [completions.values(row)[0] for row in cur.fetchall()]
+            if not user_ids:
+                break
+            horizons = {user_id: through for user_id, through in
+                        lock_users(cur, is_postgres, user_ids, exclusive=True).items() if through < today}
+            if horizons:
+                advance_users(cur, is_postgres, horizons, today)
+            conn.commit()
+            last, total = user_ids[-1], total + len(horizons)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    return total
+
+
+def load_days(cur, is_postgres, user_id, folder_id, start, end):
+    """{day: {field: count}} for [start, end), summed over folders unless
+    ``folder_id`` is given."""
+    filters, params = "", [user_id, start.isoformat(), end.isoformat()]
+    if folder_id is not None:
+        filters, params = " AND folder_id = %s", params + [folder_id]
+    cur.execute(sql(is_postgres, f"""
+        SELECT day, SUM(created), SUM(due), SUM(completed), SUM(overdue) FROM daily_stats
+        WHERE user_id = %s AND day >= %s AND day < %s{filters} GROUP BY day"""), params)
+    return {row[0]: dict(zip(FIELDS, map(int, row[1:]))) for row in map(completions.values, cur.fetchall())}
+
+def current_streak(cur, is_postgres, user_id, folder_id, today, limit=3660):
+    """Consecutive days with a completion, ending today (or yesterday, as
+    today is not over yet)."""
+    filters, params = "", [user_id, today.isoformat()]
+    if folder_id is not None:
+        filters, params = " AND folder_id = %s", params + [folder_id]
+    cur.execute(sql(is_postgres, f"""
+        SELECT day FROM daily_stats WHERE user_id = %s AND day <= %s AND completed > 0{filters}
+        GROUP BY day ORDER BY day DESC LIMIT %s"""), params + [limit])
+    streak, expected = 0, today
+    for (day,) in map(completions.values, cur.fetchall()):
+        d = date.fromisoformat(day)
+        if streak == 0 and d == today - timedelta(days=1):
+            expected = d
+        if d != expected:
+            break
+        streak += 1
+        expected = d - timedelta(days=1)
+    return streak
+
+def summary(cur, is_postgres, user_id, folder_id, start, end, today=None):
+    """Per-day counts with rolling 7/30-day completion rates, totals and
+    streaks for [start, end)."""
+    today = today or date.today()
+    days = load_days(cur, is_postgres, user_id, folder_id, start - timedelta(days=29), end)
+    empty = dict.fromkeys(FIELDS, 0)
+    series, totals = [], dict(empty)
+    longest = run = 0
+    d = start
+    while d < end:
+        counts = days.get(d.isoformat(), empty)
+        entry = {"date": d.isoformat(), **counts}
+        for window in (7, 30):
+            window_days = [days.get((d - timedelta(days=i)).isoformat(), empty) for i in range(window)]
+            due = sum(c["due"] for c in window_days)
+            entry[f"rate_{window}"] = round(sum(c["completed"] for c in window_days) / due, 4) if due else None
+        series.append(entry)
+        for field in FIELDS:
+            totals[field] += counts[field]
+        run = run + 1 if counts["completed"] else 0
+        longest = max(longest, run)
+        d += timedelta(days=1)
+    return {"start": start.isoformat(), "end": end.isoformat(), "days": series, "totals": totals,
+            "streak": {"current": current_streak(cur, is_postgres, user_id, folder_id, today), "longest": longest}}
@@ -0,0 +1,99 @@
+"""Full-text search over a user's task names.
+
+SQLite uses the ``tasks_fts`` FTS5 table, which triggers keep in step with
+``tasks``. Its terms are scoped to the owner (``u42xmilk`` for "Milk" in a
+task of user 42), so a prefix query only walks one user's slice of the term
+dictionary however many tasks other users have. The triggers build the
+terms in plain SQL (``index_terms_sql``), so any writer, such as the
+sqlite3 shell, can change tasks; a word joined to the previous one by a
+character outside ``SEPARATORS`` (e.g. "a@b") is not scoped and so not
+found. Postgres uses a GIN index on ``to_tsvector('simple', task)``.
+
+Every word of the query is matched as a prefix, and results come best
+match first with an opaque keyset cursor for the next page.
+"""
+import re
+import unicodedata
+
+from db import decode_cursor, encode_cursor, sql
+
+WORD_RE = re.compile(r"[^\W_]+")
+MAX_TERMS = 8
+# Nested replace() calls in a trigger hit SQLite's parser depth limit
+# beyond two dozen, so only common separators are mapped to spaces.
+SEPARATORS = "\t\n\r,.;:/-()[]\"'!?&+#_"
+
+COLUMNS = """tasks.id, tasks.task, tasks.user_id, tasks.folder_id, tasks.due_date, tasks.due_time,
+             tasks.due_time_end, tasks.recurrence, tasks.done, folders.name AS calendar_name"""
+
+
+def normalize(text):
+    # Case- and accent-insensitive like the FTS5 tokenizer (remove_diacritics
+    # 2): "Café" and "cafe" index the same.
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+def terms(text):
+    return WORD_RE.findall(normalize(text))[:MAX_TERMS]
+
+def index_terms_sql(user_id, text):
+    """SQL expression for the FTS terms of ``text``: the owner prefix before
+    every word, once separators are spaces. The tokenizer (unicode61,
+    remove_diacritics 2) then folds case and accents."""
+    for c in SEPARATORS:
+        text = f"replace({text}, char({ord(c)}), ' ')"
+    return f"'u' || {user_id} || 'x' || replace({text}, ' ', ' u' || {user_id} || 'x')"
+
+def decode_search_cursor(cursor):
+    """(score, task_id) from a ``search`` cursor; raises ValueError if garbled."""
+    return decode_cursor(cursor, float, int)
+
+def search(cur, is_postgres, user_id, text, calendar_id=None, start=None, end=None, limit=20, cursor=None):
+    """One page of ``user_id``'s tasks matching ``text``.
+
+    ``start``/``end`` bound the due date to [start, end). Returns
+    (rows, next_cursor); next_cursor is None on the last page.
+    """
+    words = terms(text)
+    if not words:
+        return [], None
+    filters, params = "", []
+    if calendar_id is not None:
+        filters += " AND tasks.folder_id = %s"; params.append(calendar_id)
+    if start is not None:
+        filters += " AND tasks.due_date >= %s"; params.append(start.isoformat())
+    if end is not None:
+        filters += " AND tasks.due_date < %s"; params.append(end.isoformat())
+    after, after_params = "", []
+    if cursor:
+        score, task_id = decode_search_cursor(cursor)
+        # bm25 is better when lower, ts_rank when higher. ts_rank is a
+        # float4, rounded above so the cursor's score compares equal.
+        after = f"WHERE score {'<' if is_postgres else '>'} %s OR (score = %s AND id > %s)"
+        after_params = [score, score, task_id]
+    if is_postgres:
+        # The 'simple' configuration lowercases but keeps accents.
+        tsquery = " & ".join(f"'{w}':*" for w in WORD_RE.findall((text or "").lower())[:MAX_TERMS])
+        statement = f"""
+            SELECT * FROM (
+                SELECT {COLUMNS}, round(ts_rank(to_tsvector('simple', tasks.task), q)::numeric, 6)::float8 AS score
+                FROM tasks JOIN folders ON folders.id = tasks.folder_id, to_tsquery('simple', %s) q
+                WHERE tasks.user_id = %s AND to_tsvector('simple', tasks.task) @@ q{filters}
+            ) matches {after} ORDER BY score DESC, id LIMIT %s"""
+        params = [tsquery, user_id] + params
+    else:
+        match = " AND ".join(f'"u{int(user_id)}x{w}"*' for w in words)
+        statement = f"""
+            SELECT * FROM (
+                SELECT {COLUMNS}, bm25(tasks_fts) AS score
+                FROM tasks_fts JOIN tasks ON tasks.id = tasks_fts.rowid JOIN folders ON folders.id = tasks.folder_id
+                WHERE tasks_fts MATCH %s AND tasks.user_id = %s{filters}
+            ) {after} ORDER BY score, id LIMIT %s"""
+        params = [match, user_id] + params
+    cur.execute(sql(is_postgres, statement), params + after_params + [limit + 1])
+    rows = [dict(row) for row in cur.fetchall()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["score"], rows[-1]["id"])
+    return rows, next_cursor
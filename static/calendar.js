@@ -0,0 +1,472 @@
+const LANG = {
+    en: { back:'Back', print:'Print', day:'Day', week:'Week', month:'Month', year:'Year', prev:'Prev', next:'Next', today_btn:'Today', add_task_ph:'Add a new task...', end_optional:'End (optional)', no_repeat:'No repeat', daily:'🔁 Daily', weekly_on:'🔁 Weekly on', monthly_on:'🔁 Monthly on the', monthly_nth:'🔁 Monthly on the', monthly_last:'🔁 Monthly on the last', add_task:'+ Add Task', save:'💾 Save', cancel:'Cancel', no_tasks:'No tasks on this day. Add one above!', delete_task:'Delete this task?', all_day:'All Day', repeats_daily:'🔁 Repeats daily', every:'🔁 Every', repeats_monthly:'🔁 Repeats monthly', overdue:'Overdue', due_soon:'Due Soon', on_track:'On Track', done:'Done', printed:'Printed', recurring_legend:'🔁 Recurring', DAY_NAMES:['Sun','Mon','Tue','Wed','Thu','Fri','Sat'], DAY_FULL:['Sunday','Monday','Tuesday','Wednesday','Thursday','Friday','Saturday'], MONTH_NAMES:['January','February','March','April','May','June','July','August','September','October','November','December'], ORD:['','1st','2nd','3rd','4th','5th'], load_failed:'Could not load tasks. Check your connection and try again.' },
+    zh: { back:'返回', print:'打印', day:'日', week:'周', month:'月', year:'年', prev:'上一', next:'下一', today_btn:'今天', add_task_ph:'添加新任务...', end_optional:'结束（可选）', no_repeat:'不重复', daily:'🔁 每天', weekly_on:'🔁 每周', monthly_on:'🔁 每月', monthly_nth:'🔁 每月第', monthly_last:'🔁 每月最后一个', add_task:'+ 添加任务', save:'💾 保存', cancel:'取消', no_tasks:'今天没有任务，请在上方添加！', delete_task:'确认删除此任务？', all_day:'全天', repeats_daily:'🔁 每天重复', every:'🔁 每', repeats_monthly:'🔁 每月重复', overdue:'已逾期', due_soon:'即将到期', on_track:'进行中', done:'已完成', printed:'打印于', recurring_legend:'🔁 重复任务', DAY_NAMES:['日','一','二','三','四','五','六'], DAY_FULL:['周日','周一','周二','周三','周四','周五','周六'], MONTH_NAMES:['1月','2月','3月','4月','5月','6月','7月','8月','9月','10月','11月','12月'], ORD:['','第一','第二','第三','第四','第五'], load_failed:'无法加载任务，请检查网络后重试。' }
+};
+let currentLang = localStorage.getItem('lang') || 'en';
+function t(key){ return LANG[currentLang][key] || key; }
+function applyLang(){
+    document.querySelectorAll('[data-i18n]').forEach(el=>{ const k=el.dataset.i18n; if(LANG[currentLang][k]) el.textContent=LANG[currentLang][k]; });
+    document.querySelectorAll('[data-i18n-placeholder]').forEach(el=>{ const k=el.dataset.i18nPlaceholder; if(LANG[currentLang][k]) el.placeholder=LANG[currentLang][k]; });
+}
+function toggleLang(){ currentLang=currentLang==='en'?'zh':'en'; localStorage.setItem('lang',currentLang); applyLang(); updateLangBtn(); render(); }
+function updateLangBtn(){ document.getElementById('lang-btn').textContent=currentLang==='en'?'中文':'EN'; }
+function toggleDark(){ const n=document.documentElement.getAttribute('data-theme')==='dark'?'light':'dark'; document.documentElement.setAttribute('data-theme',n); localStorage.setItem('theme',n); document.getElementById('dark-btn').textContent=n==='dark'?'☀️':'🌙'; }
+function updateDarkBtn(){ document.getElementById('dark-btn').textContent=document.documentElement.getAttribute('data-theme')==='dark'?'☀️':'🌙'; }
+
+
+// Tasks and their occurrences are loaded per month from /api/occurrences;
+// the month containing today ships with the page.
+let tasksById={}, occByDate={};
+const monthLoads={};
+
+let currentView='day', currentDate=new Date(), selectedDate='', dragTaskId=null;
+const ORD_EN=['','1st','2nd','3rd','4th','5th'];
+const PX_PER_MIN=1;
+
+function timeToMinutes(s){ if(!s) return 0; const [h,m]=s.split(':').map(Number); return h*60+m; }
+function minutesToTime(m){ const h=Math.max(0,Math.min(23,Math.floor(m/60))); const min=Math.max(0,Math.min(59,m%60)); return `${String(h).padStart(2,'0')}:${String(min).padStart(2,'0')}`; }
+function formatTime(s){ if(!s) return ''; const [h,m]=s.split(':'); const hr=parseInt(h); const ampm=hr>=12?'PM':'AM'; const h12=hr%12||12; return `${h12}:${m}${ampm}`; }
+function formatTimeChinese(s){ if(!s) return ''; const [h,m]=s.split(':'); const hr=parseInt(h); const p=hr<6?'凌晨':hr<12?'上午':hr<18?'下午':'晚上'; const h12=hr%12||12; return `${p}${h12}:${m}`; }
+function displayTime(s){ if(!s) return ''; return currentLang==='zh'?formatTimeChinese(s):formatTime(s); }
+function displayTimeRange(start,end){ if(!start) return ''; const s=displayTime(start); return end?`${s} – ${displayTime(end)}`:s; }
+function hourLabel(h){ if(currentLang==='zh'){ const p=h<6?'凌晨':h<12?'上午':h<18?'下午':'晚上'; const h12=h%12||12; return h===0?'':` ${p}${h12}`; } if(h===0) return ''; if(h===12) return '12 PM'; return h<12?`${h} AM`:`${h-12} PM`; }
+function autoFillEndTime(startId,endId){ const sv=document.getElementById(startId).value; const el=document.getElementById(endId); if(sv&&!el.value){ el.value=minutesToTime(timeToMinutes(sv)+60); } }
+function sortTasksByTime(tasks){ return [...tasks].sort((a,b)=>{ if(!a.due_time&&!b.due_time) return 0; if(!a.due_time) return 1; if(!b.due_time) return -1; return a.due_time.localeCompare(b.due_time); }); }
+
+function layoutTasks(timedTasks){
+    if(!timedTasks.length) return [];
+    const sorted=[...timedTasks].sort((a,b)=>a.due_time.localeCompare(b.due_time));
+    sorted.forEach(t=>{ t._start=timeToMinutes(t.due_time); t._end=t.due_time_end?timeToMinutes(t.due_time_end):t._start+60; if(t._end<=t._start) t._end=t._start+60; });
+    const colEnds=[];
+    sorted.forEach(task=>{ let col=-1; for(let c=0;c<colEnds.length;c++){ if(task._start>=colEnds[c]){col=c;break;} } if(col===-1){col=colEnds.length;colEnds.push(0);} task._col=col; colEnds[col]=task._end; });
+    const totalCols=colEnds.length;
+    sorted.forEach(task=>{ task._numCols=totalCols; });
+    return sorted;
+}
+
+function ordSuffix(n){ if(currentLang==='zh') return t('ORD')[n]||n+''; if(n>=11&&n<=13) return n+'th'; switch(n%10){case 1:return n+'st';case 2:return n+'nd';case 3:return n+'rd';default:return n+'th';} }
+
+function updateRecurrenceOptions(dateStr,selectId){
+    const sel=document.getElementById(selectId); if(!sel||!dateStr) return;
+    const saved=sel.value;
+    const d=new Date(dateStr+'T00:00:00');
+    const dow=d.getDay(),dayName=t('DAY_FULL')[dow],dom=d.getDate(),occ=Math.ceil(dom/7);
+    const dim=new Date(d.getFullYear(),d.getMonth()+1,0).getDate(),isLast=(dom+7)>dim;
+    if(currentLang==='en'){
+        sel.innerHTML=`<option value="none">${t('no_repeat')}</option><option value="daily">${t('daily')}</option><option value="weekly">${t('weekly_on')} ${dayName}</option><option value="monthly">${t('monthly_on')} ${ordSuffix(dom)}</option><option value="monthly_weekday_${occ}_${dow}">${t('monthly_nth')} ${ordSuffix(occ)} ${dayName}</option>${isLast?`<option value="monthly_weekday_last_${dow}">${t('monthly_last')} ${dayName}</option>`:''}`;
+    } else {
+        sel.innerHTML=`<option value="none">${t('no_repeat')}</option><option value="daily">${t('daily')}</option><option value="weekly">${t('weekly_on')}${dayName}</option><option value="monthly">${t('monthly_on')}${dom}日</option><option value="monthly_weekday_${occ}_${dow}">🔁 每月${t('ORD')[occ]}个${dayName}</option>${isLast?`<option value="monthly_weekday_last_${dow}">🔁 每月最后一个${dayName}</option>`:''}`;
+    }
+    if([...sel.options].some(o=>o.value===saved)) sel.value=saved;
+}
+
+function findOccurrence(taskId,dateStr){ return (occByDate[dateStr]||[]).find(o=>o.task_id===taskId); }
+function isCompletedOnDate(task,dateStr){ const o=findOccurrence(task.id,dateStr); if(o) return o.done===1; return (!task.recurrence||task.recurrence==='none')&&task.done; }
+function getTaskClass(task,dateStr){ const d=dateStr||task.due_date; if(isCompletedOnDate(task,d)) return 'done'; if(!d) return 'ontrack'; if(d<today) return 'overdue'; if(d<=tomorrow) return 'warning'; return 'ontrack'; }
+function getTasksForDate(dateStr){ return sortTasksByTime((occByDate[dateStr]||[]).map(o=>tasksById[o.task_id]).filter(Boolean)); }
+
+function normTask(t){ return {id:t.id,task:t.task,due_date:t.due_date||'',due_time:t.due_time||'',due_time_end:t.due_time_end||'',done:!!t.done,recurrence:t.recurrence||'none'}; }
+function monthKey(d){ return `${d.getFullYear()}-${String(d.getMonth()+1).padStart(2,'0')}`; }
+// Bitmap windows carry {task_id: [occurs, done]} in base64, bit n = start + n days.
+function unpackBits(b64){ const s=atob(b64), bits=[]; for(let i=0;i<s.length;i++){ const c=s.charCodeAt(i); for(let j=0;j<8;j++) bits.push((c>>j)&1); } return bits; }
+function windowDays(data){ const days=[]; for(let d=new Date(data.start+'T00:00:00');formatDate(d)<data.end;d.setDate(d.getDate()+1)) days.push(formatDate(d)); return days; }
+function windowOccurrences(data,days){
+    if(data.encoding!=='bitmap') return data.occurrences;
+    const list=[];
+    Object.entries(data.occurrences).forEach(([id,[occurs,done]])=>{ const o=unpackBits(occurs), k=unpackBits(done); days.forEach((ds,n)=>{ if(o[n]) list.push({task_id:+id,date:ds,done:k[n]}); }); });
+    return list;
+}
+function mergeWindow(data){
+    data.tasks.forEach(task=>{ tasksById[task.id]=normTask(task); });
+    const days=windowDays(data);
+    days.forEach(ds=>{ delete occByDate[ds]; });
+    windowOccurrences(data,days).forEach(o=>{ (occByDate[o.date]=occByDate[o.date]||[]).push(o); });
+}
+async function loadWindow(start,end){
+    const res=await fetch(`/api/occurrences?calendar_id=${calendarId}&start=${formatDate(start)}&end=${formatDate(end)}&encoding=bitmap`);
+    if(!res.ok) throw new Error(`/api/occurrences: HTTP ${res.status}`);
+    mergeWindow(await res.json());
+}
+function showLoadError(show){ const el=document.getElementById('load-error'); el.textContent=t('load_failed'); el.hidden=!show; }
+function rangeLoaded(start,end){
+    for(let d=new Date(start.getFullYear(),start.getMonth(),1);d<end;d.setMonth(d.getMonth()+1)) if(!monthLoads[monthKey(d)]) return false;
+    return true;
+}
+function ensureRange(start,end){
+    // Fetch the months overlapping [start,end) that are not loaded or in flight, in runs of at most 12.
+    const waits=[]; let run=[];
+    // A failed run is forgotten so the next call retries it.
+    const flush=()=>{
+        if(!run.length) return;
+        const months=run, a=run[0], b=new Date(run[run.length-1]); b.setMonth(b.getMonth()+1);
+        const p=loadWindow(a,b).catch(err=>{
+            console.error(err);
+            months.forEach(m=>{ if(monthLoads[monthKey(m)]===p) delete monthLoads[monthKey(m)]; });
+        });
+        months.forEach(m=>{ monthLoads[monthKey(m)]=p; }); waits.push(p); run=[];
+    };
+    for(let d=new Date(start.getFullYear(),start.getMonth(),1);d<end;d.setMonth(d.getMonth()+1)){
+        const k=monthKey(d);
+        if(monthLoads[k]){ flush(); waits.push(monthLoads[k]); } else { run.push(new Date(d)); if(run.length===12) flush(); }
+    }
+    flush();
+    return Promise.all(waits);
+}
+function viewRange(view,date){
+    const y=date.getFullYear(),m=date.getMonth();
+    if(view==='day'){ const s=new Date(y,m,date.getDate()); return [s,new Date(y,m,date.getDate()+1)]; }
+    if(view==='week'){ const s=new Date(y,m,date.getDate()-date.getDay()); return [s,new Date(s.getFullYear(),s.getMonth(),s.getDate()+7)]; }
+    if(view==='month') return [new Date(y,m,1),new Date(y,m+1,1)];
+    return [new Date(y,0,1),new Date(y+1,0,1)];
+}
+function stepDate(date,dir){ const d=new Date(date); if(currentView==='day') d.setDate(d.getDate()+dir); else if(currentView==='week') d.setDate(d.getDate()+dir*7); else if(currentView==='month') d.setMonth(d.getMonth()+dir); else d.setFullYear(d.getFullYear()+dir); return d; }
+function prefetchAdjacent(){ [-1,1].forEach(dir=>{ const [s,e]=viewRange(currentView,stepDate(currentDate,dir)); ensureRange(s,e); }); }
+async function refresh(){
+    // After a write the cached months may be stale: drop them and reload what is on screen.
+    Object.keys(monthLoads).forEach(k=>delete monthLoads[k]); tasksById={}; occByDate={};
+    const ranges=[viewRange(currentView,currentDate)];
+    if(selectedDate){ const d=new Date(selectedDate+'T00:00:00'); ranges.push(viewRange('day',d)); }
+    await Promise.all(ranges.map(([s,e])=>ensureRange(s,e)));
+    renderModalTasks(); render();
+}
+function recurLabel(r,due_date){
+    if(!r||r==='none') return '';
+    if(r==='daily') return t('repeats_daily');
+    if(r==='weekly'){ if(due_date){const d=new Date(due_date+'T00:00:00');return `${t('every')} ${t('DAY_FULL')[d.getDay()]}`;} return t('repeats_daily'); }
+    if(r==='monthly') return t('repeats_monthly');
+    if(r.startsWith('monthly_weekday_')){ const parts=r.split('_'),occ=parts[2],dow=parseInt(parts[3]),dayName=t('DAY_FULL')[dow]; if(currentLang==='en') return occ==='last'?`🔁 Last ${dayName} of month`:`🔁 ${ORD_EN[parseInt(occ)]} ${dayName} of month`; return occ==='last'?`🔁 每月最后一个${dayName}`:`🔁 每月第${parseInt(occ)}个${dayName}`; }
+    return '';
+}
+function formatDate(d){ return `${d.getFullYear()}-${String(d.getMonth()+1).padStart(2,'0')}-${String(d.getDate()).padStart(2,'0')}`; }
+function friendlyDate(dateStr){ const [y,m,d]=dateStr.split('-'); if(currentLang==='zh') return `${y}年${parseInt(m)}月${parseInt(d)}日`; return new Date(y,m-1,d).toLocaleDateString('en-US',{weekday:'long',year:'numeric',month:'long',day:'numeric'}); }
+
+function switchView(view){ currentView=view; document.querySelectorAll('.view-btn').forEach(b=>b.classList.remove('active')); document.getElementById('btn-'+view).classList.add('active'); render(); }
+function navigate(dir){ currentDate=stepDate(currentDate,dir); render(); }
+function goToToday(){ currentDate=new Date(); render(); }
+function jumpToDay(dateStr){ const [y,m,d]=dateStr.split('-').map(Number); currentDate=new Date(y,m-1,d); switchView('day'); }
+let renderSeq=0;
+function render(){
+    const seq=++renderSeq, [s,e]=viewRange(currentView,currentDate);
+    ensureRange(s,e).then(()=>{ if(seq!==renderSeq) return; showLoadError(!rangeLoaded(s,e)); draw(); prefetchAdjacent(); });
+}
+function draw(){ if(currentView==='day') renderDay(); else if(currentView==='week') renderWeek(); else if(currentView==='month') renderMonth(); else renderYear(); }
+
+function onDragStart(e,taskId){ dragTaskId=taskId; e.dataTransfer.effectAllowed='move'; e.dataTransfer.setData('text/plain',taskId); }
+function onDragOver(e,el){ e.preventDefault(); document.querySelectorAll('.drag-over').forEach(d=>d.classList.remove('drag-over')); el.classList.add('drag-over'); }
+function onDragLeave(el){ el.classList.remove('drag-over'); }
+async function onDrop(e,dateStr,el){ e.preventDefault(); el.classList.remove('drag-over'); if(!dragTaskId) return; const taskId=dragTaskId; dragTaskId=null; const task=tasksById[taskId]; if(!task) return; await fetch(`/api/task/edit/${taskId}`,{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({task:task.task,due_date:dateStr,due_time:task.due_time,due_time_end:task.due_time_end,recurrence:task.recurrence})}); await refresh(); }
+async function onDayGridDrop(e,dateStr){
+    e.preventDefault(); const grid=document.getElementById('day-time-grid'); if(grid) grid.classList.remove('drag-active');
+    if(!dragTaskId) return; const taskId=dragTaskId; dragTaskId=null;
+    const task=tasksById[taskId]; if(!task) return;
+    const gridEl=document.getElementById('day-time-grid'); const rect=gridEl.getBoundingClientRect();
+    const y=e.clientY-rect.top; const snappedMins=Math.round(Math.max(0,Math.min(1439,y))/15)*15;
+    const newTime=minutesToTime(snappedMins);
+    let newEnd=task.due_time_end;
+    if(task.due_time&&task.due_time_end){ const dur=timeToMinutes(task.due_time_end)-timeToMinutes(task.due_time); newEnd=minutesToTime(Math.min(1439,snappedMins+dur)); }
+    await fetch(`/api/task/edit/${taskId}`,{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({task:task.task,due_date:dateStr,due_time:newTime,due_time_end:newEnd||'',recurrence:task.recurrence})});
+    await refresh();
+}
+
+function renderDay(){
+    const dateStr=formatDate(currentDate);
+    const DN=t('DAY_FULL');
+    if(currentLang==='zh') document.getElementById('nav-title').textContent=`${currentDate.getFullYear()}年${currentDate.getMonth()+1}月${currentDate.getDate()}日 ${DN[currentDate.getDay()]}`;
+    else document.getElementById('nav-title').textContent=currentDate.toLocaleDateString('en-US',{weekday:'long',year:'numeric',month:'long',day:'numeric'});
+    const dayTasks=getTasksForDate(dateStr);
+    const alldayTasks=dayTasks.filter(t=>!t.due_time);
+    const timedTasks=dayTasks.filter(t=>t.due_time);
+    const laidOut=layoutTasks(timedTasks);
+    const isToday=dateStr===today;
+    const now=new Date();
+    let html=`<div class="day-view">
+    <div class="day-allday" onclick="openModal('${dateStr}')" ondragover="onDragOver(event,this)" ondragleave="onDragLeave(this)" ondrop="onDrop(event,'${dateStr}',this)">
+        <div class="day-allday-label">${t('all_day')}</div>
+        <div class="day-allday-divider"></div>
+        <div class="day-allday-tasks">${alldayTasks.length?alldayTasks.map(task=>pillHtml(task,dateStr)).join(''):`<span style="font-size:12px;color:var(--muted);padding-top:4px;">+ ${t('add_task_ph')}</span>`}</div>
+    </div>
+    <div class="day-scroll" id="day-scroll">
+    <div class="day-time-grid" id="day-time-grid"
+        onclick="onDayGridClick(event,'${dateStr}')"
+        ondragover="event.preventDefault();document.getElementById('day-time-grid').classList.add('drag-active')"
+        ondragleave="document.getElementById('day-time-grid').classList.remove('drag-active')"
+        ondrop="onDayGridDrop(event,'${dateStr}')">`;
+    for(let h=0;h<24;h++){
+        const topPx=h*60;
+        html+=`<div class="day-hour-label-abs" style="top:${topPx}px">${hourLabel(h)}</div>`;
+        html+=`<div class="day-hour-line" style="top:${topPx}px"></div>`;
+        if(h<23) html+=`<div class="day-half-line-abs" style="top:${topPx+30}px"></div>`;
+    }
+    laidOut.forEach(task=>{
+        const cls=getTaskClass(task,dateStr);
+        const top=task._start*PX_PER_MIN;
+        const height=Math.max((task._end-task._start)*PX_PER_MIN,28);
+        const leftPct=task._col/task._numCols*100;
+        const widthPct=100/task._numCols;
+        const timeRange=displayTimeRange(task.due_time,task.due_time_end);
+        const isShort=height<44;
+        const recurIcon=task.recurrence!=='none'?' 🔁':'';
+        html+=`<div class="day-task-block ${cls}" draggable="true" ondragstart="onDragStart(event,${task.id})"
+            onclick="event.stopPropagation();openModalWithTime('${dateStr}','${task.due_time}','${task.due_time_end||''}')"
+            style="top:${top}px;height:${height}px;left:calc(${leftPct}%+2px);width:calc(${widthPct}%-4px);">
+            ${isShort?`<div class="day-task-inline"><span class="day-task-time-sm">${timeRange}</span><span>${task.task}${recurIcon}</span></div>`:`<div class="day-task-time-range">${timeRange}</div><div class="day-task-title">${task.task}${recurIcon}</div>`}
+        </div>`;
+    });
+    if(isToday){ const nowMins=now.getHours()*60+now.getMinutes(); html+=`<div class="current-time-line" style="top:${nowMins}px"><div class="current-time-dot"></div></div>`; }
+    html+=`</div></div></div>`;
+    document.getElementById('calendar-container').innerHTML=html;
+    const scrollTo=isToday?Math.max(0,now.getHours()*60-60):8*60;
+    setTimeout(()=>{ const s=document.getElementById('day-scroll'); if(s) s.scrollTop=scrollTo; },50);
+}
+
+function onDayGridClick(e,dateStr){
+    if(e.target.closest('.day-task-block')) return;
+    const gridEl=document.getElementById('day-time-grid'); const rect=gridEl.getBoundingClientRect();
+    const y=e.clientY-rect.top; const snappedMins=Math.round(Math.max(0,Math.min(1439,y))/15)*15;
+    openModalWithTime(dateStr,minutesToTime(snappedMins),minutesToTime(Math.min(1439,snappedMins+60)));
+}
+
+function renderWeek(){
+    const start=new Date(currentDate); start.setDate(start.getDate()-start.getDay());
+    const end=new Date(start); end.setDate(end.getDate()+6);
+    const DN=t('DAY_NAMES'),MN=t('MONTH_NAMES');
+    document.getElementById('nav-title').textContent=`${MN[start.getMonth()]} ${start.getDate()} – ${MN[end.getMonth()]} ${end.getDate()}, ${end.getFullYear()}`;
+    let html='<div class="week-grid">';
+    for(let i=0;i<7;i++){
+        const d=new Date(start); d.setDate(d.getDate()+i); const dateStr=formatDate(d);
+        const dayTasks=getTasksForDate(dateStr);
+        html+=`<div class="week-day ${dateStr===today?'today':''}" onclick="openModal('${dateStr}')" ondragover="onDragOver(event,this)" ondragleave="onDragLeave(this)" ondrop="onDrop(event,'${dateStr}',this)">
+            <div class="week-day-header">${DN[d.getDay()]}</div>
+            <div class="week-day-number" onclick="event.stopPropagation();jumpToDay('${dateStr}')" style="cursor:pointer;text-decoration:underline dotted;text-underline-offset:3px;">${d.getDate()}</div>
+            ${dayTasks.map(t=>pillHtml(t,dateStr)).join('')}
+        </div>`;
+    }
+    html+='</div>';
+    document.getElementById('calendar-container').innerHTML=html;
+}
+
+function renderMonth(){
+    const year=currentDate.getFullYear(),month=currentDate.getMonth();
+    const DN=t('DAY_NAMES'),MN=t('MONTH_NAMES');
+    document.getElementById('nav-title').textContent=`${MN[month]} ${year}`;
+    const firstDay=new Date(year,month,1).getDay(),daysInMonth=new Date(year,month+1,0).getDate(),daysInPrev=new Date(year,month,0).getDate();
+    let html='<div class="month-grid">';
+    DN.forEach(d=>{html+=`<div class="month-day-name">${d}</div>`;});
+    for(let i=firstDay-1;i>=0;i--) html+=`<div class="month-day other-month"><div class="month-day-number">${daysInPrev-i}</div></div>`;
+    for(let d=1;d<=daysInMonth;d++){
+        const dateStr=`${year}-${String(month+1).padStart(2,'0')}-${String(d).padStart(2,'0')}`;
+        const dayTasks=getTasksForDate(dateStr);
+        html+=`<div class="month-day ${dateStr===today?'today':''}" onclick="openModal('${dateStr}')" ondragover="onDragOver(event,this)" ondragleave="onDragLeave(this)" ondrop="onDrop(event,'${dateStr}',this)">
+            <div class="month-day-number" onclick="event.stopPropagation();jumpToDay('${dateStr}')" style="cursor:pointer;text-decoration:underline dotted;text-underline-offset:3px;display:inline-block;">${d}</div>
+            ${dayTasks.map(t=>pillHtml(t,dateStr)).join('')}
+        </div>`;
+    }
+    const total=Math.ceil((firstDay+daysInMonth)/7)*7;
+    for(let d=1;d<=total-firstDay-daysInMonth;d++) html+=`<div class="month-day other-month"><div class="month-day-number">${d}</div></div>`;
+    html+='</div>';
+    document.getElementById('calendar-container').innerHTML=html;
+}
+
+function renderYear(){
+    const year=currentDate.getFullYear(),DN=t('DAY_NAMES'),MN=t('MONTH_NAMES');
+    document.getElementById('nav-title').textContent=`${year}`;
+    let html='<div class="year-grid">';
+    for(let m=0;m<12;m++){
+        const firstDay=new Date(year,m,1).getDay(),daysInMonth=new Date(year,m+1,0).getDate();
+        html+=`<div class="year-month"><div class="year-month-title">${MN[m]}</div><div class="year-month-grid">`;
+        DN.forEach(d=>{html+=`<div class="year-day-name">${d[0]}</div>`;});
+        for(let i=0;i<firstDay;i++) html+=`<div class="year-day"></div>`;
+        for(let d=1;d<=daysInMonth;d++){
+            const dateStr=`${year}-${String(m+1).padStart(2,'0')}-${String(d).padStart(2,'0')}`;
+            const dayTasks=getTasksForDate(dateStr);
+            const dots=dayTasks.length?'<div class="dots-row">'+dayTasks.map(t=>`<span class="dot ${getTaskClass(t,dateStr)}"></span>`).join('')+'</div>':'';
+            html+=`<div class="year-day ${dateStr===today?'today':''}" onclick="jumpToDay('${dateStr}')">${d}${dots}</div>`;
+        }
+        html+='</div></div>';
+    }
+    html+='</div>';
+    document.getElementById('calendar-container').innerHTML=html;
+}
+
+function pillHtml(task,dateStr){
+    const cls=getTaskClass(task,dateStr);
+    const rc=task.recurrence&&task.recurrence!=='none'?' recurring':'';
+    const tl=task.due_time?`<span class="task-time">${displayTimeRange(task.due_time,task.due_time_end)}</span>`:'';
+    return `<span class="task-pill ${cls}${rc}" draggable="true" ondragstart="onDragStart(event,${task.id})" title="${task.task}${task.due_time?' @ '+displayTimeRange(task.due_time,task.due_time_end):''}" onclick="event.stopPropagation()">${tl}${task.task}</span>`;
+}
+
+async function triggerPrint(){ const [s,e]=viewRange(currentView==='week'?'month':currentView,currentDate); await ensureRange(s,e); if(currentView==='day') buildPrintDay(formatDate(currentDate)); else if(currentView==='year') buildPrintYear(currentDate.getFullYear()); else buildPrintMonth(currentDate.getFullYear(),currentDate.getMonth()); window.print(); }
+
+function buildPrintDay(dateStr){
+    const [y,m,d]=dateStr.split('-').map(Number);
+    const dayTasks=getTasksForDate(dateStr);
+    const alldayTasks=dayTasks.filter(t=>!t.due_time);
+    const timedTasks=dayTasks.filter(t=>t.due_time);
+    const printDate=new Date().toLocaleDateString(currentLang==='zh'?'zh-CN':'en-US',{month:'long',day:'numeric',year:'numeric'});
+    const titleDate=currentLang==='zh'?`${y}年${m}月${d}日`:new Date(y,m-1,d).toLocaleDateString('en-US',{weekday:'long',year:'numeric',month:'long',day:'numeric'});
+    const byHour={};
+    timedTasks.forEach(task=>{ const h=parseInt(task.due_time.split(':')[0]); if(!byHour[h]) byHour[h]=[]; byHour[h].push(task); });
+    let html=`<div class="print-header"><div><div class="print-title">📅 ${calendarName}</div><div class="print-subtitle">${titleDate}</div></div><div class="print-subtitle">${t('printed')} ${printDate}</div></div>`;
+    if(alldayTasks.length){ html+=`<div style="margin-bottom:10px;"><div style="font-size:10px;font-weight:700;color:#6b7280;text-transform:uppercase;letter-spacing:.5px;margin-bottom:4px;">${t('all_day')}</div>${alldayTasks.map(t=>`<span class="print-task ${getTaskClass(t,dateStr)}" style="display:inline-block;margin:2px;">${t.task}</span>`).join('')}</div>`; }
+    html+=`<table class="print-day-sched">`;
+    for(let h=0;h<24;h++){
+        const tasks=byHour[h]||[];
+        if(!tasks.length&&(h<7||h>21)) continue;
+        html+=`<tr><td class="sched-time">${h===0?'12 AM':h<12?h+' AM':h===12?'12 PM':(h-12)+' PM'}</td><td class="sched-tasks">${tasks.map(t=>`<span class="print-task ${getTaskClass(t,dateStr)}">${displayTimeRange(t.due_time,t.due_time_end)} ${t.task}${t.recurrence!=='none'?' 🔁':''}</span>`).join('')}</td></tr>`;
+    }
+    html+=`</table><div class="print-legend"><div class="legend-item"><div class="legend-dot overdue"></div> ${t('overdue')}</div><div class="legend-item"><div class="legend-dot warning"></div> ${t('due_soon')}</div><div class="legend-item"><div class="legend-dot ontrack"></div> ${t('on_track')}</div><div class="legend-item"><div class="legend-dot done"></div> ${t('done')}</div></div>`;
+    document.getElementById('print-view').innerHTML=html;
+}
+
+function buildPrintMonth(year,month){
+    const MN=t('MONTH_NAMES'),DN=t('DAY_NAMES');
+    const firstDay=new Date(year,month,1).getDay(),daysInMonth=new Date(year,month+1,0).getDate(),daysInPrev=new Date(year,month,0).getDate();
+    const printDate=new Date().toLocaleDateString(currentLang==='zh'?'zh-CN':'en-US',{month:'long',day:'numeric',year:'numeric'});
+    let html=`<div class="print-header"><div><div class="print-title">📅 ${calendarName}</div><div class="print-subtitle">${MN[month]} ${year}</div></div><div class="print-subtitle">${t('printed')} ${printDate}</div></div><div class="print-month-grid">`;
+    DN.forEach(d=>{html+=`<div class="print-day-name">${d}</div>`;});
+    for(let i=firstDay-1;i>=0;i--) html+=`<div class="print-day other-month"><div class="print-day-number">${daysInPrev-i}</div></div>`;
+    for(let d=1;d<=daysInMonth;d++){
+        const dateStr=`${year}-${String(month+1).padStart(2,'0')}-${String(d).padStart(2,'0')}`;
+        const dayTasks=getTasksForDate(dateStr);
+        html+=`<div class="print-day ${dateStr===today?'today-print':''}"><div class="print-day-number">${d}</div>${dayTasks.map(t=>`<span class="print-task ${getTaskClass(t,dateStr)}">${t.due_time?displayTimeRange(t.due_time,t.due_time_end)+' ':''}${t.task}${t.recurrence!=='none'?' 🔁':''}</span>`).join('')}</div>`;
+    }
+    const total=Math.ceil((firstDay+daysInMonth)/7)*7;
+    for(let d=1;d<=total-firstDay-daysInMonth;d++) html+=`<div class="print-day other-month"><div class="print-day-number">${d}</div></div>`;
+    html+=`</div><div class="print-legend"><div class="legend-item"><div class="legend-dot overdue"></div> ${t('overdue')}</div><div class="legend-item"><div class="legend-dot warning"></div> ${t('due_soon')}</div><div class="legend-item"><div class="legend-dot ontrack"></div> ${t('on_track')}</div><div class="legend-item"><div class="legend-dot done"></div> ${t('done')}</div><div class="legend-item">${t('recurring_legend')}</div></div>`;
+    document.getElementById('print-view').innerHTML=html;
+}
+
+function buildPrintYear(year){
+    const MN=t('MONTH_NAMES'),DN=t('DAY_NAMES');
+    const printDate=new Date().toLocaleDateString(currentLang==='zh'?'zh-CN':'en-US',{month:'long',day:'numeric',year:'numeric'});
+    let html=`<div class="print-header"><div><div class="print-title">📅 ${calendarName}</div><div class="print-subtitle">${year}</div></div><div class="print-subtitle">${t('printed')} ${printDate}</div></div><div class="print-year-grid">`;
+    for(let m=0;m<12;m++){
+        const firstDay=new Date(year,m,1).getDay(),daysInMonth=new Date(year,m+1,0).getDate();
+        html+=`<div class="print-year-month"><div class="print-year-month-title">${MN[m]}</div><div class="print-year-mini-grid">`;
+        DN.forEach(d=>{html+=`<div class="print-year-day-name">${d[0]}</div>`;});
+        for(let i=0;i<firstDay;i++) html+=`<div class="print-year-day"></div>`;
+        for(let d=1;d<=daysInMonth;d++){
+            const dateStr=`${year}-${String(m+1).padStart(2,'0')}-${String(d).padStart(2,'0')}`;
+            const dayTasks=getTasksForDate(dateStr);
+            const dots=dayTasks.length?'<div class="print-year-dots">'+dayTasks.map(t=>`<span class="print-year-dot ${getTaskClass(t,dateStr)}"></span>`).join('')+'</div>':'';
+            html+=`<div class="print-year-day ${dateStr===today?'today-print':''} ${dayTasks.length?'has-tasks':''}">${d}${dots}</div>`;
+        }
+        html+='</div></div>';
+    }
+    html+=`</div><div class="print-legend"><div class="legend-item"><div class="legend-dot overdue"></div> ${t('overdue')}</div><div class="legend-item"><div class="legend-dot warning"></div> ${t('due_soon')}</div><div class="legend-item"><div class="legend-dot ontrack"></div> ${t('on_track')}</div><div class="legend-item"><div class="legend-dot done"></div> ${t('done')}</div></div>`;
+    document.getElementById('print-view').innerHTML=html;
+}
+
+function openModal(dateStr){ openModalWithTime(dateStr,'',''); }
+function openModalWithTime(dateStr,startTime,endTime){
+    selectedDate=dateStr;
+    document.getElementById('modal-title').textContent='📅 '+friendlyDate(dateStr);
+    document.getElementById('new-task-name').value='';
+    document.getElementById('new-task-date').value=dateStr;
+    document.getElementById('new-task-time').value=startTime||'';
+    document.getElementById('new-task-time-end').value=endTime||'';
+    updateRecurrenceOptions(dateStr,'new-task-recurrence');
+    document.getElementById('modal-overlay').classList.add('open');
+    renderModalTasks();
+}
+function closeModal(){ document.getElementById('modal-overlay').classList.remove('open'); }
+function handleOverlayClick(e){ if(e.target===document.getElementById('modal-overlay')) closeModal(); }
+
+function renderModalTasks(){
+    const dayTasks=getTasksForDate(selectedDate);
+    const body=document.getElementById('modal-body');
+    if(!dayTasks.length){ body.innerHTML=`<div class="modal-empty">${t('no_tasks')}</div>`; return; }
+    body.innerHTML=dayTasks.map(task=>{
+        const cls=getTaskClass(task,selectedDate);
+        const isDone=isCompletedOnDate(task,selectedDate);
+        const isRec=task.recurrence&&task.recurrence!=='none';
+        const timeDisplay=task.due_time?`<span class="modal-task-time">🕐 ${displayTimeRange(task.due_time,task.due_time_end)}</span>`:'';
+        return `<div class="modal-task ${cls}" id="modal-task-${task.id}">
+            <div class="modal-task-row">
+                <div class="modal-task-info">
+                    <span class="modal-task-name ${isDone?'done-text':''}">${task.task}</span>
+                    ${timeDisplay}
+                    ${isRec?`<span class="modal-task-recur">${recurLabel(task.recurrence,task.due_date)}</span>`:''}
+                </div>
+                ${task.archived_at?'':`<div class="modal-task-actions">
+                    <button class="btn-small btn-toggle ${isDone?'undo':''}" onclick="toggleTask(${task.id},'${selectedDate}')">${isDone?t('done'):'✔'}</button>
+                    <button class="btn-small btn-edit" onclick="toggleEditForm(${task.id})">✏️</button>
+                    <button class="btn-small btn-delete" onclick="deleteTask(${task.id})">🗑️</button>
+                </div>`}
+            </div>
+            <div class="edit-form" id="edit-form-${task.id}">
+                <input type="text" id="edit-name-${task.id}" value="${task.task}">
+                <input type="date" id="edit-date-${task.id}" value="${task.due_date}" onchange="updateRecurrenceOptions(this.value,'edit-recur-${task.id}')">
+                <div class="edit-time-row">
+                    <span style="font-size:13px;">⏰</span>
+                    <input type="time" id="edit-time-${task.id}" value="${task.due_time||''}" onchange="autoFillEndTime('edit-time-${task.id}','edit-time-end-${task.id}')">
+                    <span class="edit-time-sep">→</span>
+                    <input type="time" id="edit-time-end-${task.id}" value="${task.due_time_end||''}">
+                </div>
+                <select id="edit-recur-${task.id}"><option value="none">${t('no_repeat')}</option></select>
+                <div class="edit-form-btns">
+                    <button class="btn-small btn-save" onclick="saveEdit(${task.id})">${t('save')}</button>
+                    <button class="btn-small btn-cancel" onclick="toggleEditForm(${task.id})">${t('cancel')}</button>
+                </div>
+            </div>
+        </div>`;
+    }).join('');
+}
+
+function toggleEditForm(taskId){
+    const form=document.getElementById(`edit-form-${taskId}`);
+    form.classList.toggle('open');
+    if(form.classList.contains('open')){
+        const dateVal=document.getElementById(`edit-date-${taskId}`).value;
+        const task=tasksById[taskId];
+        updateRecurrenceOptions(dateVal,`edit-recur-${taskId}`);
+        const sel=document.getElementById(`edit-recur-${taskId}`);
+        if(task&&[...sel.options].some(o=>o.value===task.recurrence)) sel.value=task.recurrence;
+    }
+}
+
+async function addTask(){
+    const name=document.getElementById('new-task-name').value.trim();
+    const due_date=document.getElementById('new-task-date').value;
+    const due_time=document.getElementById('new-task-time').value;
+    const due_time_end=document.getElementById('new-task-time-end').value;
+    const recurrence=document.getElementById('new-task-recurrence').value;
+    if(!name) return;
+    const res=await fetch('/api/task/add',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({task:name,due_date,due_time,due_time_end,calendar_id:calendarId,recurrence})});
+    await res.json();
+    document.getElementById('new-task-name').value='';
+    document.getElementById('new-task-time').value='';
+    document.getElementById('new-task-time-end').value='';
+    await refresh();
+}
+
+async function toggleTask(taskId,dateStr){
+    const res=await fetch(`/api/task/toggle/${taskId}`,{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({date:dateStr})});
+    const data=await res.json();
+    const task=tasksById[taskId];
+    if(data.new_task){ await refresh(); return; }
+    const o=findOccurrence(taskId,dateStr); if(o) o.done=data.done;
+    if(task&&(!task.recurrence||task.recurrence==='none')) task.done=data.done===1;
+    renderModalTasks(); render();
+}
+
+async function saveEdit(taskId){
+    const name=document.getElementById(`edit-name-${taskId}`).value.trim();
+    const due_date=document.getElementById(`edit-date-${taskId}`).value;
+    const due_time=document.getElementById(`edit-time-${taskId}`).value;
+    const due_time_end=document.getElementById(`edit-time-end-${taskId}`).value;
+    const recurrence=document.getElementById(`edit-recur-${taskId}`).value;
+    if(!name) return;
+    await fetch(`/api/task/edit/${taskId}`,{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({task:name,due_date,due_time,due_time_end,recurrence})});
+    if(due_date!==selectedDate) selectedDate=due_date;
+    await refresh();
+}
+
+async function deleteTask(taskId){
+    if(!confirm(t('delete_task'))) return;
+    await fetch(`/api/task/delete/${taskId}`,{method:'POST'});
+    await refresh();
+}
+
+(function(){ const w=initialWindow; mergeWindow(w); const s=new Date(w.start+'T00:00:00'); monthLoads[monthKey(s)]=Promise.resolve(); })();
+updateDarkBtn(); applyLang(); updateLangBtn(); render();
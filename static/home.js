@@ -0,0 +1,40 @@
+const LANG = {
+    en: { my_calendars:'My Calendars', welcome_back:'Welcome back', settings:'Settings', logout:'Log out', new_cal_ph:'New calendar name (e.g. Work, Personal, Travel...)', create:'+ Create', click_rename:'Click name to rename', delete:'Delete', delete_confirm:'Delete {name} and all its tasks?', progress:'Progress', complete:'complete', overdue:'overdue', due_soon:'due soon', on_track:'on track', no_tasks_yet:'No tasks yet', total:'Total', done:'Done', left:'Left', no_calendars:'No calendars yet. Create your first one above!' },
+    zh: { my_calendars:'我的日历', welcome_back:'欢迎回来', settings:'设置', logout:'退出登录', new_cal_ph:'新日历名称（如工作、个人、旅行...）', create:'+ 创建', click_rename:'点击名称重命名', delete:'删除', delete_confirm:'确认删除"{name}"及其所有任务？', progress:'进度', complete:'已完成', overdue:'已逾期', due_soon:'即将到期', on_track:'进行中', no_tasks_yet:'暂无任务', total:'总计', done:'完成', left:'剩余', no_calendars:'暂无日历，请在上方创建第一个！' }
+};
+let currentLang = localStorage.getItem('lang') || 'en';
+function t(key) { return LANG[currentLang][key] || key; }
+function applyLang() {
+    document.querySelectorAll('[data-i18n]').forEach(el => { const k=el.dataset.i18n; if(LANG[currentLang][k]) el.textContent=LANG[currentLang][k]; });
+    document.querySelectorAll('[data-i18n-placeholder]').forEach(el => { const k=el.dataset.i18nPlaceholder; if(LANG[currentLang][k]) el.placeholder=LANG[currentLang][k]; });
+}
+function toggleLang() { currentLang=currentLang==='en'?'zh':'en'; localStorage.setItem('lang',currentLang); applyLang(); updateLangBtn(); }
+function updateLangBtn() { document.getElementById('lang-btn').textContent=currentLang==='en'?'中文':'EN'; }
+function toggleDark() { const n=document.documentElement.getAttribute('data-theme')==='dark'?'light':'dark'; document.documentElement.setAttribute('data-theme',n); localStorage.setItem('theme',n); document.getElementById('dark-btn').textContent=n==='dark'?'☀️':'🌙'; }
+function updateDarkBtn() { const isDark=document.documentElement.getAttribute('data-theme')==='dark'; document.getElementById('dark-btn').textContent=isDark?'☀️':'🌙'; }
+
+function startRename(calId, el, event) {
+    event.stopPropagation(); event.preventDefault();
+    const currentName = el.textContent.trim();
+    const input = document.createElement('input');
+    input.type='text'; input.value=currentName; input.className='rename-input';
+    input.onclick=e=>{e.stopPropagation();e.preventDefault();};
+    input.onblur=()=>saveRename(calId, input, currentName);
+    input.onkeydown=e=>{ if(e.key==='Enter') input.blur(); if(e.key==='Escape'){el.textContent=currentName; el.onclick=(ev)=>startRename(calId,el,ev);}};
+    el.textContent=''; el.onclick=null; el.appendChild(input);
+    input.focus(); input.select();
+}
+
+async function saveRename(calId, input, fallback) {
+    const name=input.value.trim();
+    const el=document.getElementById(`cal-name-${calId}`);
+    if(!name){el.textContent=fallback;el.onclick=(ev)=>startRename(calId,el,ev);return;}
+    try {
+        const res=await fetch(`/api/calendar/rename/${calId}`,{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({name})});
+        const data=await res.json();
+        el.textContent=data.success?data.name:fallback;
+    } catch { el.textContent=fallback; }
+    el.onclick=(ev)=>startRename(calId,el,ev);
+}
+
+updateDarkBtn(); applyLang(); updateLangBtn();
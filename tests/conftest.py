@@ -0,0 +1,51 @@
+import itertools
+import os
+import re
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# The app reads its configuration at import time.
+os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ["BCRYPT_LOG_ROUNDS"] = "4"
+os.environ.pop("DATABASE_URL", None)
+
+import app as appmod  # noqa: E402
+import migrations  # noqa: E402
+
+_users = itertools.count(1)
+
+
+@pytest.fixture(scope="session")
+def app():
+    appmod.app.config["TESTING"] = True
+    with appmod.app.app_context():
+        migrations.migrate(*appmod.get_db())
+    return appmod.app
+
+
+@pytest.fixture
+def db(app):
+    with app.app_context():
+        yield appmod.get_db()
+
+
+@pytest.fixture
+def client(app):
+    """A logged-in client, with its user's id as ``user_id`` and its first
+    calendar's id as ``calendar_id``."""
+    client = app.test_client()
+    username = f"user{next(_users)}"
+    client.post("/register", data={"username": username, "password": "pw"})
+    client.post("/login", data={"username": username, "password": "pw"})
+    with app.app_context():
+        cur = appmod.get_db()[0].cursor()
+        cur.execute("SELECT id FROM users WHERE username = ?", (username,))
+        client.user_id = cur.fetchone()[0]
+        cur.close()
+    client.post("/calendar/create", data={"name": "Work"})
+    client.calendar_id = int(re.search(rb'/calendar/(\d+)"', client.get("/").data).group(1))
+    return client
@@ -0,0 +1,51 @@
+import app as appmod
+
+
+def add(client, name, due_date, recurrence="none"):
+    return client.post("/api/task/add", json={"task": name, "calendar_id": client.calendar_id, "due_date": due_date,
+                                              "recurrence": recurrence}).json["id"]
+
+
+def done_days(client, start, end):
+    response = client.get(f"/api/occurrences?calendar_id={client.calendar_id}&start={start}&end={end}")
+    return [(o["task_id"], o["date"]) for o in response.json["occurrences"] if o["done"]]
+
+
+def rows(db, statement, params):
+    conn, is_postgres = db
+    cur = conn.cursor()
+    cur.execute(statement, params)
+    result = [tuple(row) for row in cur.fetchall()]
+    conn.rollback(); cur.close()
+    return result
+
+
+def test_run_moves_old_tasks_and_completions(client, db):
+    finished = add(client, "filed taxes", "2020-01-05")
+    client.post(f"/api/task/toggle/{finished}", json={})
+    pending = add(client, "old but open", "2020-01-06")
+    daily = add(client, "stretch", "2020-01-01", "daily")
+    client.post(f"/api/task/toggle/{daily}", json={"date": "2020-03-01"})
+
+    assert appmod.archive_finished(force=True) is not None
+
+    assert rows(db, "SELECT id FROM tasks WHERE user_id = ? ORDER BY id", (client.user_id,)) == [(pending,), (daily,)]
+    assert rows(db, "SELECT archived_done FROM folders WHERE id = ?", (client.calendar_id,)) == [(1,)]
+    assert rows(db, "SELECT year FROM completion_bitmaps WHERE task_id = ?", (daily,)) == []
+    assert rows(db, "SELECT year FROM archived_completions WHERE task_id = ?", (daily,)) == [(2020,)]
+    archived = client.get(f"/api/archive?calendar_id={client.calendar_id}").json["tasks"]
+    assert [(task["id"], task["done"]) for task in archived] == [(finished, 1)]
+    # Old windows read the archive too.
+    assert done_days(client, "2020-01-01", "2020-03-03") == [(finished, "2020-01-05"), (daily, "2020-03-01")]
+
+
+def test_toggling_an_archived_year_takes_it_back(client, db):
+    daily = add(client, "stretch", "2020-01-01", "daily")
+    client.post(f"/api/task/toggle/{daily}", json={"date": "2020-03-01"})
+    appmod.archive_finished(force=True)
+
+    client.post(f"/api/task/toggle/{daily}", json={"date": "2020-03-02"})
+
+    assert rows(db, "SELECT year FROM completion_bitmaps WHERE task_id = ?", (daily,)) == [(2020,)]
+    assert rows(db, "SELECT year FROM archived_completions WHERE task_id = ?", (daily,)) == []
+    assert done_days(client, "2020-03-01", "2020-03-03") == [(daily, "2020-03-01"), (daily, "2020-03-02")]
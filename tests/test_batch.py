@@ -0,0 +1,47 @@
+from datetime import date
+
+
+def batch(client, *operations):
+    return client.post("/api/tasks/batch", json={"operations": list(operations)})
+
+
+def names(client):
+    response = client.get(f"/api/tasks?calendar_id={client.calendar_id}&date={date.today()}")
+    return sorted(task["task"] for task in response.json)
+
+
+def add(client, name):
+    return {"op": "add", "task": name, "calendar_id": client.calendar_id, "due_date": date.today().isoformat()}
+
+
+def edit(task_id, name, due_date=None):
+    # Edits replace every field.
+    return {"op": "edit", "id": task_id, "task": name, "due_date": due_date or date.today().isoformat()}
+
+
+def test_batch_applies_every_op(client):
+    response = batch(client, add(client, "a"), add(client, "b"))
+    assert response.status_code == 200
+    a, b = (result["task"]["id"] for result in response.json["results"])
+    response = batch(client, edit(a, "a2"), {"op": "toggle", "id": a}, {"op": "delete", "id": b})
+    assert response.status_code == 200
+    assert [result["op"] for result in response.json["results"]] == ["edit", "toggle", "delete"]
+    assert names(client) == ["a2"]
+
+
+def test_failed_op_rolls_back_the_batch(client):
+    task_id = batch(client, add(client, "kept")).json["results"][0]["task"]["id"]
+    response = batch(client, add(client, "new"), edit(task_id, "renamed"),
+                     {"op": "toggle", "id": 10 ** 9})
+    assert response.status_code == 404
+    assert response.json["index"] == 2
+    assert names(client) == ["kept"]
+
+
+def test_error_names_the_failing_op_of_a_run(client):
+    task_id = batch(client, add(client, "t")).json["results"][0]["task"]["id"]
+    response = batch(client, edit(task_id, "u"), edit(task_id, "v"), edit(task_id, "w", "tomorrow"))
+    assert response.status_code == 400
+    assert response.json == {"error": "Invalid date", "index": 2}
+    assert batch(client, {"op": "frobnicate"}).json["index"] == 0
+    assert names(client) == ["t"]
@@ -0,0 +1,37 @@
+from datetime import date
+
+import cache
+
+
+def version(db, user_id):
+    conn, is_postgres = db
+    cur = conn.cursor()
+    try:
+        return cache.data_version(cur, is_postgres, user_id)
+    finally:
+        conn.rollback(); cur.close()
+
+
+def test_etag_revalidates_until_a_write(client, db):
+    url = f"/api/tasks?calendar_id={client.calendar_id}&date={date.today()}"
+    first = client.get(url)
+    assert first.status_code == 200 and first.json == []
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "private, no-cache"
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    before = version(db, client.user_id)
+    client.post("/api/task/add", json={"task": "new", "calendar_id": client.calendar_id, "due_date": date.today().isoformat()})
+    assert version(db, client.user_id) == before + 1
+    after = client.get(url, headers={"If-None-Match": etag})
+    assert after.status_code == 200
+    assert after.headers["ETag"] != etag
+    assert [task["task"] for task in after.json] == ["new"]
+
+
+def test_etags_are_per_user(client, app):
+    other = app.test_client()
+    other.post("/register", data={"username": "etag-other", "password": "pw"})
+    other.post("/login", data={"username": "etag-other", "password": "pw"})
+    etag = client.get("/").headers["ETag"]
+    assert other.get("/", headers={"If-None-Match": etag}).status_code == 200
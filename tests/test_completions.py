@@ -0,0 +1,60 @@
+import base64
+import sqlite3
+from datetime import date
+
+import completions
+import migrations
+
+
+def toggle(client, task_id, day):
+    response = client.post(f"/api/task/toggle/{task_id}", json={"date": day})
+    assert response.status_code == 200
+    return response.json
+
+
+def done_days(client, start, end):
+    response = client.get(f"/api/occurrences?calendar_id={client.calendar_id}&start={start}&end={end}")
+    return [o["date"] for o in response.json["occurrences"] if o["done"]]
+
+
+def unpack(data, n):
+    bits = base64.b64decode(data)
+    return [i for i in range(n) if completions.test_bit(bits, i)]
+
+
+def test_toggles_across_a_year_boundary(client):
+    task_id = client.post("/api/task/add", json={"task": "daily", "calendar_id": client.calendar_id,
+                                                 "due_date": "2024-12-01", "recurrence": "daily"}).json["id"]
+    for day in ("2024-12-31", "2025-01-01", "2024-02-29"):
+        toggle(client, task_id, day)
+    assert done_days(client, "2024-12-30", "2025-01-03") == ["2024-12-31", "2025-01-01"]
+
+    response = client.get(f"/api/occurrences?calendar_id={client.calendar_id}&start=2024-12-30&end=2025-01-03"
+                          "&encoding=bitmap")
+    occurs, done = response.json["occurrences"][str(task_id)]
+    assert unpack(occurs, 4) == [0, 1, 2, 3]
+    assert unpack(done, 4) == [1, 2]
+
+    toggle(client, task_id, "2024-12-31")
+    assert done_days(client, "2024-12-30", "2025-01-03") == ["2025-01-01"]
+    assert done_days(client, "2024-12-01", "2025-01-01") == []
+
+
+def test_migration_folds_completion_rows_into_bitmaps(tmp_path, monkeypatch):
+    conn = sqlite3.connect(tmp_path / "old.db")
+    every = migrations.MIGRATIONS
+    monkeypatch.setattr(migrations, "MIGRATIONS", [m for m in every if m[0] < 6])
+    migrations.migrate(conn, False)
+    conn.executemany("INSERT INTO task_completions (task_id, completed_date) VALUES (?, ?)",
+                     [(1, "2024-12-31"), (1, "2025-01-01"), (1, "2024-01-01"), (2, "2025-03-04"), (2, "not a date")])
+    conn.commit()
+    monkeypatch.setattr(migrations, "MIGRATIONS", every)
+    migrations.migrate(conn, False)
+
+    cur = conn.cursor()
+    done = completions.load_tasks(cur, False, [1, 2])
+    assert list(done.dates(1)) == [date(2024, 1, 1), date(2024, 12, 31), date(2025, 1, 1)]
+    assert list(done.dates(2)) == [date(2025, 3, 4)]
+    cur.execute("SELECT name FROM sqlite_master WHERE name = 'task_completions'")
+    assert cur.fetchone() is None
+    conn.close()
@@ -0,0 +1,19 @@
+import app as appmod
+
+
+def test_metrics_are_local_only_without_a_token(app, monkeypatch):
+    client = app.test_client()
+    monkeypatch.setattr(appmod.instrumentation, "token", None)
+    assert client.get("/metrics").status_code == 200
+    assert client.get("/metrics", environ_overrides={"REMOTE_ADDR": "203.0.113.7"}).status_code == 403
+
+
+def test_metrics_token(app, monkeypatch):
+    client = app.test_client()
+    monkeypatch.setattr(appmod.instrumentation, "token", "s3cret")
+    remote = {"REMOTE_ADDR": "203.0.113.7"}
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", environ_overrides=remote, headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/metrics", environ_overrides=remote, headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200
+    assert b"http_request_duration_seconds" in response.data
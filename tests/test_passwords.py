@@ -0,0 +1,35 @@
+import os
+import signal
+import time
+
+import pytest
+
+import passwords
+
+
+def slow(seconds):
+    time.sleep(seconds)
+
+
+@pytest.fixture
+def pool():
+    pool = passwords.HashPool(rounds=4, workers=1, timeout=0.5)
+    pool.start()
+    yield pool
+    pool.shutdown()
+
+
+def test_timeout_is_busy(pool):
+    with pytest.raises(passwords.HashPoolBusy):
+        pool._run(slow, 2)
+
+
+def test_recovers_after_a_worker_dies(pool):
+    pid = pool._run(os.getpid)
+    os.kill(pid, signal.SIGKILL)
+    time.sleep(0.2)
+    try:
+        pw_hash = pool.hash("pw")
+    except passwords.HashPoolBusy:  # the dead pool noticed while submitting
+        pw_hash = pool.hash("pw")
+    assert pool.check(pw_hash, "pw")
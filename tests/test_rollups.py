@@ -0,0 +1,90 @@
+import random
+from datetime import date, timedelta
+
+import rollups
+
+today = date.today()
+
+
+def days_ago(n):
+    return (today - timedelta(days=n)).isoformat()
+
+
+def stats(conn):
+    cur = conn.cursor()
+    cur.execute("""SELECT user_id, folder_id, day, created, due, completed, overdue FROM daily_stats
+                   WHERE created + due + completed + overdue != 0 ORDER BY 1, 2, 3""")
+    rows = [tuple(row) for row in cur.fetchall()]
+    cur.close()
+    return rows
+
+
+def assert_matches_rebuild(db):
+    conn, is_postgres = db
+    incremental = stats(conn)
+    rollups.rebuild(conn, is_postgres)
+    assert incremental == stats(conn)
+
+
+def add(client, **task):
+    response = client.post("/api/task/add", json={"task": "t", "calendar_id": client.calendar_id, **task})
+    assert response.status_code == 200
+    return response.json["id"]
+
+
+def test_day_toggle_of_task_done_as_a_whole(client, db):
+    task_id = add(client, due_date=days_ago(5), recurrence="daily")
+    client.post(f"/api/task/toggle/{task_id}", json={})
+    client.post(f"/api/task/toggle/{task_id}", json={"date": days_ago(3)})
+    assert_matches_rebuild(db)
+
+
+def test_advance(client, db):
+    conn, is_postgres = db
+    task_id = add(client, due_date=days_ago(10), recurrence="daily")
+    add(client, due_date=days_ago(2))
+    client.post(f"/api/task/toggle/{task_id}", json={"date": days_ago(1)})
+    cur = conn.cursor()
+    cur.execute("UPDATE daily_stats_users SET through = ?", (days_ago(3),))
+    cur.execute("UPDATE daily_stats_users SET through = ? WHERE user_id = ?", (days_ago(1), client.user_id))
+    conn.commit(); cur.close()
+    rollups.rebuild(conn, is_postgres)
+    assert rollups.advance(conn, is_postgres, today, users_per_batch=2) > 1
+    assert rollups.advance(conn, is_postgres, today) == 0
+    assert_matches_rebuild(db)
+
+
+def test_random_writes_match_rebuild(client, db):
+    rng = random.Random(19)
+    ids = []
+    for _ in range(300):
+        op = rng.choice(["add", "add", "edit", "delete", "toggle", "toggle_day", "toggle_day"])
+        if op == "add" or not ids:
+            ids.append(add(client, due_date=days_ago(rng.randint(-5, 20)),
+                           recurrence=rng.choice(["none", "daily", "weekly"])))
+        elif op == "edit":
+            client.post(f"/api/task/edit/{rng.choice(ids)}",
+                        json={"task": "e", "due_date": days_ago(rng.randint(-5, 20)),
+                              "recurrence": rng.choice(["none", "daily", "weekly"])})
+        elif op == "delete":
+            task_id = ids.pop(rng.randrange(len(ids)))
+            client.post(f"/api/task/delete/{task_id}")
+        elif op == "toggle":
+            response = client.post(f"/api/task/toggle/{rng.choice(ids)}", json={})
+            if response.json.get("new_task"):
+                ids.append(response.json["new_task"]["id"])
+        else:
+            client.post(f"/api/task/toggle/{rng.choice(ids)}", json={"date": days_ago(rng.randint(-3, 20))})
+    assert_matches_rebuild(db)
+
+
+def test_api_stats(client):
+    task_id = add(client, due_date=days_ago(3), recurrence="daily")
+    for n in (2, 1):
+        client.post(f"/api/task/toggle/{task_id}", json={"date": days_ago(n)})
+    body = client.get("/api/stats").json
+    assert len(body["days"]) == 30
+    assert body["totals"]["completed"] == 2
+    assert body["streak"] == {"current": 2, "longest": 2}
+    assert client.get("/api/stats?start=x&end=y").status_code == 400
+    assert client.get("/api/stats?calendar_id=abc").status_code == 400
@@ -0,0 +1,43 @@
+import re
+
+
+def search(client, **params):
+    response = client.get("/api/search", query_string=params)
+    assert response.status_code == 200
+    return response.json
+
+
+def test_pages_through_tied_scores(client):
+    ids = [client.post("/api/task/add", json={"task": "water plants", "calendar_id": client.calendar_id}).json["id"]
+           for _ in range(7)]
+    seen, cursor = [], None
+    while True:
+        page = search(client, q="water", limit=3, **({"cursor": cursor} if cursor else {}))
+        assert len({row["score"] for row in page["results"]}) <= 1
+        seen += [row["id"] for row in page["results"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == sorted(ids)
+
+
+def test_pages_filter_and_stay_with_their_owner(client, app):
+    for name, due_date in [("Buy milk", "2026-01-05"), ("buy milkshake mix", "2026-02-05"),
+                           ("Café au lait", "2026-01-06"), ("Sell bike", "2026-01-07")]:
+        client.post("/api/task/add", json={"task": name, "calendar_id": client.calendar_id, "due_date": due_date})
+    other = app.test_client()
+    other.post("/register", data={"username": "search-other", "password": "pw"})
+    other.post("/login", data={"username": "search-other", "password": "pw"})
+    other.post("/calendar/create", data={"name": "Home"})
+    other_calendar = int(re.search(rb'/calendar/(\d+)"', other.get("/").data).group(1))
+    other.post("/api/task/add", json={"task": "Milk the cow", "calendar_id": other_calendar, "due_date": "2026-01-05"})
+
+    first = search(client, q="mil", limit=1)
+    second = search(client, q="mil", limit=1, cursor=first["next_cursor"])
+    assert second["next_cursor"] is None
+    assert sorted(row["task"] for row in first["results"] + second["results"]) == ["Buy milk", "buy milkshake mix"]
+    assert [row["task"] for row in search(client, q="BUY MI", end="2026-02-01")["results"]] == ["Buy milk"]
+    assert [row["task"] for row in search(client, q="cafe")["results"]] == ["Café au lait"]
+    assert search(client, q="mil", calendar_id=client.calendar_id + 10 ** 6)["results"] == []
+    assert [row["task"] for row in search(other, q="mil")["results"]] == ["Milk the cow"]
+    assert client.get("/api/search?q=mil&cursor=garbled").status_code == 400
@@ -0,0 +1,27 @@
+from datetime import date, timedelta
+
+
+def test_add_and_edit_reject_malformed_due_dates(client):
+    response = client.post("/api/task/add", json={"task": "t", "calendar_id": client.calendar_id, "due_date": "2026-10-5"})
+    assert response.status_code == 400
+    assert response.json["error"] == "Invalid date"
+    task_id = client.post("/api/task/add", json={"task": "t", "calendar_id": client.calendar_id,
+                                                 "due_date": date.today().isoformat()}).json["id"]
+    assert client.post(f"/api/task/edit/{task_id}", json={"task": "t", "due_date": "soon"}).status_code == 400
+    response = client.post("/api/tasks/batch", json={"operations": [
+        {"op": "edit", "id": task_id, "task": "t", "due_date": "2026-13-01"}]})
+    assert response.status_code == 400 and response.json["index"] == 0
+
+
+def test_calendar_survives_a_malformed_stored_due_date(client, db):
+    conn, is_postgres = db
+    cur = conn.cursor()
+    cur.execute("INSERT INTO tasks (task, user_id, folder_id, due_date, recurrence) VALUES ('bad', ?, ?, '2026-10-5', 'daily')",
+                (client.user_id, client.calendar_id))
+    conn.commit(); cur.close()
+    start = date.today().replace(day=1)
+    end = start + timedelta(days=42)
+    assert client.get(f"/calendar/{client.calendar_id}").status_code == 200
+    for encoding in ("list", "bitmap"):
+        response = client.get(f"/api/occurrences?calendar_id={client.calendar_id}&start={start}&end={end}&encoding={encoding}")
+        assert response.status_code == 200
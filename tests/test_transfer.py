@@ -0,0 +1,63 @@
+import csv
+import io
+import re
+from datetime import date, timedelta
+
+today = date.today()
+
+
+def import_csv(client, text, calendar_id=None):
+    return client.post(f"/api/calendar/{calendar_id or client.calendar_id}/import?format=csv",
+                       data=text.encode(), content_type="text/csv")
+
+
+def export_csv(client, calendar_id=None):
+    response = client.get(f"/api/calendar/{calendar_id or client.calendar_id}/export?format=csv")
+    assert response.status_code == 200
+    return list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+
+
+def test_csv_round_trip_skips_bad_rows(client):
+    yesterday, last_week = (today - timedelta(days=1)).isoformat(), (today - timedelta(days=7)).isoformat()
+    text = ("task,due_date,due_time,due_time_end,recurrence,done,completed_dates\n"
+            f"Daily run,{last_week},07:00,08:00,daily,0,{yesterday}\n"
+            f"Pay rent,{today.isoformat()},,,none,1,\n"
+            f",{today.isoformat()},,,none,0,\n"               # no name
+            "Bad date,2026-02-30,,,none,0,\n"
+            f"Weekly,{last_week},,,FREQ=WEEKLY;INTERVAL=2,0,\n")  # no matching recurrence
+    stats = import_csv(client, text).json
+    assert stats["imported"] == 3 and stats["skipped"] == 2 and stats["downgraded"] == 1
+    assert [e["at"] for e in stats["errors"]] == [4, 5]
+    rows = {row["task"]: row for row in export_csv(client)}
+    assert rows["Daily run"]["recurrence"] == "daily"
+    assert rows["Daily run"]["completed_dates"] == yesterday
+    assert rows["Daily run"]["due_time_end"] == "08:00"
+    assert rows["Pay rent"]["done"] == "1"
+    assert rows["Weekly"]["recurrence"] == "none"
+    # Re-importing the export into a second calendar gives the same tasks.
+    client.post("/calendar/create", data={"name": "Copy"})
+    copy_id = max(int(i) for i in re.findall(rb'/calendar/(\d+)"', client.get("/").data))
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=list(rows["Pay rent"]))
+    writer.writeheader(); writer.writerows(rows.values())
+    assert import_csv(client, out.getvalue(), copy_id).json["imported"] == 3
+    assert sorted(export_csv(client, copy_id), key=lambda r: r["task"]) == sorted(rows.values(), key=lambda r: r["task"])
+
+
+def test_ics_import(client):
+    text = "\r\n".join(["BEGIN:VCALENDAR", "BEGIN:VEVENT", "SUMMARY:Standup", "DTSTART:20261005T090000",
+                        "DTEND:20261005T091500", "RRULE:FREQ=WEEKLY", "END:VEVENT", "BEGIN:VTODO",
+                        "SUMMARY:Broken", "DTSTART:2026-10-05", "END:VTODO", "END:VCALENDAR"])
+    stats = client.post(f"/api/calendar/{client.calendar_id}/import?format=ics", data=text.encode()).json
+    assert stats["imported"] == 1 and stats["skipped"] == 1
+    (row,) = export_csv(client)
+    assert (row["task"], row["due_date"], row["due_time"], row["due_time_end"], row["recurrence"]) == \
+        ("Standup", "2026-10-05", "09:00", "09:15", "weekly")
+
+
+def test_unreadable_csv_is_reported_not_a_500(client):
+    text = "task,due_date\nfirst,\n" + '"' + "x" * (csv.field_size_limit() + 1) + '",\nlast,\n'
+    response = import_csv(client, text)
+    assert response.status_code == 200
+    assert response.json["imported"] == 1
+    assert "unreadable CSV" in response.json["errors"][0]["error"]
@@ -0,0 +1,360 @@
+"""Streaming import and export of calendar tasks as CSV or iCalendar.
+
+Parsers yield one task dict at a time and writers yield text chunks, so
+files of any size go through in constant memory. Rows are inserted in
+chunks: COPY on Postgres, executemany on SQLite.
+"""
+import csv
+import io
+import re
+from datetime import date, datetime, timezone
+from itertools import islice
+
+import psycopg2.extras
+
+import completions
+
+CSV_FIELDS = ["task", "due_date", "due_time", "due_time_end", "recurrence", "done", "completed_dates"]
+CHUNK_SIZE = 1000
+
+ICS_DAYS = ["SU", "MO", "TU", "WE", "TH", "FR", "SA"]  # index = JS day of week
+RECURRENCE_RE = re.compile(r"^(none|daily|weekly|monthly|monthly_weekday_([1-5]|last)_[0-6])$")
+TIME_RE = re.compile(r"^\d{2}:\d{2}$")
+
+
+class ImportStats:
+    def __init__(self):
+        self.imported = 0
+        self.downgraded = 0  # RRULEs with no matching recurrence, imported as one-offs
+        self.errors = []     # (line/record number, message), first 20 only
+        self.skipped = 0
+
+    def error(self, where, message):
+        self.skipped += 1
+        if len(self.errors) < 20:
+            self.errors.append((where, message))
+
+    def as_dict(self):
+        return {"imported": self.imported, "skipped": self.skipped, "downgraded": self.downgraded,
+                "errors": [{"at": where, "error": message} for where, message in self.errors]}
+
+
+# --- recurrence <-> RRULE --------------------------------------------------
+
+def rrule_to_recurrence(rrule, start):
+    """Map an RRULE value onto a tasks.recurrence encoding, or None.
+
+    COUNT and UNTIL are ignored since tasks repeat indefinitely.
+    """
+    parts = dict(p.split("=", 1) for p in rrule.upper().split(";") if "=" in p)
+    freq = parts.get("FREQ")
+    if parts.get("INTERVAL", "1") != "1":
+        return None
+    byday = parts.get("BYDAY", "")
+    if freq == "DAILY" and not byday:
+        return "daily"
+    if freq == "WEEKLY":
+        if not byday or (start and byday == ICS_DAYS[(start.weekday() + 1) % 7]):
+            return "weekly"
+        return None
+    if freq == "MONTHLY":
+        if not byday:
+            bymonthday = parts.get("BYMONTHDAY")
+            if bymonthday is None or (start and bymonthday == str(start.day)):
+                return "monthly"
+            return None
+        m = re.fullmatch(r"([+-]?\d)?(SU|MO|TU|WE|TH|FR|SA)", byday)
+        if not m:
+            return None
+        occ = m.group(1) or parts.get("BYSETPOS")
+        if occ == "-1":
+            occ = "last"
+        elif occ not in ("1", "2", "3", "4", "5", "+1", "+2", "+3", "+4", "+5"):
+            return None
+        return f"monthly_weekday_{occ.lstrip('+')}_{ICS_DAYS.index(m.group(2))}"
+    return None
+
+def recurrence_to_rrule(recurrence):
+    if recurrence == "daily":
+        return "FREQ=DAILY"
+    if recurrence == "weekly":
+        return "FREQ=WEEKLY"
+    if recurrence == "monthly":
+        return "FREQ=MONTHLY"
+    if recurrence and recurrence.startswith("monthly_weekday_"):
+        _, _, occ, dow = recurrence.split("_")
+        return f"FREQ=MONTHLY;BYDAY={'-1' if occ == 'last' else occ}{ICS_DAYS[int(dow)]}"
+    return None
+
+
+# --- parsing ---------------------------------------------------------------
+
+def clean_task(row):
+    """Validate and normalise a parsed row; raises ValueError."""
+    name = (row.get("task") or "").strip()
+    if not name:
+        raise ValueError("task is required")
+    due_date = (row.get("due_date") or "").strip() or None
+    if due_date:
+        date.fromisoformat(due_date)
+    due_time = (row.get("due_time") or "").strip()
+    due_time_end = (row.get("due_time_end") or "").strip()
+    for t in (due_time, due_time_end):
+        if t and not TIME_RE.match(t):
+            raise ValueError(f"bad time {t!r}")
+    recurrence = (row.get("recurrence") or "none").strip()
+    if not RECURRENCE_RE.match(recurrence):
+        raise ValueError(f"bad recurrence {recurrence!r}")
+    completed = [d for d in (row.get("completed_dates") or "").split(";") if d]
+    for d in completed:
+        date.fromisoformat(d)
+    done = 1 if str(row.get("done") or "0").strip() in ("1", "true", "True", "yes") else 0
+    return {"task": name, "due_date": due_date, "due_time": due_time, "due_time_end": due_time_end,
+            "recurrence": recurrence, "done": done, "completed_dates": completed}
+
+def parse_csv(stream, stats):
+    """Yield tasks from CSV text with a header row using CSV_FIELDS names.
+
+    The recurrence column may also hold an RRULE (e.g. FREQ=WEEKLY).
+    """
+    reader = csv.DictReader(stream)
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            # e.g. a field over csv.field_size_limit(); the rest of the file
+            # cannot be read reliably, so the import stops here.
+            stats.error(reader.line_num, f"unreadable CSV: {e}")
+            return
+        rec = (row.get("recurrence") or "").strip()
+        if rec.upper().startswith("FREQ="):
+            try:
+                start = date.fromisoformat((row.get("due_date") or "").strip())
+            except ValueError:
+                start = None
+            row["recurrence"] = rrule_to_recurrence(rec, start)
+            if row["recurrence"] is None:
+                stats.downgraded += 1
+                row["recurrence"] = "none"
+        try:
+            yield clean_task(row)
+        except ValueError as e:
+            stats.error(reader.line_num, str(e))
+
+def unfold(stream):
+    line = None
+    for raw in stream:
+        raw = raw.rstrip("\r\n")
+        if raw[:1] in (" ", "\t") and line is not None:
+            line += raw[1:]
+            continue
+        if line is not None:
+            yield line
+        line = raw
+    if line:
+        yield line
+
+def unescape(text):
+    return re.sub(r"\\([\\;,nN])", lambda m: "\n" if m.group(1) in "nN" else m.group(1), text)
+
+def parse_ics_datetime(value):
+    """'20240105' or '20240105T093000[Z]' -> (date, 'HH:MM' or '')."""
+    d = datetime.strptime(value[:8], "%Y%m%d").date()
+    if "T" in value:
+        return d, f"{value[9:11]}:{value[11:13]}"
+    return d, ""
+
+def parse_ics(stream, stats):
+    """Yield tasks from the VEVENTs and VTODOs of an iCalendar stream.
+
+    Times are taken as wall-clock values; TZID parameters are not converted.
+    """
+    props = None
+    number = 0
+    nested = 0  # depth of sub-components such as VALARM
+    for line in unfold(stream):
+        if line in ("BEGIN:VEVENT", "BEGIN:VTODO"):
+            props = {}
+            number += 1
+            continue
+        if props is not None and line.startswith("BEGIN:"):
+            nested += 1
+            continue
+        if nested and line.startswith("END:"):
+            nested -= 1
+            continue
+        if line in ("END:VEVENT", "END:VTODO"):
+            if props is not None:
+                try:
+                    yield ics_task(props, stats)
+                except ValueError as e:
+                    stats.error(number, str(e))
+            props = None
+            continue
+        if props is None or nested or ":" not in line:
+            continue
+        name, value = line.split(":", 1)
+        props.setdefault(name.split(";", 1)[0].upper(), value)
+
+def ics_task(props, stats):
+    start = props.get("DTSTART") or props.get("DUE")
+    row = {"task": unescape(props.get("SUMMARY", ""))}
+    if start:
+        start_date, row["due_time"] = parse_ics_datetime(start)
+        row["due_date"] = start_date.isoformat()
+        end = props.get("DTEND") or (props.get("DUE") if props.get("DTSTART") else None)
+        if end and row["due_time"]:
+            end_date, end_time = parse_ics_datetime(end)
+            if end_date == start_date:
+                row["due_time_end"] = end_time
+        if "RRULE" in props:
+            row["recurrence"] = rrule_to_recurrence(props["RRULE"], start_date)
+            if row["recurrence"] is None:
+                stats.downgraded += 1
+                row["recurrence"] = "none"
+    row["done"] = 1 if props.get("STATUS", "").upper() == "COMPLETED" or "COMPLETED" in props else 0
+    return clean_task(row)
+
+
+# --- bulk insert -----------------------------------------------------------
+
+def copy_escape(value):
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+def insert_chunk(cur, is_postgres, user_id, folder_id, chunk):
+    plain = [t for t in chunk if not t["completed_dates"]]
+    values = [(t["task"], user_id, folder_id, t["due_date"], t["due_time"], t["due_time_end"], t["recurrence"], t["done"])
+              for t in plain]
+    columns = "task, user_id, folder_id, due_date, due_time, due_time_end, recurrence, done"
+    if values and is_postgres:
+        buf = io.StringIO("".join("\t".join(copy_escape(v) for v in row) + "\n" for row in values))
+        cur.copy_expert(f"COPY tasks ({columns}) FROM STDIN", buf)
+    elif values:
+        cur.executemany(f"INSERT INTO tasks ({columns}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", values)
+    # Tasks with completion history need their id back.
+    done_dates = []
+    for t in chunk:
+        if not t["completed_dates"]:
+            continue
+        row = (t["task"], user_id, folder_id, t["due_date"], t["due_time"], t["due_time_end"], t["recurrence"], t["done"])
+        if is_postgres:
+            cur.execute(f"INSERT INTO tasks ({columns}) VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING id", row)
+            task_id = cur.fetchone()[0]
+        else:
+            cur.execute(f"INSERT INTO tasks ({columns}) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+            task_id = cur.lastrowid
+        done_dates.extend((task_id, d) for d in t["completed_dates"])
+    completions.add_dates(cur, is_postgres, done_dates)
+
+def import_tasks(conn, is_postgres, user_id, folder_id, tasks, stats, chunk_size=CHUNK_SIZE):
+    """Insert ``tasks`` in chunks, committing after each one."""
+    cur = conn.cursor()
+    try:
+        while True:
+            chunk = list(islice(tasks, chunk_size))
+            if not chunk:
+                break
+            insert_chunk(cur, is_postgres, user_id, folder_id, chunk)
+            conn.commit()
+            stats.imported += len(chunk)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    return stats
+
+
+# --- export ----------------------------------------------------------------
+
+def iter_tasks(conn, is_postgres, user_id, folder_id, chunk_size=CHUNK_SIZE):
+    """Yield the folder's live, then archived, tasks as dicts with their
+    completions (';'-joined ISO dates, archived years included), via
+    server-side cursors on Postgres."""
+    for table in ("tasks", "archived_tasks"):
+        yield from iter_table(conn, is_postgres, table, user_id, folder_id, chunk_size)
+
+def iter_table(conn, is_postgres, table, user_id, folder_id, chunk_size):
+    if is_postgres:
+        cur = conn.cursor(name=f"export_{table}", cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.itersize = chunk_size
+        cur.execute(f"SELECT * FROM {table} WHERE folder_id = %s AND user_id = %s ORDER BY id", (folder_id, user_id))
+    else:
+        cur = conn.cursor()
+        cur.execute(f"SELECT * FROM {table} WHERE folder_id = ? AND user_id = ? ORDER BY id", (folder_id, user_id))
+    lookup = conn.cursor()
+    try:
+        while True:
+            rows = [dict(row) for row in cur.fetchmany(chunk_size)]
+            if not rows:
+                break
+            recurring = [row["id"] for row in rows if row["recurrence"] and row["recurrence"] != "none"]
+            done = completions.load_tasks(lookup, is_postgres, recurring, archived=True)
+            for row in rows:
+                row["completed_dates"] = ";".join(d.isoformat() for d in done.dates(row["id"]))
+                yield row
+    finally:
+        lookup.close()
+        cur.close()
+
+def export_csv(rows, batch=500):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(CSV_FIELDS)
+    for n, row in enumerate(rows, 1):
+        writer.writerow([row["task"], row["due_date"] or "", row["due_time"] or "", row["due_time_end"] or "",
+                         row["recurrence"] or "none", 1 if row["done"] else 0, row["completed_dates"] or ""])
+        if n % batch == 0:
+            yield buf.getvalue()
+            buf.seek(0); buf.truncate()
+    yield buf.getvalue()
+
+def escape(text):
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+def fold(line):
+    # RFC 5545: lines longer than 75 octets continue on a line starting with a space.
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return line + "\r\n"
+    out, limit = [], 75
+    while data:
+        cut = min(limit, len(data))
+        while cut < len(data) and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        out.append(data[:cut].decode("utf-8"))
+        data = data[cut:]
+        limit = 74
+    return "\r\n ".join(out) + "\r\n"
+
+def export_ics(rows, calendar_name, batch=500):
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    head = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//todo-app//calendar export//EN",
+            f"X-WR-CALNAME:{escape(calendar_name)}"]
+    chunk = [fold(line) for line in head]
+    for n, row in enumerate(rows, 1):
+        lines = ["BEGIN:VTODO", f"UID:task-{row['id']}@todo-app", f"DTSTAMP:{stamp}", f"SUMMARY:{escape(row['task'])}"]
+        if row["due_date"]:
+            day = row["due_date"].replace("-", "")
+            if row["due_time"]:
+                lines.append(f"DTSTART:{day}T{row['due_time'].replace(':', '')}00")
+                if row["due_time_end"]:
+                    lines.append(f"DUE:{day}T{row['due_time_end'].replace(':', '')}00")
+            else:
+                lines.append(f"DTSTART;VALUE=DATE:{day}")
+            rrule = recurrence_to_rrule(row["recurrence"])
+            if rrule:
+                lines.append(f"RRULE:{rrule}")
+        if row["done"]:
+            lines.append("STATUS:COMPLETED")
+        lines.append("END:VTODO")
+        chunk.extend(fold(line) for line in lines)
+        if n % batch == 0:
+            yield "".join(chunk)
+            chunk = []
+    chunk.append(fold("END:VCALENDAR"))
+    yield "".join(chunk)